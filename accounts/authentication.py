@@ -0,0 +1,46 @@
+"""
+Database-free JWT authentication for hot read-only endpoints.
+
+Access tokens carry a snapshot of the user's ``employee_id`` and home
+location next to the role claims (see ``accounts.roles``). Views that only
+need those fields use ``ClaimsJWTAuthentication``, which builds a
+``ClaimsUser`` from the token instead of loading the ``User`` row. The
+snapshot is refreshed whenever the token is, so it is at most
+``ACCESS_TOKEN_LIFETIME`` old. Tokens issued without the snapshot fall back
+to the normal database lookup.
+"""
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+
+SNAPSHOT_CLAIMS = ('employee_id', 'latitude', 'longitude')
+
+
+def snapshot_claims(user):
+    return {name: getattr(user, name) for name in SNAPSHOT_CLAIMS}
+
+
+class ClaimsUser(TokenUser):
+    """Token-backed user exposing the role and snapshot claims as attributes."""
+
+    @property
+    def employee_id(self):
+        return self.token.get('employee_id')
+
+    @property
+    def role(self):
+        return self.token.get('role')
+
+    @property
+    def latitude(self):
+        return self.token.get('latitude')
+
+    @property
+    def longitude(self):
+        return self.token.get('longitude')
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        if not all(name in validated_token for name in SNAPSHOT_CLAIMS):
+            return super().get_user(validated_token)
+        return ClaimsUser(validated_token)
@@ -3,7 +3,7 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinLengthValidator
 from django.utils import timezone
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_save
 from django.dispatch import receiver
 
 
@@ -78,4 +78,20 @@ class User(AbstractUser):
 @receiver(post_save, sender=User)
 def ensure_privacy_consent(sender, instance, created, **kwargs):
     if created:
-        PrivacyConsent.objects.get_or_create(user=instance)
\ No newline at end of file
+        PrivacyConsent.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=User)
+def drop_cached_claims(sender, instance, **kwargs):
+    from .roles import invalidate_claims
+    invalidate_claims(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def drop_cached_claims_on_groups(sender, instance, action, reverse, pk_set, **kwargs):
+    from .roles import invalidate_claims
+    if reverse and action == 'pre_clear':
+        # group.user_set.clear() does not report which users were affected
+        invalidate_claims(*instance.user_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_claims(*(pk_set or ()) if reverse else (instance.pk,))
@@ -1,8 +1,9 @@
 from rest_framework.permissions import BasePermission
 
+from .roles import is_hr_or_master, request_claims
+
+
 class IsHRorMaster(BasePermission):
+    """HR/master check from token claims, falling back to the cached role lookup."""
     def has_permission(self, request, view):
-        u = request.user
-        if not u or not u.is_authenticated:
-            return False
-        return u.is_superuser or u.groups.filter(name__in=['hr_admin', 'master_admin']).exists()
\ No newline at end of file
+        return is_hr_or_master(request_claims(request))
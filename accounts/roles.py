@@ -0,0 +1,89 @@
+"""
+Role resolution shared by ``IsHRorMaster`` and the HR function views.
+
+A user is HR/master if they are a superuser, have the HR_Admin or
+Master_Admin role, or belong to the ``hr_admin``/``master_admin`` group.
+These facts are resolved once at login and embedded as claims in the access
+token (see ``RoleTokenObtainPairSerializer``). JWT requests are then
+authorised without touching the database.
+
+Requests without those claims fall back to a per-user cache entry. That
+covers session auth and tokens issued before the claims existed. The entry
+lives ``ROLE_CACHE_TTL`` seconds and is dropped when the user's role or
+groups change.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+ADMIN_ROLES = frozenset({'HR_ADMIN', 'MASTER_ADMIN'})
+ADMIN_GROUPS = ('hr_admin', 'master_admin')
+CLAIMS = ('role', 'groups', 'is_superuser')
+DEFAULT_TTL = 60
+
+
+def resolve_claims(user):
+    """Role claims for ``user`` from the database (one query for the groups)."""
+    return {
+        'role': str(user.role).upper() if getattr(user, 'role', None) else 'GUEST',
+        'groups': sorted(user.groups.filter(name__in=ADMIN_GROUPS).values_list('name', flat=True)),
+        'is_superuser': bool(user.is_superuser),
+    }
+
+
+def _cache_key(user_id):
+    return f'accounts:claims:{user_id}'
+
+
+def cached_claims(user):
+    key = _cache_key(user.pk)
+    claims = cache.get(key)
+    if claims is None:
+        claims = resolve_claims(user)
+        cache.set(key, claims, getattr(settings, 'ROLE_CACHE_TTL', DEFAULT_TTL))
+    return claims
+
+
+def invalidate_claims(*user_ids):
+    cache.delete_many([_cache_key(pk) for pk in user_ids])
+
+
+def token_claims(token):
+    """Claims embedded in a validated token, or ``None`` if it predates them."""
+    if token is None or not all(name in token for name in CLAIMS):
+        return None
+    return {name: token[name] for name in CLAIMS}
+
+
+def request_claims(request):
+    """Claims for the request's user: from the token when present, else the cache."""
+    user = getattr(request, 'user', None)
+    if not user or not user.is_authenticated:
+        return None
+    return token_claims(getattr(request, 'auth', None)) or cached_claims(user)
+
+
+def is_hr_or_master(claims):
+    return bool(claims) and (
+        claims['is_superuser']
+        or claims['role'] in ADMIN_ROLES
+        or any(group in ADMIN_GROUPS for group in claims['groups'])
+    )
+
+
+def authenticate_jwt(request):
+    """Authenticate a plain Django request from its bearer token, as DRF views do.
+
+    Sets ``request.user``/``request.auth`` on success; leaves a session user
+    untouched and ignores invalid tokens (the caller answers 401).
+    """
+    if getattr(request, 'user', None) is not None and request.user.is_authenticated:
+        return
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except (InvalidToken, AuthenticationFailed):
+        return
+    if result is not None:
+        request.user, request.auth = result
@@ -1,6 +1,12 @@
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
 from django.utils import timezone
 from .models import User, PrivacyConsent
+from .authentication import snapshot_claims
+from .roles import resolve_claims
 
 
 class UserCreateSerializer(serializers.ModelSerializer):
@@ -99,4 +105,35 @@ class PrivacyConsentSerializer(serializers.ModelSerializer):
             instance.accepted_at = None
 
         instance.save()
-        return instance
\ No newline at end of file
+        return instance
+
+
+def _user_claims(user):
+    return {**resolve_claims(user), **snapshot_claims(user)}
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Token pair carrying the user's role claims and location snapshot."""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        for name, value in _user_claims(user).items():
+            token[name] = value
+        return token
+
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    """Re-resolve claims on refresh so role, group and location changes reach the next access token."""
+
+    def validate(self, attrs):
+        user_id = self.token_class(attrs["refresh"]).payload.get(api_settings.USER_ID_CLAIM)
+        user = User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first() if user_id else None
+        if user is None:
+            raise InvalidToken("Token user no longer exists")
+        data = super().validate(attrs)
+        access = AccessToken(data["access"])
+        for name, value in _user_claims(user).items():
+            access[name] = value
+        data["access"] = str(access)
+        return data
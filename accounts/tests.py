@@ -1,3 +1,92 @@
+from django.contrib.auth.models import Group
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from .authentication import ClaimsJWTAuthentication, ClaimsUser
+from .models import User
+from .roles import _cache_key, cached_claims, is_hr_or_master, token_claims
+from .serializers import RoleTokenObtainPairSerializer, RoleTokenRefreshSerializer
+
+
+class RoleClaimsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.hr = User.objects.create_user(username='hr', password='x' * 10, employee_id='00001', role='HR_Admin')
+        self.emp = User.objects.create_user(
+            username='emp', password='x' * 10, employee_id='00002', role='Empleado',
+            latitude=25.7, longitude=-100.3,
+        )
+
+    def access_for(self, user):
+        return RoleTokenObtainPairSerializer.get_token(user).access_token
+
+    def bearer(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access_for(user)}')
+        return client
+
+    def test_tokens_carry_role_and_snapshot_claims(self):
+        access = self.access_for(self.emp)
+        self.assertEqual(token_claims(access), {'role': 'EMPLEADO', 'groups': [], 'is_superuser': False})
+        self.assertEqual((access['employee_id'], access['latitude'], access['longitude']), ('00002', 25.7, -100.3))
+        self.assertTrue(is_hr_or_master(token_claims(self.access_for(self.hr))))
+        self.assertFalse(is_hr_or_master(token_claims(access)))
+
+    def test_admin_group_grants_access(self):
+        self.emp.groups.add(Group.objects.create(name='hr_admin'))
+        self.assertEqual(token_claims(self.access_for(self.emp))['groups'], ['hr_admin'])
+        self.assertEqual(self.bearer(self.emp).get(reverse('jobs-list')).status_code, 200)
+
+    def test_permission_is_decided_from_token_claims(self):
+        self.assertEqual(self.bearer(self.emp).get(reverse('jobs-list')).status_code, 403)
+        self.assertEqual(self.bearer(self.hr).get(reverse('jobs-list')).status_code, 200)
+
+    def test_refresh_reresolves_claims(self):
+        refresh = RoleTokenObtainPairSerializer.get_token(self.emp)
+        User.objects.filter(pk=self.emp.pk).update(role='Master_Admin', latitude=25.8)
+        serializer = RoleTokenRefreshSerializer(data={'refresh': str(refresh)})
+        self.assertTrue(serializer.is_valid())
+        access = AccessToken(serializer.validated_data['access'])
+        self.assertEqual(access['role'], 'MASTER_ADMIN')
+        self.assertEqual(access['latitude'], 25.8)
+
+    def test_refresh_for_deleted_user_is_rejected(self):
+        refresh = RoleTokenObtainPairSerializer.get_token(self.emp)
+        self.emp.delete()
+        response = APIClient().post(reverse('token_refresh'), {'refresh': str(refresh)}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_cached_claims_dropped_on_role_and_group_changes(self):
+        cached_claims(self.emp)
+        self.emp.role = 'HR_Admin'
+        self.emp.save()
+        self.assertIsNone(cache.get(_cache_key(self.emp.pk)))
+        self.assertEqual(cached_claims(self.emp)['role'], 'HR_ADMIN')
+        group = Group.objects.create(name='master_admin')
+        group.user_set.add(self.emp)
+        self.assertIsNone(cache.get(_cache_key(self.emp.pk)))
+        cached_claims(self.emp)
+        group.user_set.clear()
+        self.assertIsNone(cache.get(_cache_key(self.emp.pk)))
+
+
+class ClaimsAuthenticationTests(TestCase):
+    def test_claims_user_built_without_queries(self):
+        user = User.objects.create_user(
+            username='emp', password='x' * 10, employee_id='00002', latitude=25.7, longitude=-100.3,
+        )
+        access = RoleTokenObtainPairSerializer.get_token(user).access_token
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {access}')
+        with self.assertNumQueries(0):
+            authed, _ = ClaimsJWTAuthentication().authenticate(request)
+        self.assertIsInstance(authed, ClaimsUser)
+        self.assertEqual((authed.pk, authed.employee_id, authed.latitude), (str(user.pk), '00002', 25.7))
+
+    def test_tokens_without_snapshot_fall_back_to_database(self):
+        user = User.objects.create_user(username='old', password='x' * 10, employee_id='00003')
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        authed, _ = ClaimsJWTAuthentication().authenticate(request)
+        self.assertIsInstance(authed, User)
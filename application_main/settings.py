@@ -169,4 +169,35 @@ REST_FRAMEWORK = {
 SIMPLE_JWT = {
   'ACCESS_TOKEN_LIFETIME': timedelta(minutes=1),
   'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+  # Embed role/group claims so permission checks need no database query
+  'TOKEN_OBTAIN_SERIALIZER': 'accounts.serializers.RoleTokenObtainPairSerializer',
+  'TOKEN_REFRESH_SERIALIZER': 'accounts.serializers.RoleTokenRefreshSerializer',
 }
+
+# Seconds a user's resolved role claims are cached for session-authenticated requests
+ROLE_CACHE_TTL = 60
+
+# Also write RouteTrackPoint/CoverageMeshPoint rows on upload; geometry is
+# stored and read as packed blobs on Route/CoverageMesh (backend_api.packing)
+STORE_GEOMETRY_ROWS = os.environ.get('STORE_GEOMETRY_ROWS', 'False').lower() in ('1', 'true', 'yes')
+
+# Cache shared by every web process and pool worker, so cache version bumps
+# and claim invalidations are seen everywhere. Redis when REDIS_URL is set,
+# otherwise the database table created by backend_api migration 0007.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'backend_api_cache',
+        }
+    }
+
+# Seconds each process reuses a cache version token before re-reading it
+CACHE_VERSION_MEMO_SECONDS = 1.0
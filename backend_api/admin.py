@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import BusStop, CoverageMesh, CoverageMeshPoint, RoutePlan, Route, RouteStopPoint, RouteTrackPoint
+from .models import BusStop, CoverageMesh, CoverageMeshPoint, Job, RoutePlan, Route, RouteStopPoint, RouteTrackPoint
 
 admin.site.register(BusStop)
 admin.site.register(CoverageMesh)
@@ -7,4 +7,5 @@ admin.site.register(CoverageMeshPoint)
 admin.site.register(RoutePlan)
 admin.site.register(Route)
 admin.site.register(RouteStopPoint)
-admin.site.register(RouteTrackPoint)
\ No newline at end of file
+admin.site.register(RouteTrackPoint)
+admin.site.register(Job)
\ No newline at end of file
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class BackendApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'backend_api'
+
+    def ready(self):
+        from django.core.signals import request_started
+        from . import checks  # noqa: F401
+        from .jobs import fail_orphaned_jobs_on_first_request
+        request_started.connect(fail_orphaned_jobs_on_first_request)
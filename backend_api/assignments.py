@@ -0,0 +1,172 @@
+"""
+Materialized employee -> nearest stop assignments.
+
+``StopAssignment`` keeps every located, active employee's nearest active stop
+so ``NearestStopView`` is a single primary-key lookup. Rows are refreshed:
+
+* for everyone by ``recompute_assignments()``: the
+  ``recompute_stop_assignments`` command, and a ``recompute_assignments`` job
+  queued by bulk stop uploads;
+* per employee by ``refresh_for_users()`` when a location changes, and by
+  ``assign_unassigned()`` after employee imports and activations;
+* by ``refresh_for_stops()`` when single stops change. Only the employees
+  assigned to those stops, or now closer to one of them, are recomputed.
+
+Each row records the location it was computed for, so a row whose user has
+moved through some other path is detected as stale and recomputed on read.
+"""
+import numpy as np
+from django.db import transaction
+from django.db.models import Max, Q
+
+from accounts.models import User
+from .geo import EARTH_RADIUS_M, distance_matrix
+from .importers import BATCH_SIZE
+from .ingest import batched
+from .models import BusStop, StopAssignment
+from .spatial import get_stop_index, invalidate_stop_index
+
+_UPDATE_FIELDS = ['stop', 'distance_m', 'latitude', 'longitude', 'computed_at']
+
+
+def _located_users():
+    return User.objects.filter(is_active=True, latitude__isnull=False, longitude__isnull=False)
+
+
+def _assign(rows):
+    """Upsert assignments for ``(user_id, lat, lng)`` rows; returns the number written."""
+    index = get_stop_index()
+    written = 0
+    for batch in batched(rows, BATCH_SIZE * 10):
+        user_ids, lats, lngs = zip(*batch)
+        stop_ids, dist = index.nearest_each(lats, lngs)
+        if not len(stop_ids):
+            StopAssignment.objects.filter(user_id__in=user_ids).delete()
+            continue
+        StopAssignment.objects.bulk_create(
+            [
+                StopAssignment(user_id=u, stop_id=s, distance_m=d, latitude=la, longitude=lo)
+                for u, s, d, la, lo in zip(user_ids, stop_ids.tolist(), dist.tolist(), lats, lngs)
+            ],
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=_UPDATE_FIELDS,
+        )
+        written += len(batch)
+    return written
+
+
+def recompute_assignments():
+    """Rebuild the whole table; returns the number of assignments written."""
+    with transaction.atomic():
+        StopAssignment.objects.exclude(user__in=_located_users()).delete()
+        return _assign(_located_users().values_list('id', 'latitude', 'longitude').iterator())
+
+
+def run_recompute_job(job, progress):
+    """``recompute_assignments`` job handler, queued by bus stop uploads."""
+    progress(0.0, 'Recomputing stop assignments')
+    return {'written': recompute_assignments()}
+
+
+def refresh_for_users(user_ids):
+    """Recompute (or drop) the assignments of the given users."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return 0
+    with transaction.atomic():
+        located = _located_users().filter(id__in=user_ids)
+        StopAssignment.objects.filter(user_id__in=user_ids).exclude(user__in=located).delete()
+        return _assign(located.values_list('id', 'latitude', 'longitude'))
+
+
+def _near_any(points, radius_m):
+    """Filter for rows whose latitude/longitude lie in a box of ``radius_m`` around any of ``points``."""
+    dlat = np.degrees(radius_m / EARTH_RADIUS_M)
+    near = Q(pk__in=[])
+    for lat, lng in points:
+        box = Q(latitude__range=(lat - dlat, lat + dlat))
+        cos_lat = np.cos(np.radians(min(abs(lat) + dlat, 90.0)))
+        dlng = dlat / cos_lat if cos_lat > 1e-9 else 360.0
+        # Boxes reaching the poles or across the antimeridian keep every longitude.
+        if -180.0 <= lng - dlng and lng + dlng <= 180.0:
+            box &= Q(longitude__range=(lng - dlng, lng + dlng))
+        near |= box
+    return near
+
+
+def refresh_for_stops(stop_ids):
+    """Recompute the users a change to ``stop_ids`` can affect.
+
+    That is everyone currently assigned to one of them, everyone now closer
+    to one of them than to their assigned stop, and located users that have
+    no assignment yet (e.g. after their stop was deleted).
+    """
+    stop_ids = list(stop_ids)
+    affected = set(StopAssignment.objects.filter(stop_id__in=stop_ids).values_list('user_id', flat=True))
+
+    changed = list(BusStop.objects.filter(pk__in=stop_ids, is_active=True).values_list('latitude', 'longitude'))
+    radius_m = StopAssignment.objects.aggregate(r=Max('distance_m'))['r']
+    if changed and radius_m is not None:
+        # Only users within the largest current assignment distance of a
+        # changed stop can be closer to it than to their own stop.
+        rows = list(StopAssignment.objects.filter(_near_any(changed, radius_m))
+                    .values_list('user_id', 'latitude', 'longitude', 'distance_m'))
+        if rows:
+            user_ids, lats, lngs, current = (np.asarray(col) for col in zip(*rows))
+            s_lats, s_lngs = zip(*changed)
+            closest = distance_matrix(lats, lngs, s_lats, s_lngs).min(axis=1)
+            affected.update(user_ids[closest < current].tolist())
+
+    affected.update(_located_users().filter(stop_assignment__isnull=True).values_list('id', flat=True))
+    return refresh_for_users(affected)
+
+
+def assign_unassigned():
+    """Create assignments for located, active users that have none (e.g. just imported or activated)."""
+    return refresh_for_users(_located_users().filter(stop_assignment__isnull=True).values_list('id', flat=True))
+
+
+def _nearest_active_stop(lat, lng):
+    """``(stop, distance_m)`` for the nearest active stop, or ``(None, None)``.
+
+    The index is per process and can lag stop changes made by other workers,
+    so the hit is confirmed against the database; on a miss the index is
+    rebuilt and queried once more.
+    """
+    for _ in range(2):
+        hits = get_stop_index().nearest(lat, lng, k=1)
+        if not hits:
+            break
+        stop_id, distance_m = hits[0]
+        stop = BusStop.objects.filter(pk=stop_id, is_active=True).first()
+        if stop is not None:
+            return stop, distance_m
+        invalidate_stop_index()
+    return None, None
+
+
+def assignment_for(user, persist=True):
+    """Current assignment for ``user``, recomputed if missing or stale; ``None`` if no stop.
+
+    ``user`` only needs ``pk``, ``latitude`` and ``longitude``. With
+    ``persist=False`` a recomputed assignment is returned unsaved, for callers
+    whose location may be an out-of-date snapshot.
+    """
+    assignment = StopAssignment.objects.select_related('stop').filter(user_id=user.pk).first()
+    if (assignment is not None and assignment.stop.is_active
+            and assignment.latitude == user.latitude and assignment.longitude == user.longitude):
+        return assignment
+    stop, distance_m = _nearest_active_stop(user.latitude, user.longitude)
+    if stop is None:
+        return None
+    if not persist:
+        return StopAssignment(user_id=user.pk, stop=stop, distance_m=distance_m,
+                              latitude=user.latitude, longitude=user.longitude)
+    assignment, _ = StopAssignment.objects.update_or_create(
+        user_id=user.pk,
+        defaults={'stop': stop, 'distance_m': distance_m,
+                  'latitude': user.latitude, 'longitude': user.longitude},
+    )
+    return assignment
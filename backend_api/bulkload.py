@@ -0,0 +1,79 @@
+"""
+Bulk loading of high-volume point tables.
+
+On PostgreSQL rows are streamed into ``COPY ... FROM STDIN`` through
+psycopg2's ``copy_expert``. Rows are encoded lazily from the generator as
+the driver reads, so no model instances are built and memory stays at one
+buffer. Other backends (and drivers without ``copy_expert``) fall back to
+batched ``bulk_create``.
+"""
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .ingest import batched
+
+FALLBACK_BATCH_SIZE = 1000
+
+_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _copy_value(value):
+    # PostgreSQL COPY text format
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, float):
+        return repr(float(value))  # plain repr, also for np.float64
+    return str(value).translate(_ESCAPES)
+
+
+class _CopyStream:
+    """File-like ``read()`` over COPY text lines produced from a row iterator."""
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = b''
+        self.count = 0
+
+    def read(self, size=-1):
+        lines, length = [self.buffer], len(self.buffer)
+        while size < 0 or length < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            line = ('\t'.join(map(_copy_value, row)) + '\n').encode()
+            lines.append(line)
+            length += len(line)
+            self.count += 1
+        data = b''.join(lines)
+        if size < 0:
+            size = length
+        data, self.buffer = data[:size], data[size:]
+        return data
+
+
+def copy_rows(model, fields, rows, using=DEFAULT_DB_ALIAS):
+    """Insert ``rows`` (tuples matching ``fields``, by attname) into ``model``'s table.
+
+    Returns the number of rows written. Runs inside the caller's transaction.
+    """
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            raw = cursor.cursor
+            if hasattr(raw, 'copy_expert'):
+                meta = model._meta
+                columns = ', '.join(
+                    connection.ops.quote_name(meta.get_field(f).column) for f in fields
+                )
+                stream = _CopyStream(rows)
+                raw.copy_expert(
+                    f'COPY {connection.ops.quote_name(meta.db_table)} ({columns}) FROM STDIN',
+                    stream,
+                )
+                return stream.count
+    count = 0
+    for batch in batched(rows, FALLBACK_BATCH_SIZE):
+        model.objects.using(using).bulk_create([model(**dict(zip(fields, row))) for row in batch])
+        count += len(batch)
+    return count
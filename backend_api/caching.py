@@ -0,0 +1,151 @@
+"""
+Versioned cache helpers.
+
+Each cached family of payloads lives under a namespace whose current version
+token is stored in the Django cache. Writers call ``bump_version(namespace)``
+instead of deleting individual keys; readers build keys from the current
+version, so stale entries are simply never read again and expire on their own.
+
+Version tokens only reach every web process and pool worker through a shared
+cache backend (see ``CACHES`` in settings). Each process remembers a token
+for ``CACHE_VERSION_MEMO_SECONDS`` (1 s by default), so hot endpoints do not
+pay a cache round trip per request; a bump from another process is seen
+within that window, a bump from this process at once.
+
+ETags are a hash of the rendered body, so a client never gets a 304 for
+content that has changed. They are stored under their own small key, so a
+304 never loads the body.
+"""
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.http import parse_etags, quote_etag
+
+DEFAULT_TIMEOUT = 300
+DEFAULT_VERSION_MEMO_SECONDS = 1.0
+
+# namespace -> (version token, time.monotonic() it was read)
+_versions = {}
+
+
+def _version_key(namespace):
+    return f'backend_api:{namespace}:version'
+
+
+def get_version(namespace):
+    memo = getattr(settings, 'CACHE_VERSION_MEMO_SECONDS', DEFAULT_VERSION_MEMO_SECONDS)
+    now = time.monotonic()
+    hit = _versions.get(namespace)
+    if hit is not None and now - hit[1] < memo:
+        return hit[0]
+    version = cache.get_or_set(_version_key(namespace), lambda: uuid.uuid4().hex, None)
+    _versions[namespace] = (version, now)
+    return version
+
+
+def bump_version(*namespaces):
+    versions = {ns: uuid.uuid4().hex for ns in namespaces}
+    cache.set_many({_version_key(ns): v for ns, v in versions.items()}, None)
+    now = time.monotonic()
+    _versions.update((ns, (v, now)) for ns, v in versions.items())
+
+
+def _key(namespace, parts):
+    return ':'.join(['backend_api', namespace, get_version(namespace), *map(str, parts)])
+
+
+def _timeout(timeout):
+    return getattr(settings, 'PAYLOAD_CACHE_TTL', DEFAULT_TIMEOUT) if timeout is None else timeout
+
+
+def cached_value(namespace, compute, *parts, timeout=None):
+    """Return ``compute()`` cached under the namespace's current version.
+
+    ``compute`` must return a picklable value other than ``None``.
+    """
+    key = _key(namespace, parts)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, _timeout(timeout))
+    return value
+
+
+class CachedPayload:
+    """A rendered body and its ETag, cached under a namespace's current version.
+
+    ``etag`` is read from its own key; ``body`` is only fetched when accessed.
+    """
+
+    def __init__(self, key, render, timeout):
+        self._key = key
+        self._render = render
+        self._timeout = timeout
+        self._body = None
+        self.etag = cache.get(f'{key}:etag')
+        if self.etag is None:
+            self._fill()
+
+    def _fill(self):
+        self.etag, self._body = with_etag(self._render())
+        cache.set_many({self._key: self._body, f'{self._key}:etag': self.etag}, self._timeout)
+
+    @property
+    def body(self):
+        if self._body is None:
+            self._body = cache.get(self._key)
+            if self._body is None:
+                self._fill()
+        return self._body
+
+
+def cached_payload(namespace, render, *parts, timeout=None):
+    """``CachedPayload`` for ``render()`` under the namespace's current version.
+
+    ``render`` must return bytes; it is only called on a cache miss.
+    """
+    return CachedPayload(_key(namespace, parts), render, _timeout(timeout))
+
+
+def with_etag(body):
+    """``(etag, body)`` with the ETag derived from the bytes themselves."""
+    return quote_etag(hashlib.blake2b(body, digest_size=16).hexdigest()), body
+
+
+def not_modified(request, etag):
+    """A 304 response if the client's ``If-None-Match`` matches ``etag``, else None."""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+    return None
+
+
+def etag_response(request, etag, body, content_type='application/json', status=200):
+    """Build a response for a cached body, answering 304 when the client's ETag matches."""
+    response = not_modified(request, etag)
+    if response is None:
+        response = HttpResponse(body, content_type=content_type, status=status)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def payload_response(request, payload, empty=None, content_type='application/json'):
+    """Response for a ``CachedPayload``: 304 without loading the body when the ETag matches.
+
+    An empty body is answered with ``empty`` when given.
+    """
+    response = not_modified(request, payload.etag)
+    if response is not None:
+        return response
+    body = payload.body
+    if not body and empty is not None:
+        return empty
+    return etag_response(request, payload.etag, body, content_type)
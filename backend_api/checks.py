@@ -0,0 +1,38 @@
+"""System checks for deployment settings the app relies on."""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+_PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    # Pool jobs (optimize_routes, bulk_delete) bump cache versions and drop role
+    # claims from a worker process; the web processes only see that through a
+    # shared backend.
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in _PROCESS_LOCAL_CACHES:
+        return [Warning(
+            "The default cache is local to each process.",
+            hint="Configure a shared backend (Redis or DatabaseCache) so cache "
+                 "invalidations from other workers and background jobs are seen.",
+            id='backend_api.W001',
+        )]
+    return []
+
+
+@register(Tags.caches, deploy=True)
+def check_cache_for_production(app_configs, **kwargs):
+    # Payload bodies and role claims are read on hot paths; a database-backed
+    # cache turns each of those into a query.
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend == 'django.core.cache.backends.db.DatabaseCache':
+        return [Warning(
+            "The default cache is the database cache.",
+            hint="Set REDIS_URL in production.",
+            id='backend_api.W002',
+        )]
+    return []
@@ -0,0 +1,177 @@
+"""
+Point-in-polygon engine for coverage meshes.
+
+A mesh is a set of polygons, each made of an exterior ring and optional
+holes. It is stored packed in ``CoverageMesh.geometry`` (see
+``backend_api.packing``) as vertices tagged with ``polygon``/``ring``. ``MeshGeometry`` keeps each ring as NumPy edge arrays plus
+a per-polygon bounding box, and answers "which of these points are inside?"
+with vectorized even-odd ray casting.
+"""
+from functools import lru_cache
+
+import numpy as np
+from django.db.models import Count
+from django.db.models.functions import Coalesce, Length
+
+from .models import CoverageMesh, CoverageMeshPoint
+from .packing import MESH_COLUMNS, unpack_mesh
+
+# Upper bound on points x edges evaluated in one broadcast step.
+MAX_BROADCAST = 4_000_000
+
+
+def _ring_edges(lats, lngs):
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    if len(lats) > 1 and lats[0] == lats[-1] and lngs[0] == lngs[-1]:
+        lats, lngs = lats[:-1], lngs[:-1]
+    # Edge i runs from vertex i to vertex i+1 (wrapping around).
+    return lngs, lats, np.roll(lngs, -1), np.roll(lats, -1)
+
+
+def _crossings_odd(x1, y1, x2, y2, x, y):
+    inside = np.zeros(len(x), dtype=bool)
+    if not len(x1):
+        return inside
+    step = max(1, MAX_BROADCAST // len(x1))
+    for start in range(0, len(x), step):
+        px = x[start:start + step, None]
+        py = y[start:start + step, None]
+        spans = (y1 > py) != (y2 > py)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            x_cross = (x2 - x1) * (py - y1) / (y2 - y1) + x1
+        crossings = np.count_nonzero(spans & (px < x_cross), axis=1)
+        inside[start:start + step] = crossings % 2 == 1
+    return inside
+
+
+def _inside_ring(edges, x, y):
+    """Even-odd ray casting of points (x=lng, y=lat) against one ring.
+
+    Edges are bucketed into horizontal bands so each point is only tested
+    against the edges whose latitude span overlaps its band.
+    """
+    x1, y1, x2, y2 = edges
+    if len(x1) < 3 or not len(x):
+        return np.zeros(len(x), dtype=bool)
+    lo, hi = np.minimum(y1, y2), np.maximum(y1, y2)
+    n_bands = max(1, int(np.sqrt(len(x1))))
+    bounds = np.linspace(lo.min(), hi.max(), n_bands + 1)
+    point_band = np.clip(np.searchsorted(bounds, y, side='right') - 1, 0, n_bands - 1)
+    first = np.clip(np.searchsorted(bounds, lo, side='right') - 1, 0, n_bands - 1)
+    last = np.clip(np.searchsorted(bounds, hi, side='right') - 1, 0, n_bands - 1)
+
+    inside = np.zeros(len(x), dtype=bool)
+    for band in np.unique(point_band):
+        pts = np.flatnonzero(point_band == band)
+        sel = np.flatnonzero((first <= band) & (last >= band))
+        inside[pts] = _crossings_odd(x1[sel], y1[sel], x2[sel], y2[sel], x[pts], y[pts])
+    return inside
+
+
+class MeshGeometry:
+    """Polygons (exterior ring + holes) with precomputed bounding boxes."""
+
+    def __init__(self, polygons):
+        # polygons: list of rings, each ring a (lats, lngs) pair; ring 0 is the exterior.
+        self.polygons = []
+        for rings in polygons:
+            if not rings or len(rings[0][0]) < 3:
+                continue
+            lats, lngs = np.asarray(rings[0][0], dtype=np.float64), np.asarray(rings[0][1], dtype=np.float64)
+            bbox = (lats.min(), lngs.min(), lats.max(), lngs.max())
+            self.polygons.append((bbox, [_ring_edges(la, lo) for la, lo in rings]))
+
+    @property
+    def bbox(self):
+        if not self.polygons:
+            return None
+        boxes = np.array([b for b, _ in self.polygons])
+        return boxes[:, 0].min(), boxes[:, 1].min(), boxes[:, 2].max(), boxes[:, 3].max()
+
+    def contains(self, lats, lngs):
+        """Boolean mask of which points fall inside any polygon (and outside its holes)."""
+        y = np.asarray(lats, dtype=np.float64)
+        x = np.asarray(lngs, dtype=np.float64)
+        result = np.zeros(len(y), dtype=bool)
+        for (min_lat, min_lng, max_lat, max_lng), rings in self.polygons:
+            candidates = np.flatnonzero(
+                ~result & (y >= min_lat) & (y <= max_lat) & (x >= min_lng) & (x <= max_lng)
+            )
+            if not len(candidates):
+                continue
+            cx, cy = x[candidates], y[candidates]
+            inside = _inside_ring(rings[0], cx, cy)
+            for hole in rings[1:]:
+                if not inside.any():
+                    break
+                inside &= ~_inside_ring(hole, cx, cy)
+            result[candidates[inside]] = True
+        return result
+
+
+def mesh_rings(mesh_id):
+    """``(polygon, ring, lats, lngs)`` for every ring of a mesh, in storage order.
+
+    Decoded from the packed ``CoverageMesh.geometry`` blob when present,
+    otherwise read from the point rows.
+    """
+    blob = CoverageMesh.objects.filter(pk=mesh_id).values_list('geometry', flat=True).first()
+    if blob is not None:
+        return unpack_mesh(blob)
+    rows = (CoverageMeshPoint.objects.filter(mesh_id=mesh_id)
+            .order_by('polygon', 'ring', 'order')
+            .values_list('polygon', 'ring', 'latitude', 'longitude'))
+    rings = []
+    for polygon, ring, lat, lng in rows:
+        if not rings or rings[-1][:2] != (polygon, ring):
+            rings.append((polygon, ring, [], []))
+        rings[-1][2].append(lat)
+        rings[-1][3].append(lng)
+    return rings
+
+
+def mesh_points_count():
+    """Annotation for a mesh's vertex count, from the blob size or else the point rows."""
+    return Coalesce(Length('geometry') / (8 * MESH_COLUMNS), Count('points'))
+
+
+@lru_cache(maxsize=32)
+def load_mesh_geometry(mesh_id, stamp):
+    """Build a mesh's geometry from its points.
+
+    Mesh points are never edited after upload, so ``stamp`` (the mesh's
+    ``created_at``) only guards against a reused primary key.
+    """
+    polygons = {}
+    for polygon, _ring, lats, lngs in mesh_rings(mesh_id):
+        polygons.setdefault(polygon, []).append((lats, lngs))
+    return MeshGeometry([rings for _, rings in sorted(polygons.items())])
+
+
+def mesh_geojson(mesh_id):
+    """The mesh as a GeoJSON MultiPolygon."""
+    polygons = {}
+    for polygon, _ring, lats, lngs in mesh_rings(mesh_id):
+        polygons.setdefault(polygon, []).append([[lng, lat] for lat, lng in zip(lats, lngs)])
+    return {"type": "MultiPolygon", "coordinates": [rings for _, rings in sorted(polygons.items())]}
+
+
+def geojson_polygons(data):
+    """Extract polygons as lists of ``[(lng, lat), ...]`` rings from GeoJSON.
+
+    Accepts a FeatureCollection, Feature, Polygon, MultiPolygon or
+    GeometryCollection.
+    """
+    kind = data.get("type")
+    if kind == "FeatureCollection":
+        return [p for feature in data.get("features", []) for p in geojson_polygons(feature)]
+    if kind == "Feature":
+        return geojson_polygons(data.get("geometry") or {})
+    if kind == "GeometryCollection":
+        return [p for geom in data.get("geometries", []) for p in geojson_polygons(geom)]
+    if kind == "Polygon":
+        return [data.get("coordinates", [])]
+    if kind == "MultiPolygon":
+        return list(data.get("coordinates", []))
+    return []
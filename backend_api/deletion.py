@@ -0,0 +1,196 @@
+"""
+Chunked cascade deletes.
+
+``QuerySet.delete()`` collects every cascaded row into memory and removes
+them in one transaction. ``bulk_delete`` instead walks the foreign keys
+pointing at a model and deletes dependent rows first, by primary key, in
+chunks of ``DELETE_CHUNK_ROWS``. Each statement commits on its own, so
+locks are held for one chunk at a time. Parents go last. An interrupted
+delete can leave a parent with only part of its children, and re-running
+it finishes the job.
+
+``CASCADE`` children are deleted and ``SET_NULL``, ``SET_DEFAULT`` and
+``SET(...)`` columns are updated, chunk by chunk. ``DO_NOTHING`` is skipped.
+``PROTECT`` and ``RESTRICT`` children raise ``ProtectedError`` and
+``RestrictedError`` before anything in that chunk is touched (``RESTRICT``
+is as strict as ``PROTECT`` here). A chunk whose model has any other
+``on_delete`` is handed to Django's collector. Model signals are not sent
+(no model here listens for deletes).
+"""
+from collections import Counter
+
+from django.db import connections, models, router
+from django.db.models.deletion import Collector, RestrictedError
+
+from accounts.models import User
+from accounts.roles import invalidate_claims
+from .caching import bump_version
+from .models import CoverageMesh, CoverageMeshPoint, Route, RoutePlan, RouteTrackPoint
+
+DELETE_CHUNK_ROWS = 5000
+# Cascades that would delete more rows than this run as a ``bulk_delete`` job.
+DELETE_SYNC_MAX_ROWS = 50000
+
+# target -> (model, (dependent model, lookup to the target's ids) used to size
+# the cascade, cache namespaces to bump afterwards)
+TARGETS = {
+    'routes': (Route, (RouteTrackPoint, 'route_id__in'), ('active_plan', 'route_plans')),
+    'route_plans': (RoutePlan, (RouteTrackPoint, 'route__plan_id__in'), ('active_plan', 'route_plans')),
+    'coverage_meshes': (CoverageMesh, (CoverageMeshPoint, 'mesh_id__in'), ('coverage_meshes',)),
+    'employees': (User, None, ()),
+}
+
+
+def _dependents(model):
+    """``(child model, foreign key field)`` for every foreign key pointing at ``model``."""
+    for rel in model._meta.get_fields(include_hidden=True):
+        if rel.auto_created and not rel.concrete and (rel.one_to_many or rel.one_to_one):
+            yield rel.related_model, rel.field
+
+
+def _in_clause(column, ids):
+    return f"{column} IN ({', '.join(['%s'] * len(ids))})"
+
+
+def _chunk_pks(connection, model, column, ids):
+    """Up to ``DELETE_CHUNK_ROWS`` primary keys of ``model`` rows with ``column`` in ``ids``."""
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT {qn(model._meta.pk.column)} FROM {qn(model._meta.db_table)} "
+            f"WHERE {_in_clause(qn(column), ids)} LIMIT {DELETE_CHUNK_ROWS}",
+            list(ids),
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class _FieldUpdate:
+    """Stands in for the collector to read the value a ``SET*`` handler assigns."""
+
+    def add_field_update(self, field, value, objs):
+        self.value = value
+
+
+def _is_field_update(on_delete):
+    return (on_delete in (models.SET_NULL, models.SET_DEFAULT)
+            or getattr(on_delete, 'deconstruct', lambda: (None,))()[0] == 'django.db.models.SET')
+
+
+def _delete_pks(connection, model, pks, counts):
+    """Delete rows of ``model`` by primary key, dependents first."""
+    qn = connection.ops.quote_name
+    using = connection.alias
+    dependents = []
+    for child, field in _dependents(model):
+        on_delete = field.remote_field.on_delete
+        if on_delete is models.DO_NOTHING:
+            continue
+        # The foreign key may target a unique field other than the primary key.
+        if field.target_field != model._meta.pk:
+            keys = list(model._base_manager.using(using)
+                        .filter(pk__in=pks).values_list(field.target_field.attname, flat=True))
+        else:
+            keys = pks
+        if not keys:
+            continue
+        if on_delete in (models.PROTECT, models.RESTRICT):
+            blocking = list(child._base_manager.using(using)
+                            .filter(**{f'{field.name}__in': keys})[:DELETE_CHUNK_ROWS])
+            if not blocking:
+                continue
+            if on_delete is models.PROTECT:
+                models.PROTECT(None, field, blocking, using)  # raises ProtectedError
+            raise RestrictedError(
+                f"Cannot delete some instances of model '{model.__name__}' because they are "
+                f"referenced through a restricted foreign key: '{child.__name__}.{field.name}'",
+                set(blocking),
+            )
+        if on_delete is not models.CASCADE and not _is_field_update(on_delete):
+            collector = Collector(using=using)
+            collector.collect(model._base_manager.using(using).filter(pk__in=pks))
+            _, per_model = collector.delete()
+            counts.update(per_model)
+            return
+        dependents.append((child, field, on_delete, keys))
+
+    for child, field, on_delete, keys in dependents:
+        if on_delete is models.CASCADE:
+            while child_pks := _chunk_pks(connection, child, field.column, keys):
+                _delete_pks(connection, child, child_pks, counts)
+            continue
+        update = _FieldUpdate()
+        on_delete(update, field, None, using)
+        # Updated rows drop out of the next chunk; ``done`` only guards against
+        # a new value that is itself one of ``keys``.
+        done = set()
+        while child_pks := [pk for pk in _chunk_pks(connection, child, field.column, keys) if pk not in done]:
+            child._base_manager.using(using).filter(pk__in=child_pks).update(**{field.name: update.value})
+            done.update(child_pks)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {qn(model._meta.db_table)} "
+            f"WHERE {_in_clause(qn(model._meta.pk.column), pks)}",
+            list(pks),
+        )
+        counts[model._meta.label] += cursor.rowcount
+
+
+def bulk_delete(queryset, progress=None):
+    """Delete ``queryset`` and its cascade in bounded chunks.
+
+    Returns ``(total, {model label: rows})`` like ``QuerySet.delete()``.
+    ``progress(fraction, message)`` is called after each chunk of parents.
+    """
+    model = queryset.model
+    connection = connections[router.db_for_write(model)]
+    pks = queryset.order_by().values_list('pk', flat=True)
+    total = pks.count() if progress else None
+    counts = Counter()
+    last = None
+    done = 0
+    while True:
+        chunk = pks.order_by('pk')
+        if last is not None:
+            chunk = chunk.filter(pk__gt=last)
+        chunk = list(chunk[:DELETE_CHUNK_ROWS])
+        if not chunk:
+            break
+        _delete_pks(connection, model, chunk, counts)
+        last = chunk[-1]
+        done += len(chunk)
+        if progress:
+            progress(done / max(total, 1), f"Deleted {done} of {total} {model._meta.verbose_name_plural}")
+    return sum(counts.values()), dict(counts)
+
+
+def cascade_size(target, ids=None):
+    """Rough number of rows deleting ``target`` (``ids``, or all rows) touches."""
+    model, heavy, _ = TARGETS[target]
+    parents = model.objects.all() if ids is None else model.objects.filter(pk__in=ids)
+    size = parents.count()
+    if heavy is not None:
+        child, lookup = heavy
+        size += child.objects.filter(**{lookup: parents.values('pk')}).count()
+    return size
+
+
+def delete_target(target, ids=None, progress=None):
+    """Delete rows of a ``TARGETS`` entry (``ids``, or all rows) and bump its caches."""
+    model, _, namespaces = TARGETS[target]
+    queryset = model.objects.all() if ids is None else model.objects.filter(pk__in=ids)
+    user_ids = list(queryset.values_list('pk', flat=True)) if model is User else ()
+    try:
+        return bulk_delete(queryset, progress)
+    finally:
+        # From a ``bulk_delete`` job these reach the web processes through the
+        # shared cache (settings.CACHES, checked by backend_api.W001).
+        if namespaces:
+            bump_version(*namespaces)
+        if user_ids:
+            invalidate_claims(*user_ids)
+
+
+def run_delete_job(job, progress):
+    """``bulk_delete`` job handler; params are ``{'target': ..., 'ids': [...] or None}``."""
+    total, per_model = delete_target(job.params['target'], job.params.get('ids'), progress)
+    return {'deleted': total, 'per_model': per_model}
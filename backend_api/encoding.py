@@ -0,0 +1,48 @@
+"""
+Compact coordinate encodings for route geometry.
+
+``polyline`` is Google's encoded polyline algorithm (precision 5, lat/lng
+order). ``binary`` is little-endian float32 (lat, lng) pairs, base64-encoded
+so it can travel inside a JSON document.
+"""
+import base64
+
+import numpy as np
+
+COMPACT_ENCODINGS = ('polyline', 'binary')
+
+_SHIFTS = np.arange(7, dtype=np.int64) * 5
+
+
+def encode_polyline(lats, lngs, precision=5):
+    """Encode coordinate arrays as a Google encoded polyline string."""
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    if lats.size == 0:
+        return ''
+    scaled = np.round(np.column_stack((lats, lngs)) * 10 ** precision).astype(np.int64)
+    deltas = np.diff(scaled, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+
+    # Split every value into 5-bit groups (least significant first), keep as
+    # many groups as the value needs, and flag all but the last with 0x20.
+    groups = values[:, None] >> _SHIFTS
+    used = np.maximum((groups > 0).sum(axis=1), 1)
+    keep = np.arange(len(_SHIFTS)) < used[:, None]
+    more = np.arange(len(_SHIFTS)) < (used - 1)[:, None]
+    chars = (groups & 0x1F) | np.where(more, 0x20, 0)
+    return (chars[keep] + 63).astype(np.uint8).tobytes().decode('ascii')
+
+
+def encode_binary(lats, lngs):
+    """Pack coordinate arrays as base64 little-endian float32 (lat, lng) pairs."""
+    pairs = np.column_stack((np.asarray(lats, dtype='<f4'), np.asarray(lngs, dtype='<f4')))
+    return base64.b64encode(pairs.tobytes()).decode('ascii')
+
+
+def encode_coords(encoding, lats, lngs):
+    if encoding == 'polyline':
+        return encode_polyline(lats, lngs)
+    if encoding == 'binary':
+        return encode_binary(lats, lngs)
+    raise ValueError(f"Unknown encoding '{encoding}'")
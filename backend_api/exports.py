@@ -0,0 +1,157 @@
+"""
+Streaming bulk exports.
+
+Each dataset is a ``values_list`` query read with ``QuerySet.iterator``
+(a server-side cursor on PostgreSQL). Rows are encoded chunk by chunk into
+NDJSON, CSV or a GeoJSON FeatureCollection. A worker only ever holds one
+chunk, whatever the table size.
+
+Route tracks and mesh vertices are read from the packed blobs on their
+parent rows (see ``backend_api.packing``), a few parents at a time. Parents
+without a blob fall back to their point rows.
+"""
+import csv
+import io
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from accounts.models import User
+from .ingest import batched
+from .models import BusStop, CoverageMesh, CoverageMeshPoint, Route, RouteTrackPoint
+from .packing import mesh_points, track_points
+
+EXPORT_CHUNK_ROWS = 2000
+# Parents (each with a whole geometry blob) fetched per round trip
+EXPORT_CHUNK_BLOBS = 20
+
+# name -> (model, fields, {query param: lookup}); every dataset has latitude/longitude.
+DATASETS = {
+    'users': (
+        User,
+        ('id', 'username', 'email', 'role', 'employee_id', 'company', 'is_active',
+         'employee_status', 'shift', 'utilization', 'latitude', 'longitude', 'created_at'),
+        {'is_active': 'is_active', 'shift': 'shift', 'company': 'company'},
+    ),
+    'bus-stops': (
+        BusStop,
+        ('id', 'stop_id', 'name', 'latitude', 'longitude', 'source', 'is_active', 'created_at'),
+        {'is_active': 'is_active', 'source': 'source'},
+    ),
+    'coverage-mesh-points': (
+        CoverageMesh,
+        ('mesh_id', 'polygon', 'ring', 'order', 'latitude', 'longitude'),
+        {'mesh_id': 'pk'},
+    ),
+    'route-track-points': (
+        Route,
+        ('route_id', 'plan_id', 'order', 'latitude', 'longitude', 'significance_m'),
+        {'route_id': 'pk', 'plan_id': 'plan_id'},
+    ),
+}
+
+
+def _mesh_point_rows(meshes):
+    for mesh_id, blob in meshes.values_list('pk', 'geometry').iterator(chunk_size=EXPORT_CHUNK_BLOBS):
+        if blob is None:
+            points = (CoverageMeshPoint.objects.filter(mesh_id=mesh_id).order_by('polygon', 'ring', 'order')
+                      .values_list('polygon', 'ring', 'order', 'latitude', 'longitude'))
+        else:
+            points = mesh_points(blob)
+        for point in points:
+            yield (mesh_id, *point)
+
+
+def _track_point_rows(routes):
+    for route_id, plan_id, blob in (routes.values_list('pk', 'plan_id', 'track')
+                                    .iterator(chunk_size=EXPORT_CHUNK_BLOBS)):
+        if blob is None:
+            points = (RouteTrackPoint.objects.filter(route_id=route_id).order_by('order')
+                      .values_list('order', 'latitude', 'longitude', 'significance_m'))
+        else:
+            points = track_points(blob)
+        for point in points:
+            yield (route_id, plan_id, *point)
+
+
+# Datasets expanded from packed geometry instead of read as ``fields``
+EXPANDERS = {
+    'coverage-mesh-points': _mesh_point_rows,
+    'route-track-points': _track_point_rows,
+}
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+    'geojson': 'application/geo+json',
+}
+
+
+def _bool_param(value):
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def export_rows(dataset, params):
+    """``(fields, row iterator)`` for a dataset, filtered by the allowed query params.
+
+    Raises ``KeyError`` for an unknown dataset and ``ValueError`` for a bad filter.
+    """
+    model, fields, filters = DATASETS[dataset]
+    qs = model.objects.order_by('pk')
+    for param, lookup in filters.items():
+        value = params.get(param)
+        if value in (None, ''):
+            continue
+        if param == 'is_active':
+            value = _bool_param(value)
+        elif param.endswith('_id'):
+            value = int(value)
+        qs = qs.filter(**{lookup: value})
+    if dataset in EXPANDERS:
+        return list(fields), EXPANDERS[dataset](qs)
+    return list(fields), qs.values_list(*fields).iterator(chunk_size=EXPORT_CHUNK_ROWS)
+
+
+def _dumps(value):
+    return json.dumps(value, cls=DjangoJSONEncoder, separators=(',', ':'))
+
+
+def iter_ndjson(fields, rows):
+    for chunk in batched(rows, EXPORT_CHUNK_ROWS):
+        yield ''.join(_dumps(dict(zip(fields, row))) + '\n' for row in chunk).encode()
+
+
+def iter_csv(fields, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for chunk in batched(rows, EXPORT_CHUNK_ROWS):
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def iter_geojson(fields, rows):
+    lat_i, lng_i = fields.index('latitude'), fields.index('longitude')
+    props = [(i, f) for i, f in enumerate(fields) if i not in (lat_i, lng_i)]
+    yield b'{"type":"FeatureCollection","features":['
+    separator = b''
+    for chunk in batched(rows, EXPORT_CHUNK_ROWS):
+        features = ','.join(
+            _dumps({
+                "type": "Feature",
+                "geometry": None if row[lat_i] is None or row[lng_i] is None
+                else {"type": "Point", "coordinates": [row[lng_i], row[lat_i]]},
+                "properties": {f: row[i] for i, f in props},
+            })
+            for row in chunk
+        )
+        yield separator + features.encode()
+        separator = b','
+    yield b']}'
+
+
+WRITERS = {'ndjson': iter_ndjson, 'csv': iter_csv, 'geojson': iter_geojson}
@@ -0,0 +1,62 @@
+"""
+Vectorized great-circle distance helpers.
+
+Every function accepts scalars or array-likes and works on contiguous float64
+arrays, so callers can compute one-to-many and many-to-many distances without
+looping in Python.
+"""
+import numpy as np
+
+EARTH_RADIUS_M = 6371000.0
+
+
+def as_float_array(values):
+    return np.require(values, dtype=np.float64, requirements='C')
+
+
+def to_unit_xyz(lat, lng):
+    """Map degrees to (n, 3) cartesian coordinates on the unit sphere."""
+    lat = np.radians(as_float_array(lat))
+    lng = np.radians(as_float_array(lng))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)))
+
+
+def chord_to_m(chord):
+    """Convert unit-sphere chord lengths to great-circle metres."""
+    return 2.0 * EARTH_RADIUS_M * np.arcsin(np.minimum(chord / 2.0, 1.0))
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres between broadcastable coordinate arrays."""
+    lat1, lon1, lat2, lon2 = (np.radians(as_float_array(v)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2.0) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.0) ** 2
+    d = 2.0 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+    return float(d) if d.ndim == 0 else d
+
+
+def distances_from(lat, lon, lats, lons):
+    """One-to-many: distances in metres from a single point to every point in ``lats``/``lons``."""
+    return np.atleast_1d(haversine_m(lat, lon, lats, lons))
+
+
+def distance_matrix(lats1, lons1, lats2, lons2, chunk_rows=1024):
+    """Many-to-many: ``(len(lats1), len(lats2))`` matrix of distances in metres.
+
+    Rows are processed in chunks so the temporaries stay bounded for large sets.
+    """
+    lat1 = np.radians(as_float_array(lats1)).reshape(-1, 1)
+    lon1 = np.radians(as_float_array(lons1)).reshape(-1, 1)
+    lat2 = np.radians(as_float_array(lats2)).reshape(1, -1)
+    lon2 = np.radians(as_float_array(lons2)).reshape(1, -1)
+    cos1 = np.cos(lat1)
+    cos2 = np.cos(lat2)
+
+    out = np.empty((lat1.shape[0], lat2.shape[1]), dtype=np.float64)
+    for start in range(0, lat1.shape[0], chunk_rows):
+        end = start + chunk_rows
+        a = (np.sin((lat2 - lat1[start:end]) / 2.0) ** 2
+             + cos1[start:end] * cos2 * np.sin((lon2 - lon1[start:end]) / 2.0) ** 2)
+        np.minimum(a, 1.0, out=a)
+        out[start:end] = 2.0 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+    return out
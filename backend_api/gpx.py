@@ -0,0 +1,219 @@
+"""
+Streaming GPX reader.
+
+GPX files are read with ``ElementTree.iterparse`` and each point element is
+detached from the tree as soon as it has been read. ``read_gpx`` hands every
+track to a sink as soon as its ``</trk>`` closes, so memory holds the
+coordinates of one route, not the whole document or upload.
+
+A file can hold several ``trk``/``rte`` elements. Uploads may also be a ZIP of
+GPX files. Each track becomes one ``ParsedRoute``:
+
+* ``trk`` number i provides the trackpoints and ``rte`` number i its stops.
+  Unpaired ``trk``/``rte`` elements become routes of their own.
+* Waypoints (``wpt``) are only used as stops when the file has no ``rtept``.
+  Each one goes to the route whose track passes closest to it.
+
+The GPX schema puts ``wpt`` before ``rte`` before ``trk``, so stops are
+normally known when a track is written. Stops that only turn up later are
+added to the written route at the end of the document.
+"""
+import io
+import os
+import zipfile
+from array import array
+from dataclasses import dataclass, field
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from .simplify import significance_m
+from .spatial import StopIndex
+
+# What a malformed GPX file raises: bad XML, a point without lat/lon, or a
+# non-numeric coordinate.
+GPX_ERRORS = (ET.ParseError, KeyError, ValueError)
+
+
+@dataclass
+class ParsedRoute:
+    name: str
+    source: str
+    track_lats: array = field(default_factory=lambda: array('d'))
+    track_lngs: array = field(default_factory=lambda: array('d'))
+    significance: list = field(default_factory=list)
+    stops: list = field(default_factory=list)  # (name, lat, lng)
+
+
+class RouteList:
+    """``read_gpx`` sink that keeps the routes in memory (for ``parse_gpx``)."""
+
+    def __init__(self):
+        self.routes = []
+
+    def add_route(self, route):
+        self.routes.append(route)
+        return len(self.routes) - 1
+
+    def add_stops(self, key, stops):
+        self.routes[key].stops.extend(stops)
+
+    def track(self, key):
+        return self.routes[key].track_lats, self.routes[key].track_lngs
+
+
+def gpx_error(e):
+    return str(e) or e.__class__.__name__
+
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _child_text(elem, name):
+    for child in elem:
+        if _local(child.tag) == name:
+            return (child.text or '').strip()
+    return ''
+
+
+def _point(elem):
+    return float(elem.attrib['lat']), float(elem.attrib['lon'])
+
+
+def _named_stops(stops):
+    return [(name or f"Stop {j + 1}", lat, lng) for j, (name, lat, lng) in enumerate(stops)]
+
+
+def _finish(route):
+    route.stops = _named_stops(route.stops)
+    route.significance = significance_m(route.track_lats, route.track_lngs)
+    return route
+
+
+def read_gpx(fileobj, sink, source=''):
+    """Stream one GPX document into ``sink``; returns the number of routes written.
+
+    ``sink.add_route(route)`` returns a key for the stored route,
+    ``sink.add_stops(key, stops)`` appends stops to it and ``sink.track(key)``
+    gives its ``(lats, lngs)`` back for placing waypoints.
+    """
+    keys, rtes, wpts = [], [], []  # rtes[i] is None once handed to track i
+    has_rtept = False
+    current = None
+    parents = []
+
+    for event, elem in ET.iterparse(fileobj, events=('start', 'end')):
+        tag = _local(elem.tag)
+        if event == 'start':
+            if tag in ('trk', 'rte'):
+                current = ParsedRoute(name='', source=source)
+            parents.append(elem)
+            continue
+
+        parents.pop()
+        parent = parents[-1] if parents else None
+        if tag == 'trkpt':
+            lat, lng = _point(elem)
+            current.track_lats.append(lat)
+            current.track_lngs.append(lng)
+        elif tag in ('rtept', 'wpt'):
+            lat, lng = _point(elem)
+            stop = (_child_text(elem, 'name'), lat, lng)
+            (current.stops if tag == 'rtept' else wpts).append(stop)
+            has_rtept = has_rtept or tag == 'rtept'
+        elif tag == 'name' and parent is not None and _local(parent.tag) in ('trk', 'rte'):
+            current.name = (elem.text or '').strip()
+            continue
+        elif tag == 'trk':
+            i = len(keys)
+            rte = rtes[i] if i < len(rtes) else None
+            if rte is not None:
+                current.stops, current.name = rte.stops, current.name or rte.name
+                rtes[i] = None
+            keys.append(sink.add_route(_finish(current)))
+            current = None
+        elif tag == 'rte':
+            i = len(rtes)
+            rtes.append(current)
+            if i < len(keys):
+                # The track this rte pairs with has already been written.
+                sink.add_stops(keys[i], _named_stops(current.stops))
+                rtes[i] = None
+            current = None
+        else:
+            continue
+        # Detach finished points/containers so the tree never grows.
+        if parent is not None:
+            parent.remove(elem)
+
+    for rte in rtes[len(keys):]:
+        keys.append(sink.add_route(_finish(rte)))
+    if not keys and wpts:
+        keys.append(sink.add_route(_finish(ParsedRoute(name='', source=source))))
+    if wpts and not has_rtept:
+        for key, stops in _assign_waypoints(sink, keys, wpts):
+            sink.add_stops(key, _named_stops(stops))
+    return len(keys)
+
+
+def parse_gpx(fileobj, source=''):
+    """Parse one GPX stream into a list of ``ParsedRoute``."""
+    sink = RouteList()
+    read_gpx(fileobj, sink, source)
+    return sink.routes
+
+
+def _assign_waypoints(sink, keys, wpts):
+    """``(key, waypoints)`` pairs giving each waypoint to the route passing closest to it."""
+    if len(keys) == 1:
+        return [(keys[0], wpts)]
+    # Distance from every waypoint to the closest vertex of every track, one track at a time.
+    with_track, closest = [], []
+    for key in keys:
+        lats, lngs = sink.track(key)
+        if not len(lats):
+            continue
+        index = StopIndex(np.arange(len(lats)), lats, lngs)
+        with_track.append(key)
+        closest.append([index.nearest(lat, lng, k=1)[0][1] for _name, lat, lng in wpts])
+    if not with_track:
+        return [(keys[0], wpts)]
+    owners = np.asarray(closest).argmin(axis=0)
+    return [(key, [w for w, owner in zip(wpts, owners) if owner == j]) for j, key in enumerate(with_track)]
+
+
+def iter_gpx_sources(upload):
+    """Yield ``(source_name, binary stream)`` for a GPX upload or each GPX inside a ZIP."""
+    upload.seek(0)
+    if zipfile.is_zipfile(upload):
+        upload.seek(0)
+        with zipfile.ZipFile(upload) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not info.filename.lower().endswith('.gpx'):
+                    continue
+                with archive.open(info) as member:
+                    yield os.path.basename(info.filename), member
+    else:
+        upload.seek(0)
+        yield upload.name or '', upload
+
+
+def gpx_payloads(upload):
+    """``(source, payload)`` pairs for pool workers: a temp-file path when the upload
+    is on disk, otherwise the raw bytes. ZIPs are expanded member by member."""
+    upload.seek(0)
+    if not zipfile.is_zipfile(upload) and hasattr(upload, 'temporary_file_path'):
+        return [(upload.name or '', upload.temporary_file_path())]
+    return [(source, stream.read()) for source, stream in iter_gpx_sources(upload)]
+
+
+def parse_gpx_payload(source, payload):
+    """Process-pool entry point: returns ``(source, routes, error)``."""
+    try:
+        if isinstance(payload, bytes):
+            return source, parse_gpx(io.BytesIO(payload), source), None
+        with open(payload, 'rb') as fh:
+            return source, parse_gpx(fh, source), None
+    except GPX_ERRORS as e:
+        return source, [], gpx_error(e)
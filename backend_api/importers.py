@@ -0,0 +1,302 @@
+"""
+Batched importers behind the HR data-management upload endpoints.
+
+Importers take already-parsed rows, validate them row by row, and write in
+chunks with ``bulk_create``. They return a result dict that the views send
+back as JSON, including per-row errors instead of silently skipping bad input.
+"""
+import uuid
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+
+from accounts.models import User, PrivacyConsent
+from .bulkload import copy_rows
+from .ingest import batched
+from .models import BusStop, RoutePlan, Route, RouteStopPoint, RouteTrackPoint
+from .packing import pack_track, store_geometry_rows, unpack_track
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 500
+
+
+class RowErrors:
+    """Collects per-row validation errors, keeping at most ``MAX_REPORTED_ERRORS``."""
+
+    def __init__(self):
+        self.items = []
+        self.total = 0
+
+    def add(self, row, message):
+        self.total += 1
+        if len(self.items) < MAX_REPORTED_ERRORS:
+            self.items.append({"row": row, "error": message})
+
+    def extend(self, rows, message):
+        for row in rows:
+            self.add(row, message)
+
+    def as_dict(self):
+        return {"errors": self.items, "errors_total": self.total}
+
+
+def normalize_employee_id(value):
+    """Same normalisation as ``User.save()``: 5 characters, zero padded."""
+    return str(value).strip().zfill(5)[:5]
+
+
+def _parse_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _create_users(users):
+    created = User.objects.bulk_create(users, batch_size=BATCH_SIZE)
+    # bulk_create skips post_save, so ensure_privacy_consent never runs.
+    PrivacyConsent.objects.bulk_create(
+        [PrivacyConsent(user=u) for u in created], batch_size=BATCH_SIZE
+    )
+    return len(created)
+
+
+def _minimal_employee_users(rows, errors):
+    seen = set()
+    for line_no, row in enumerate(rows, start=1):
+        if len(row) < 6:
+            errors.add(line_no, f"Expected 6 columns, got {len(row)}")
+            continue
+        employee_id, company, _utilization, shift, lat_str, lon_str = row[:6]
+        lat, lon = _parse_float(lat_str), _parse_float(lon_str)
+        if lat is None or lon is None:
+            if line_no == 1:
+                continue
+            errors.add(line_no, "Latitude and longitude must be numeric")
+            continue
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            errors.add(line_no, "Latitude/longitude out of range")
+            continue
+        if not str(employee_id).strip():
+            errors.add(line_no, "Missing employee_id")
+            continue
+        employee_id = normalize_employee_id(employee_id)
+        if employee_id in seen:
+            errors.add(line_no, f"Duplicate employee_id {employee_id} in file")
+            continue
+        seen.add(employee_id)
+        yield User(
+            username=f"emp_{uuid.uuid4().hex[:8]}",
+            email=f"emp_{employee_id}@temp.com",
+            employee_id=employee_id,
+            first_name=f"Employee {employee_id}",
+            company=str(company),
+            shift=str(shift),
+            latitude=lat,
+            longitude=lon,
+            is_active=True,
+        )
+
+
+def import_minimal_employees(rows):
+    """Create employees from ``employee_id, company, utilization, shift, lat, lon`` rows.
+
+    ``rows`` may be any iterable (e.g. a streaming ``csv.reader``); it is consumed
+    in ``BATCH_SIZE`` batches. Rows for employee_ids that already exist are
+    skipped and counted. A leading header row (non-numeric coordinates on
+    line 1) is ignored.
+    """
+    errors = RowErrors()
+    created = skipped = 0
+    with transaction.atomic():
+        for batch in batched(_minimal_employee_users(rows, errors), BATCH_SIZE):
+            existing = set(User.objects.filter(employee_id__in=[u.employee_id for u in batch])
+                           .values_list('employee_id', flat=True))
+            skipped += len(existing)
+            created += _create_users([u for u in batch if u.employee_id not in existing])
+
+    return {"created": created, "skipped_existing": skipped, **errors.as_dict()}
+
+
+def _line_numbers(df, mask):
+    # read_csv keeps a running index across chunks; +2 for the header and 1-based lines.
+    return (df.index.to_numpy()[mask] + 2).tolist()
+
+
+def _coordinates(df, errors):
+    """Coerce latitude/longitude columns; returns ``(valid_mask, lat, lng)`` arrays."""
+    lat = pd.to_numeric(df['latitude'], errors='coerce').to_numpy(dtype=np.float64)
+    lng = pd.to_numeric(df['longitude'], errors='coerce').to_numpy(dtype=np.float64)
+    not_numeric = np.isnan(lat) | np.isnan(lng)
+    out_of_range = ~not_numeric & ((np.abs(lat) > 90) | (np.abs(lng) > 180))
+    errors.extend(_line_numbers(df, not_numeric), "Latitude and longitude must be numeric")
+    errors.extend(_line_numbers(df, out_of_range), "Latitude/longitude out of range")
+    return ~(not_numeric | out_of_range), lat, lng
+
+
+def _text_column(df, name, default=''):
+    if name not in df.columns:
+        return pd.Series(default, index=df.index, dtype=object)
+    return df[name].fillna(default).astype(str).str.strip()
+
+
+def bus_stop_objects(df, errors, seen_ids):
+    """Build ``BusStop`` objects from a CSV chunk read with ``dtype=str``.
+
+    Invalid rows are recorded in ``errors``; ``seen_ids`` tracks stop_ids across
+    chunks so duplicates in the file are rejected instead of hitting the unique
+    constraint.
+    """
+    valid, lat, lng = _coordinates(df, errors)
+    stop_ids = _text_column(df, 'stop_id')
+    names = _text_column(df, 'name')
+    sources = _text_column(df, 'source', 'Generated')
+
+    checks = [
+        (stop_ids.eq('').to_numpy(), "Missing stop_id"),
+        (stop_ids.str.len().gt(50).to_numpy(), "stop_id longer than 50 characters"),
+        (names.str.len().gt(100).to_numpy(), "name longer than 100 characters"),
+        ((stop_ids.duplicated() | stop_ids.isin(seen_ids)).to_numpy(), "Duplicate stop_id in file"),
+    ]
+    for mask, message in checks:
+        mask = valid & mask
+        errors.extend(_line_numbers(df, mask), message)
+        valid &= ~mask
+
+    idx = np.flatnonzero(valid)
+    stop_ids, names, sources = (col.to_numpy(dtype=object)[idx] for col in (stop_ids, names, sources))
+    seen_ids.update(stop_ids)
+    return [
+        BusStop(stop_id=stop_id, name=name, latitude=la, longitude=lo, source=source)
+        for stop_id, name, la, lo, source in zip(stop_ids, names, lat[idx].tolist(), lng[idx].tolist(), sources)
+    ]
+
+
+_STOP_FIELDS = ['name', 'latitude', 'longitude', 'source', 'is_active']
+
+
+def upsert_bus_stops(objs):
+    """Insert new stops and update changed ones, keyed on ``stop_id``.
+
+    Unchanged rows are not written, so their ids and ``created_at`` are kept.
+    Returns ``(created, updated, unchanged)`` counts.
+    """
+    existing = {
+        row[0]: row[1:]
+        for row in BusStop.objects.filter(stop_id__in=[o.stop_id for o in objs])
+        .values_list('stop_id', *_STOP_FIELDS)
+    }
+    changed = [
+        o for o in objs
+        if o.stop_id not in existing or existing[o.stop_id] != tuple(getattr(o, f) for f in _STOP_FIELDS)
+    ]
+    if changed:
+        BusStop.objects.bulk_create(
+            changed,
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['stop_id'],
+            update_fields=_STOP_FIELDS,
+        )
+    created = sum(1 for o in changed if o.stop_id not in existing)
+    return created, len(changed) - created, len(objs) - len(changed)
+
+
+def _int_column(df, name):
+    if name not in df.columns:
+        return np.zeros(len(df), dtype=np.int64)
+    return pd.to_numeric(df[name], errors='coerce').fillna(0).astype(np.int64).to_numpy()
+
+
+def mesh_vertices(df, errors):
+    """Valid ``(longitude, latitude, polygon, ring)`` vertices of a CSV chunk, in file order.
+
+    ``polygon`` and ``ring`` columns are optional and default to 0 (one exterior ring).
+    """
+    valid, lat, lng = _coordinates(df, errors)
+    polygon, ring = _int_column(df, 'polygon'), _int_column(df, 'ring')
+    return list(zip(lng[valid].tolist(), lat[valid].tolist(),
+                    polygon[valid].tolist(), ring[valid].tolist()))
+
+
+def get_route_plan(plan_name, bus_supplier='', is_active=False):
+    """Fetch or create a plan by name; activating it deactivates every other plan."""
+    plan, _ = RoutePlan.objects.get_or_create(
+        route_plan_name=plan_name,
+        defaults={'bus_supplier': bus_supplier, 'is_active': is_active},
+    )
+    if is_active:
+        RoutePlan.objects.filter(is_active=True).exclude(pk=plan.pk).update(is_active=False)
+        if not plan.is_active:
+            plan.is_active = True
+            plan.save(update_fields=['is_active'])
+    return plan
+
+
+def create_route_plan(plan_name, bus_supplier='', is_active=False):
+    """Always create a new plan, even if the name is taken; activating it deactivates every other plan."""
+    plan = RoutePlan.objects.create(route_plan_name=plan_name, bus_supplier=bus_supplier, is_active=is_active)
+    if is_active:
+        RoutePlan.objects.filter(is_active=True).exclude(pk=plan.pk).update(is_active=False)
+    return plan
+
+
+def save_parsed_route(plan, parsed, route_name, shift):
+    """Write one ``gpx.ParsedRoute`` under ``plan``.
+
+    The track is stored packed on the route; stops (and track rows when
+    ``STORE_GEOMETRY_ROWS`` is set) are bulk loaded with ``copy_rows``.
+    """
+    route = Route.objects.create(
+        plan=plan, route_name=route_name, shift=shift,
+        track=pack_track(parsed.track_lats, parsed.track_lngs, parsed.significance),
+    )
+    if store_geometry_rows():
+        copy_rows(
+            RouteTrackPoint, ('route_id', 'latitude', 'longitude', 'order', 'significance_m'),
+            ((route.id, lat, lng, i, sig) for i, (lat, lng, sig) in
+             enumerate(zip(parsed.track_lats, parsed.track_lngs, parsed.significance))),
+        )
+    add_route_stops(route.id, parsed.stops)
+    return {
+        "route_id": route.id,
+        "route_name": route_name,
+        "source": parsed.source,
+        "track_points": len(parsed.track_lats),
+        "stop_points": len(parsed.stops),
+    }
+
+
+def add_route_stops(route_id, stops, start=0):
+    """Append ``(name, lat, lng)`` stops to a route, numbered from ``start``."""
+    return copy_rows(
+        RouteStopPoint, ('route_id', 'stop_name', 'latitude', 'longitude', 'order'),
+        ((route_id, name[:150], lat, lng, start + i) for i, (name, lat, lng) in enumerate(stops)),
+    )
+
+
+class RouteWriter:
+    """``gpx.read_gpx`` sink that saves each route under ``plan`` as soon as it is read.
+
+    ``name_for(parsed, n)`` names the n-th route (0-based). ``saved`` holds the
+    ``save_parsed_route`` results in order.
+    """
+
+    def __init__(self, plan, shift, name_for):
+        self.plan = plan
+        self.shift = shift
+        self.name_for = name_for
+        self.saved = []
+
+    def add_route(self, parsed):
+        self.saved.append(save_parsed_route(self.plan, parsed, self.name_for(parsed, len(self.saved)), self.shift))
+        return len(self.saved) - 1
+
+    def add_stops(self, key, stops):
+        saved = self.saved[key]
+        saved["stop_points"] += add_route_stops(saved["route_id"], stops, saved["stop_points"])
+
+    def track(self, key):
+        _, lats, lngs = unpack_track(Route.objects.values_list('track', flat=True).get(pk=self.saved[key]["route_id"]))
+        return lats, lngs
@@ -0,0 +1,49 @@
+"""
+Streaming readers for uploaded files.
+
+Uploads are decoded incrementally through ``io.TextIOWrapper`` rather than
+``f.read().decode()``, and CSVs are handed out as bounded row batches or
+DataFrame chunks. Peak memory depends on the chunk size, not the file size.
+"""
+import csv
+import io
+from itertools import islice
+
+CHUNK_ROWS = 5000
+
+
+def open_text(upload, encoding='utf-8'):
+    """Text stream over an ``UploadedFile`` that decodes as it reads."""
+    upload.seek(0)
+    return io.TextIOWrapper(upload.file, encoding=encoding, newline='')
+
+
+def peek_char(stream):
+    """First non-whitespace character of a seekable text stream, without consuming it."""
+    pos = stream.tell()
+    while True:
+        ch = stream.read(1)
+        if not ch or not ch.isspace():
+            break
+    stream.seek(pos)
+    return ch
+
+
+def batched(iterable, size=CHUNK_ROWS):
+    it = iter(iterable)
+    while batch := list(islice(it, size)):
+        yield batch
+
+
+def iter_csv_rows(upload, encoding='utf-8'):
+    """Yield ``csv.reader`` rows from an upload without decoding it all at once."""
+    yield from csv.reader(open_text(upload, encoding))
+
+
+def iter_csv_frames(upload, encoding='utf-8', chunksize=CHUNK_ROWS, stream=None, **read_csv_kwargs):
+    """Yield DataFrame chunks of a CSV upload with stripped, lower-cased column names."""
+    import pandas as pd
+    stream = stream or open_text(upload, encoding)
+    for frame in pd.read_csv(stream, chunksize=chunksize, **read_csv_kwargs):
+        frame.columns = [str(c).strip().lower() for c in frame.columns]
+        yield frame
@@ -0,0 +1,123 @@
+"""
+Background jobs on the ``jobs`` worker pool.
+
+A ``Job`` row is created in the request and handed to the pool once the
+surrounding transaction commits. The worker looks up the handler for the
+job's ``kind`` in ``JOB_HANDLERS`` and calls ``handler(job, progress)``.
+The handler returns a JSON-serialisable result. It can call
+``progress(fraction, message)`` to update the row, which status endpoints
+poll. Handlers are referenced by dotted path so spawned workers can import
+them.
+
+The submitting process touches ``heartbeat_at`` on its queued and running
+jobs every ``JOB_HEARTBEAT_SECONDS``. If that process goes away (a recycled
+web worker takes its pool with it), the heartbeat stops and
+``fail_orphaned_jobs`` marks the job failed. The sweep runs on each
+process's first request and whenever job status is read.
+"""
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+from .workers import pool_submit
+
+JOB_HANDLERS = {
+    'optimize_routes': 'backend_api.optimization.run_optimization_job',
+    'bulk_delete': 'backend_api.deletion.run_delete_job',
+    'recompute_assignments': 'backend_api.assignments.run_recompute_job',
+}
+
+JOB_HEARTBEAT_SECONDS = 30
+JOB_ORPHAN_AFTER_SECONDS = 180
+
+_pending = set()
+_pending_lock = threading.Lock()
+_heartbeat_thread = None
+
+
+def submit_job(kind, params=None, user=None):
+    """Create a queued job and start it on the pool after the transaction commits."""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = Job.objects.create(kind=kind, params=params or {}, created_by=user, heartbeat_at=timezone.now())
+    transaction.on_commit(lambda: _start(job.pk))
+    return job
+
+
+def _start(job_id):
+    global _heartbeat_thread
+    with _pending_lock:
+        _pending.add(job_id)
+        if _heartbeat_thread is None or not _heartbeat_thread.is_alive():
+            _heartbeat_thread = threading.Thread(target=_heartbeat, name='job-heartbeat', daemon=True)
+            _heartbeat_thread.start()
+    future = pool_submit(run_job, job_id, pool='jobs')
+    future.add_done_callback(lambda _: _finished(job_id))
+
+
+def _finished(job_id):
+    with _pending_lock:
+        _pending.discard(job_id)
+
+
+def _heartbeat():
+    while True:
+        time.sleep(JOB_HEARTBEAT_SECONDS)
+        with _pending_lock:
+            job_ids = list(_pending)
+        if not job_ids:
+            continue
+        try:
+            Job.objects.filter(pk__in=job_ids, status__in=('queued', 'running')).update(heartbeat_at=timezone.now())
+        except DatabaseError:
+            pass
+        finally:
+            connection.close()
+
+
+def fail_orphaned_jobs():
+    """Mark queued/running jobs whose submitting process stopped heartbeating as failed."""
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=JOB_ORPHAN_AFTER_SECONDS)
+    return (Job.objects.filter(status__in=('queued', 'running'))
+            .filter(Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, created_at__lt=cutoff))
+            .update(status='failed', message='Worker lost before the job finished', finished_at=now))
+
+
+def fail_orphaned_jobs_on_first_request(**kwargs):
+    """``request_started`` receiver that sweeps once per process, then disconnects."""
+    from django.core.signals import request_started
+    request_started.disconnect(fail_orphaned_jobs_on_first_request)
+    fail_orphaned_jobs()
+
+
+def _update(job_id, **fields):
+    Job.objects.filter(pk=job_id).update(heartbeat_at=timezone.now(), **fields)
+
+
+def run_job(job_id):
+    """Pool entry point: run one job and record its outcome on the row."""
+    close_old_connections()
+    try:
+        job = Job.objects.get(pk=job_id)
+        _update(job_id, status='running', started_at=timezone.now(), message='Started')
+
+        def progress(fraction, message=''):
+            _update(job_id, progress=min(max(float(fraction), 0.0), 1.0), message=message[:255])
+
+        result = import_string(JOB_HANDLERS[job.kind])(job, progress)
+        _update(job_id, status='succeeded', progress=1.0, message='Done',
+                result=result, finished_at=timezone.now())
+    except Exception as e:
+        _update(job_id, status='failed', message=str(e)[:255],
+                error=traceback.format_exc(), finished_at=timezone.now())
+    finally:
+        close_old_connections()
+    return job_id
@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from backend_api.assignments import recompute_assignments
+
+
+class Command(BaseCommand):
+    help = "Recompute the nearest active bus stop of every located, active employee."
+
+    def handle(self, *args, **options):
+        t0 = time.perf_counter()
+        written = recompute_assignments()
+        self.stdout.write(self.style.SUCCESS(
+            f"Assigned {written} employees in {time.perf_counter() - t0:.2f}s"
+        ))
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:34
+
+from math import cos, radians
+
+import numpy as np
+from django.db import migrations, models
+
+# Frozen copy of backend_api.simplify.significance_m as of this migration, so
+# later changes to the app module cannot change what this backfill writes.
+EARTH_RADIUS_M = 6371000.0
+
+
+def _segment_distances(x, y, a, b):
+    px, py = x[a + 1:b], y[a + 1:b]
+    dx, dy = x[b] - x[a], y[b] - y[a]
+    length2 = dx * dx + dy * dy
+    if length2 == 0.0:
+        return np.hypot(px - x[a], py - y[a])
+    t = np.clip(((px - x[a]) * dx + (py - y[a]) * dy) / length2, 0.0, 1.0)
+    return np.hypot(px - (x[a] + t * dx), py - (y[a] + t * dy))
+
+
+def significance_m(lats, lngs):
+    n = len(lats)
+    if n == 0:
+        return []
+    sig = np.zeros(n, dtype=np.float64)
+    sig[0] = sig[-1] = np.inf
+    if n > 2:
+        lats = np.asarray(lats, dtype=np.float64)
+        k = radians(1.0) * EARTH_RADIUS_M
+        x = np.asarray(lngs, dtype=np.float64) * k * cos(radians(float(lats.mean())))
+        y = lats * k
+        stack = [(0, n - 1, np.inf)]
+        while stack:
+            a, b, cap = stack.pop()
+            if b - a < 2:
+                continue
+            dist = _segment_distances(x, y, a, b)
+            i = int(np.argmax(dist))
+            s = min(float(dist[i]), cap)
+            sig[a + 1 + i] = s
+            stack.append((a, a + 1 + i, s))
+            stack.append((a + 1 + i, b, s))
+    return [None if np.isinf(v) else float(v) for v in sig]
+
+
+def backfill_significance(apps, schema_editor):
+    Route = apps.get_model('backend_api', 'Route')
+    RouteTrackPoint = apps.get_model('backend_api', 'RouteTrackPoint')
+    for route_id in Route.objects.values_list('id', flat=True).iterator():
+        points = list(RouteTrackPoint.objects.filter(route_id=route_id).order_by('order'))
+        if not points:
+            continue
+        sig = significance_m([p.latitude for p in points], [p.longitude for p in points])
+        for p, s in zip(points, sig):
+            p.significance_m = s
+        RouteTrackPoint.objects.bulk_update(points, ['significance_m'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend_api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='routetrackpoint',
+            name='significance_m',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_significance, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:41
+
+from django.db import migrations, models
+from django.db.models import Max, Min
+
+
+def backfill_bounding_boxes(apps, schema_editor):
+    CoverageMesh = apps.get_model('backend_api', 'CoverageMesh')
+    CoverageMeshPoint = apps.get_model('backend_api', 'CoverageMeshPoint')
+    boxes = (CoverageMeshPoint.objects.values('mesh_id')
+             .annotate(min_lat=Min('latitude'), min_lng=Min('longitude'),
+                       max_lat=Max('latitude'), max_lng=Max('longitude')))
+    for box in boxes:
+        CoverageMesh.objects.filter(pk=box['mesh_id']).update(
+            min_latitude=box['min_lat'], min_longitude=box['min_lng'],
+            max_latitude=box['max_lat'], max_longitude=box['max_lng'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend_api', '0002_routetrackpoint_significance_m'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coveragemesh',
+            name='max_latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='coveragemesh',
+            name='max_longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='coveragemesh',
+            name='min_latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='coveragemesh',
+            name='min_longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='coveragemeshpoint',
+            name='polygon',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='coveragemeshpoint',
+            name='ring',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_bounding_boxes, migrations.RunPython.noop),
+    ]
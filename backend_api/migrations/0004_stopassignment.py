@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_alter_user_employee_id_alter_user_employee_status_and_more'),
+        ('backend_api', '0003_coveragemesh_polygons'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StopAssignment',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stop_assignment', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('distance_m', models.FloatField()),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('stop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='assignments', to='backend_api.busstop')),
+            ],
+        ),
+    ]
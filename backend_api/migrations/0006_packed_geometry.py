@@ -0,0 +1,63 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:55
+
+from itertools import groupby
+
+import numpy as np
+from django.db import migrations, models
+
+
+# Frozen copies of the backend_api.packing layouts as of this migration.
+def _pack(*columns):
+    return np.column_stack([np.asarray(c, dtype='<f8') for c in columns]).tobytes()
+
+
+def pack_track(lats, lngs, significance):
+    sig = np.array([np.nan if s is None else s for s in significance], dtype='<f8')
+    return _pack(lats, lngs, sig)
+
+
+def pack_mesh(polygons, rings, lats, lngs):
+    # Rows arrive ordered by polygon, ring, order already.
+    return _pack(polygons, rings, lats, lngs)
+
+
+def pack_existing_geometry(apps, schema_editor):
+    Route = apps.get_model('backend_api', 'Route')
+    RouteTrackPoint = apps.get_model('backend_api', 'RouteTrackPoint')
+    CoverageMesh = apps.get_model('backend_api', 'CoverageMesh')
+    CoverageMeshPoint = apps.get_model('backend_api', 'CoverageMeshPoint')
+
+    rows = (RouteTrackPoint.objects.order_by('route_id', 'order')
+            .values_list('route_id', 'latitude', 'longitude', 'significance_m')
+            .iterator(chunk_size=5000))
+    for route_id, points in groupby(rows, key=lambda row: row[0]):
+        _, lats, lngs, sig = zip(*points)
+        Route.objects.filter(pk=route_id).update(track=pack_track(lats, lngs, sig))
+
+    rows = (CoverageMeshPoint.objects.order_by('mesh_id', 'polygon', 'ring', 'order')
+            .values_list('mesh_id', 'polygon', 'ring', 'latitude', 'longitude')
+            .iterator(chunk_size=5000))
+    for mesh_id, points in groupby(rows, key=lambda row: row[0]):
+        _, polygons, rings, lats, lngs = zip(*points)
+        CoverageMesh.objects.filter(pk=mesh_id).update(geometry=pack_mesh(polygons, rings, lats, lngs))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend_api', '0005_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coveragemesh',
+            name='geometry',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='track',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.RunPython(pack_existing_geometry, migrations.RunPython.noop),
+    ]
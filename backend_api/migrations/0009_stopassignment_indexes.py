@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-17 05:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend_api', '0008_job_heartbeat_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stopassignment',
+            index=models.Index(fields=['latitude', 'longitude'], name='backend_api_latitud_874af6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stopassignment',
+            index=models.Index(fields=['distance_m'], name='backend_api_distanc_2d1df8_idx'),
+        ),
+    ]
@@ -20,10 +20,30 @@ class BusStop(models.Model):
     def __str__(self):
         return f"{self.name or self.stop_id}"
 
+class StopAssignment(models.Model):
+    """Materialized nearest active stop for an employee's registered location."""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='stop_assignment')
+    stop = models.ForeignKey(BusStop, on_delete=models.CASCADE, related_name='assignments')
+    distance_m = models.FloatField()
+    # Location the assignment was computed for; a mismatch means it is stale
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    computed_at = models.DateTimeField(auto_now=True)
+    class Meta:
+        # Bounding-box and max-distance lookups in assignments.refresh_for_stops
+        indexes = [models.Index(fields=['latitude', 'longitude']), models.Index(fields=['distance_m'])]
+
 class CoverageMesh(models.Model):
     name = models.CharField(max_length=100)
     version = models.CharField(max_length=50)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bounding box of all vertices, filled on upload
+    min_latitude = models.FloatField(null=True, blank=True)
+    min_longitude = models.FloatField(null=True, blank=True)
+    max_latitude = models.FloatField(null=True, blank=True)
+    max_longitude = models.FloatField(null=True, blank=True)
+    # Packed (polygon, ring, lat, lng) float64 rows, see backend_api.packing
+    geometry = models.BinaryField(null=True, blank=True, editable=False)
     def __str__(self):
         return f"{self.name} v{self.version}"
 
@@ -32,6 +52,9 @@ class CoverageMeshPoint(models.Model):
     latitude = models.FloatField()
     longitude = models.FloatField()
     order = models.IntegerField()
+    # Polygon index within the mesh and ring within the polygon (0 = exterior, >0 = holes)
+    polygon = models.IntegerField(default=0)
+    ring = models.IntegerField(default=0)
     class Meta:
         ordering = ['order']
 
@@ -53,6 +76,8 @@ class Route(models.Model):
     route_name = models.CharField(max_length=150)
     shift = models.CharField(max_length=20, choices=SHIFT_CHOICES, blank=True)
     color = models.CharField(max_length=7, default="#2E86DE")
+    # Packed (lat, lng, significance_m) float64 rows, see backend_api.packing
+    track = models.BinaryField(null=True, blank=True, editable=False)
     def __str__(self):
         return f"{self.route_name}"
 
@@ -70,5 +95,35 @@ class RouteTrackPoint(models.Model):
     latitude = models.FloatField()
     longitude = models.FloatField()
     order = models.IntegerField()
+    # Largest Douglas-Peucker tolerance (m) that keeps this point; null = always kept
+    significance_m = models.FloatField(null=True, blank=True)
+    class Meta:
+        ordering = ['order']
+
+class Job(models.Model):
+    """Background task run on the shared worker pool (see ``backend_api.jobs``)."""
+    STATUS_CHOICES = [
+        ('queued', 'queued'),
+        ('running', 'running'),
+        ('succeeded', 'succeeded'),
+        ('failed', 'failed'),
+    ]
+    kind = models.CharField(max_length=50)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    # Fraction complete in [0, 1] and a short description of the current step
+    progress = models.FloatField(default=0.0)
+    message = models.CharField(max_length=255, blank=True)
+    params = models.JSONField(default=dict, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name='jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Touched while the submitting process is alive; stale = orphaned job
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
     class Meta:
-        ordering = ['order']
\ No newline at end of file
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['kind', 'status'])]
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
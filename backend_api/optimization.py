@@ -0,0 +1,228 @@
+"""
+Route optimization: build a candidate ``RoutePlan`` from active employees and stops.
+
+For every shift:
+
+1. Each located employee is assigned to the nearest active stop within
+   ``max_walk_m``. Stops with riders become the nodes to visit, with the rider
+   count as demand. A stop busier than one bus is split into several visits.
+2. A depot (the plant) plus the nodes form a distance matrix, computed once.
+3. Clarke-Wright savings builds capacity-feasible routes. Only each node's
+   ``NEIGHBOURS`` nearest nodes are considered as merge candidates, which
+   keeps the merge loop near-linear in the number of nodes.
+4. Every route is improved with 2-opt. Each pass evaluates all segment
+   reversals of the route in one NumPy expression.
+
+Routes are pick-up runs: they start at the stop farthest from the plant and
+end at the plant. The solver is pure NumPy/Python and runs in a pool worker
+through the ``optimize_routes`` job (see ``backend_api.jobs``).
+"""
+import time
+
+import numpy as np
+from django.db import transaction
+
+from accounts.models import User
+from .caching import bump_version
+from .geo import distance_matrix, haversine_m
+from .gpx import ParsedRoute
+from .importers import create_route_plan, save_parsed_route
+from .models import BusStop, Route
+from .simplify import significance_m
+from .spatial import StopIndex
+
+NEIGHBOURS = 40
+MAX_NODES = 5000
+ROUTE_COLORS = ['#2E86DE', '#E74C3C', '#27AE60', '#F39C12', '#8E44AD', '#16A085', '#D35400', '#2C3E50']
+
+# User.shift holds either the code or the display label of a shift.
+_ROUTE_SHIFTS = {code for code, _ in Route.SHIFT_CHOICES}
+_SHIFT_CODES = {**{label: code for label, code in User.SHIFT_CHOICES}, **{c: c for c in _ROUTE_SHIFTS}}
+
+
+def savings_routes(dist, demand, capacity, max_route_m=None, neighbours=NEIGHBOURS):
+    """Clarke-Wright savings over ``dist`` (node 0 is the depot).
+
+    ``demand[i]`` is the load of node ``i + 1``. Returns routes as lists of
+    node indices (1-based, depot excluded).
+    """
+    n = len(demand)
+    if n == 0:
+        return []
+    depot = dist[0, 1:]
+    routes = {i: [i] for i in range(n)}
+    route_of = np.arange(n)
+    load = {i: int(demand[i]) for i in range(n)}
+    length = {i: 2.0 * depot[i] for i in range(n)}
+
+    if n > 1:
+        k = min(neighbours, n - 1)
+        inner = dist[1:, 1:].copy()
+        np.fill_diagonal(inner, np.inf)
+        cand = np.argpartition(inner, k - 1, axis=1)[:, :k]
+        a = np.repeat(np.arange(n), k)
+        b = cand.ravel()
+        pairs = np.unique(np.minimum(a, b) * n + np.maximum(a, b))
+        a, b = pairs // n, pairs % n
+        saving = depot[a] + depot[b] - inner[a, b]
+        order = np.argsort(-saving, kind='stable')
+        order = order[saving[order] > 0]
+
+        for i, j, s in zip(a[order].tolist(), b[order].tolist(), saving[order].tolist()):
+            ri, rj = route_of[i], route_of[j]
+            if ri == rj or load[ri] + load[rj] > capacity:
+                continue
+            if max_route_m is not None and length[ri] + length[rj] - s > max_route_m:
+                continue
+            left, right = routes[ri], routes[rj]
+            if left[-1] != i:
+                if left[0] != i:
+                    continue
+                left.reverse()
+            if right[0] != j:
+                if right[-1] != j:
+                    continue
+                right.reverse()
+            left.extend(right)
+            route_of[right] = ri
+            load[ri] += load.pop(rj)
+            length[ri] += length.pop(rj) - s
+            del routes[rj]
+
+    return [[i + 1 for i in route] for route in routes.values()]
+
+
+def two_opt(route, dist):
+    """Improve a depot-to-depot tour with best-improvement 2-opt."""
+    tour = np.array([0, *route, 0])
+    if len(route) < 3:
+        return route
+    m = len(tour) - 1  # number of edges
+    i_idx, j_idx = np.triu_indices(m, k=2)
+    while True:
+        a, b = tour[:-1], tour[1:]
+        delta = (dist[a[i_idx], a[j_idx]] + dist[b[i_idx], b[j_idx]]
+                 - dist[a[i_idx], b[i_idx]] - dist[a[j_idx], b[j_idx]])
+        best = int(np.argmin(delta))
+        if delta[best] >= -1e-9:
+            break
+        i, j = i_idx[best], j_idx[best]
+        tour[i + 1:j + 1] = tour[i + 1:j + 1][::-1].copy()
+    return tour[1:-1].tolist()
+
+
+def solve_shift(stop_lats, stop_lngs, riders, depot, capacity, max_route_m=None):
+    """Plan routes for one shift.
+
+    ``riders`` is the rider count per stop position. Returns a list of routes,
+    each a list of ``(stop_position, riders)`` in pick-up order.
+    """
+    # Split stops that fill more than one bus into several visits.
+    visits = []
+    for pos, count in enumerate(riders):
+        while count > 0:
+            visits.append((pos, min(count, capacity)))
+            count -= capacity
+    if len(visits) + 1 > MAX_NODES:
+        raise ValueError(f"Too many stops to plan in one shift ({len(visits)}, max {MAX_NODES - 1})")
+    positions = np.array([p for p, _ in visits], dtype=np.int64)
+    demand = np.array([d for _, d in visits], dtype=np.int64)
+    lats = np.concatenate(([depot[0]], np.asarray(stop_lats)[positions]))
+    lngs = np.concatenate(([depot[1]], np.asarray(stop_lngs)[positions]))
+    dist = distance_matrix(lats, lngs, lats, lngs)
+
+    routes = []
+    for route in savings_routes(dist, demand, capacity, max_route_m):
+        route = two_opt(route, dist)
+        # Pick-up direction: start at the end farther from the plant.
+        if dist[0, route[0]] < dist[0, route[-1]]:
+            route.reverse()
+        routes.append([(int(positions[v - 1]), int(demand[v - 1])) for v in route])
+    return routes
+
+
+def _employees(shifts):
+    qs = User.objects.filter(is_active=True, latitude__isnull=False, longitude__isnull=False)
+    if shifts:
+        qs = qs.filter(shift__in=shifts)
+    return qs
+
+
+def optimize(params, progress=lambda fraction, message='': None):
+    """Build and save a plan from ``RunOptimizationSerializer`` data; returns a summary."""
+    timings = {}
+    t0 = time.perf_counter()
+    capacity = params['vehicle_capacity']
+    depot = (params['depot_latitude'], params['depot_longitude'])
+    max_walk_m = params.get('max_walk_m')
+    max_route_m = params.get('max_route_m')
+
+    stops = list(BusStop.objects.filter(is_active=True).values_list('id', 'stop_id', 'name', 'latitude', 'longitude'))
+    if not stops:
+        raise ValueError("No active bus stops")
+    _, stop_codes, stop_names, stop_lats, stop_lngs = zip(*stops)
+    index = StopIndex(np.arange(len(stops)), stop_lats, stop_lngs)
+
+    employees = list(_employees(params.get('shifts')).values_list('shift', 'latitude', 'longitude'))
+    timings['load'] = time.perf_counter() - t0
+    progress(0.05, f"Loaded {len(employees)} employees and {len(stops)} stops")
+
+    shifts = sorted({shift for shift, _, _ in employees})
+    solved = []
+    unassigned = 0
+    for n, shift in enumerate(shifts):
+        rows = [(la, lo) for s, la, lo in employees if s == shift]
+        nearest, walk = index.nearest_each(*zip(*rows))
+        ok = walk <= max_walk_m if max_walk_m is not None else np.ones(len(walk), dtype=bool)
+        unassigned += int((~ok).sum())
+        riders = np.bincount(nearest[ok], minlength=len(stops))
+        routes = solve_shift(stop_lats, stop_lngs, riders, depot, capacity, max_route_m)
+        solved.append((shift, routes))
+        progress(0.05 + 0.85 * (n + 1) / len(shifts), f"Planned shift {shift}: {len(routes)} routes")
+    timings['solve'] = time.perf_counter() - t0 - timings['load']
+
+    summary = []
+    with transaction.atomic():
+        plan = create_route_plan(params['plan_name'], params.get('bus_supplier', ''), params.get('activate', False))
+        for shift, routes in solved:
+            code = _SHIFT_CODES.get(shift, '')
+            for r, route in enumerate(routes, start=1):
+                lats = [stop_lats[p] for p, _ in route] + [depot[0]]
+                lngs = [stop_lngs[p] for p, _ in route] + [depot[1]]
+                parsed = ParsedRoute(
+                    name=f"{shift} R{r:02d}",
+                    source='optimizer',
+                    stops=[(stop_names[p] or stop_codes[p], stop_lats[p], stop_lngs[p]) for p, _ in route],
+                )
+                parsed.track_lats.extend(lats)
+                parsed.track_lngs.extend(lngs)
+                parsed.significance = significance_m(lats, lngs)
+                saved = save_parsed_route(plan, parsed, parsed.name, code)
+                Route.objects.filter(pk=saved['route_id']).update(color=ROUTE_COLORS[(r - 1) % len(ROUTE_COLORS)])
+                path_m = float(np.sum(haversine_m(lats[:-1], lngs[:-1], lats[1:], lngs[1:])))
+                summary.append({
+                    "route_id": saved['route_id'],
+                    "route_name": parsed.name,
+                    "shift": shift,
+                    "stops": len(route),
+                    "riders": sum(d for _, d in route),
+                    "distance_m": round(path_m, 1),
+                })
+    timings['save'] = time.perf_counter() - t0 - timings['load'] - timings['solve']
+    # Runs in a pool worker: only reaches the web processes through the shared cache.
+    bump_version('active_plan', 'route_plans')
+
+    return {
+        "plan_id": plan.id,
+        "plan_name": plan.route_plan_name,
+        "routes": summary,
+        "employees": len(employees),
+        "assigned": len(employees) - unassigned,
+        "unassigned": unassigned,
+        "timings_ms": {k: round(v * 1000, 1) for k, v in timings.items()},
+    }
+
+
+def run_optimization_job(job, progress):
+    """``optimize_routes`` job handler."""
+    return optimize(job.params, progress)
@@ -0,0 +1,86 @@
+"""
+Packed geometry columns.
+
+A route's track and a coverage mesh's vertices are stored as one
+little-endian float64 blob on the parent row: ``Route.track`` and
+``CoverageMesh.geometry``. Reading a geometry is then a single-row fetch
+decoded with ``np.frombuffer``, instead of thousands of ordered point rows.
+
+* track: ``(n, 3)`` of latitude, longitude, significance_m (NaN = always kept)
+* mesh:  ``(n, 4)`` of polygon, ring, latitude, longitude in ring order
+
+Uploads only write the blob. The per-vertex ``RouteTrackPoint`` and
+``CoverageMeshPoint`` tables are also filled when ``STORE_GEOMETRY_ROWS`` is
+set, for outside tools that still read them. Readers fall back to those rows
+when a blob is missing, e.g. for rows added by hand in the admin.
+"""
+import numpy as np
+from django.conf import settings
+
+TRACK_COLUMNS = 3
+MESH_COLUMNS = 4
+
+
+def store_geometry_rows():
+    """Whether uploads also write the per-vertex point tables."""
+    return getattr(settings, 'STORE_GEOMETRY_ROWS', False)
+
+
+def _pack(*columns):
+    return np.column_stack([np.asarray(c, dtype='<f8') for c in columns]).tobytes()
+
+
+def _unpack(blob, width):
+    return np.frombuffer(bytes(blob), dtype='<f8').reshape(-1, width)
+
+
+def pack_track(lats, lngs, significance):
+    sig = np.array([np.nan if s is None else s for s in significance], dtype='<f8')
+    return _pack(lats, lngs, sig)
+
+
+def unpack_track(blob, tolerance_m=None):
+    """``(order, lats, lngs)`` arrays, optionally Douglas-Peucker filtered at ``tolerance_m``."""
+    data = _unpack(blob, TRACK_COLUMNS)
+    order = np.arange(len(data))
+    if tolerance_m:
+        sig = data[:, 2]
+        keep = np.isnan(sig) | (sig > tolerance_m)
+        data, order = data[keep], order[keep]
+    return order, data[:, 0], data[:, 1]
+
+
+def track_points(blob):
+    """``(order, latitude, longitude, significance_m)`` tuples; significance is None when always kept."""
+    data = _unpack(blob, TRACK_COLUMNS)
+    sig = [None if np.isnan(v) else v for v in data[:, 2].tolist()]
+    return zip(range(len(data)), data[:, 0].tolist(), data[:, 1].tolist(), sig)
+
+
+def pack_mesh(polygons, rings, lats, lngs):
+    """Pack vertices given in file order, grouping them by (polygon, ring) stably."""
+    polygons = np.asarray(polygons, dtype='<f8')
+    rings = np.asarray(rings, dtype='<f8')
+    order = np.lexsort((np.arange(len(polygons)), rings, polygons))
+    return _pack(polygons[order], rings[order], np.asarray(lats)[order], np.asarray(lngs)[order])
+
+
+def unpack_mesh(blob):
+    """``(polygon, ring, lats, lngs)`` per ring, in storage order."""
+    data = _unpack(blob, MESH_COLUMNS)
+    if not len(data):
+        return []
+    keys = data[:, :2]
+    starts = np.flatnonzero(np.r_[True, np.any(keys[1:] != keys[:-1], axis=1)])
+    ends = np.r_[starts[1:], len(data)]
+    return [
+        (int(data[s, 0]), int(data[s, 1]), data[s:e, 2], data[s:e, 3])
+        for s, e in zip(starts, ends)
+    ]
+
+
+def mesh_points(blob):
+    """``(polygon, ring, order, latitude, longitude)`` tuples, ``order`` being the storage position."""
+    data = _unpack(blob, MESH_COLUMNS)
+    return zip(data[:, 0].astype(int).tolist(), data[:, 1].astype(int).tolist(), range(len(data)),
+               data[:, 2].tolist(), data[:, 3].tolist())
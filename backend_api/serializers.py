@@ -1,6 +1,10 @@
+from django.db.models import Q
+from django.utils import timezone
 from rest_framework import serializers
 from accounts.models import User
-from .models import BusStop, CoverageMesh, CoverageMeshPoint, RoutePlan, Route, RouteStopPoint, RouteTrackPoint
+from .models import BusStop, CoverageMesh, CoverageMeshPoint, Job, RoutePlan, Route, RouteStopPoint, RouteTrackPoint
+from .encoding import encode_coords
+from .packing import pack_mesh, store_geometry_rows, unpack_track
 
 class UserListSerializer(serializers.ModelSerializer):
     class Meta:
@@ -32,7 +36,7 @@ class BusStopSerializer(serializers.ModelSerializer):
 class CoverageMeshPointSerializer(serializers.ModelSerializer):
     class Meta:
         model = CoverageMeshPoint
-        fields = ['latitude', 'longitude', 'order']
+        fields = ['latitude', 'longitude', 'order', 'polygon', 'ring']
 
 class CoverageMeshSerializer(serializers.ModelSerializer):
     points = CoverageMeshPointSerializer(many=True)
@@ -42,12 +46,39 @@ class CoverageMeshSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
     def create(self, validated_data):
         points = validated_data.pop('points', [])
+        if points:
+            lats = [pt['latitude'] for pt in points]
+            lngs = [pt['longitude'] for pt in points]
+            validated_data.update(
+                min_latitude=min(lats), max_latitude=max(lats),
+                min_longitude=min(lngs), max_longitude=max(lngs),
+            )
+            ordered = sorted(points, key=lambda pt: pt['order'])
+            validated_data['geometry'] = pack_mesh(
+                [pt.get('polygon', 0) for pt in ordered], [pt.get('ring', 0) for pt in ordered],
+                [pt['latitude'] for pt in ordered], [pt['longitude'] for pt in ordered],
+            )
         mesh = CoverageMesh.objects.create(**validated_data)
-        CoverageMeshPoint.objects.bulk_create([
-            CoverageMeshPoint(mesh=mesh, **pt) for pt in points
-        ])
+        if store_geometry_rows():
+            CoverageMeshPoint.objects.bulk_create([
+                CoverageMeshPoint(mesh=mesh, **pt) for pt in points
+            ])
         return mesh
 
+class CoverageMeshSummarySerializer(serializers.ModelSerializer):
+    """Mesh metadata without geometry; expects a ``points_count`` annotation."""
+    points_count = serializers.IntegerField(read_only=True)
+    bbox = serializers.SerializerMethodField()
+    class Meta:
+        model = CoverageMesh
+        fields = ['id', 'name', 'version', 'created_at', 'points_count', 'bbox']
+        read_only_fields = fields
+    def get_bbox(self, mesh):
+        # GeoJSON order: [min_lng, min_lat, max_lng, max_lat]
+        if mesh.min_latitude is None:
+            return None
+        return [mesh.min_longitude, mesh.min_latitude, mesh.max_longitude, mesh.max_latitude]
+
 class RouteTrackPointSerializer(serializers.ModelSerializer):
     class Meta:
         model = RouteTrackPoint
@@ -60,10 +91,19 @@ class RouteStopPointSerializer(serializers.ModelSerializer):
 
 class RouteSerializer(serializers.ModelSerializer):
     stops = RouteStopPointSerializer(many=True, read_only=True)
-    trackpoints = RouteTrackPointSerializer(many=True, read_only=True)
+    trackpoints = serializers.SerializerMethodField()
     class Meta:
         model = Route
         fields = ['id', 'route_name', 'shift', 'color', 'stops', 'trackpoints']
+    def get_trackpoints(self, route):
+        # Decoded from the packed track; routes without one use the (prefetched) rows.
+        if route.track is None:
+            return RouteTrackPointSerializer(route.trackpoints.all(), many=True).data
+        order, lats, lngs = unpack_track(route.track, self.context.get('tolerance_m'))
+        return [
+            {'latitude': lat, 'longitude': lng, 'order': i}
+            for i, lat, lng in zip(order.tolist(), lats.tolist(), lngs.tolist())
+        ]
 
 class RoutePlanSerializer(serializers.ModelSerializer):
     routes = RouteSerializer(many=True, read_only=True)
@@ -72,5 +112,108 @@ class RoutePlanSerializer(serializers.ModelSerializer):
         fields = ['id', 'route_plan_name', 'bus_supplier', 'is_active', 'created_at', 'routes']
         read_only_fields = ['id', 'created_at']
 
+def kept_at_tolerance(tolerance_m):
+    """Filter for trackpoints that survive Douglas-Peucker at ``tolerance_m`` metres."""
+    return Q(significance_m__isnull=True) | Q(significance_m__gt=tolerance_m)
+
+
+def compact_routes(plans, encoding, tolerance_m=None):
+    """Encoded routes of ``plans`` keyed by plan id, in three queries however many plans."""
+    plan_ids = [plan.pk for plan in plans]
+    routes = list(Route.objects.filter(plan_id__in=plan_ids)
+                  .order_by('id').values('id', 'plan_id', 'route_name', 'shift', 'color', 'track'))
+    track = {r['id']: ([], []) for r in routes}
+    stops = {r['id']: ([], [], []) for r in routes}
+    for r in routes:
+        blob = r.pop('track')
+        if blob is not None:
+            track[r['id']] = unpack_track(blob, tolerance_m)[1:]
+    trackpoints = RouteTrackPoint.objects.filter(route__plan_id__in=plan_ids, route__track__isnull=True)
+    if tolerance_m:
+        trackpoints = trackpoints.filter(kept_at_tolerance(tolerance_m))
+    for route_id, lat, lng in (trackpoints
+                               .order_by('route_id', 'order')
+                               .values_list('route_id', 'latitude', 'longitude')):
+        track[route_id][0].append(lat)
+        track[route_id][1].append(lng)
+    for route_id, name, lat, lng in (RouteStopPoint.objects.filter(route__plan_id__in=plan_ids)
+                                     .order_by('route_id', 'order')
+                                     .values_list('route_id', 'stop_name', 'latitude', 'longitude')):
+        stops[route_id][0].append(name)
+        stops[route_id][1].append(lat)
+        stops[route_id][2].append(lng)
+    by_plan = {plan_id: [] for plan_id in plan_ids}
+    for r in routes:
+        names, stop_lats, stop_lngs = stops[r['id']]
+        r['encoding'] = encoding
+        r['trackpoints'] = encode_coords(encoding, *track[r['id']])
+        r['stops'] = encode_coords(encoding, stop_lats, stop_lngs)
+        r['stop_names'] = names
+        by_plan[r.pop('plan_id')].append(r)
+    return by_plan
+
+
+class CompactRoutePlanListSerializer(serializers.ListSerializer):
+    """Loads the routes of every plan on the page up front instead of per plan."""
+
+    def to_representation(self, data):
+        plans = list(data.all() if hasattr(data, 'all') else data)
+        self.child.routes_by_plan = compact_routes(
+            plans, self.context['encoding'], self.context.get('tolerance_m')
+        )
+        return super().to_representation(plans)
+
+
+class CompactRoutePlanSerializer(serializers.ModelSerializer):
+    """Route plan with each route's trackpoints and stops packed into one encoded string.
+
+    The encoding ('polyline' or 'binary') is read from ``context['encoding']`` and
+    an optional simplification tolerance from ``context['tolerance_m']``.
+    Tracks are decoded from ``Route.track``; rows are only read for routes
+    without a packed track. No point model instances are built, and a list of
+    plans is loaded in a constant number of queries.
+    """
+    routes = serializers.SerializerMethodField()
+    routes_by_plan = None
+
+    class Meta:
+        model = RoutePlan
+        fields = ['id', 'route_plan_name', 'bus_supplier', 'is_active', 'created_at', 'routes']
+        read_only_fields = fields
+        list_serializer_class = CompactRoutePlanListSerializer
+
+    def get_routes(self, plan):
+        if self.routes_by_plan is not None and plan.pk in self.routes_by_plan:
+            return self.routes_by_plan[plan.pk]
+        return compact_routes([plan], self.context['encoding'], self.context.get('tolerance_m'))[plan.pk]
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'kind', 'status', 'progress', 'message', 'params', 'result',
+            'error', 'created_by', 'created_at', 'started_at', 'finished_at'
+        ]
+        read_only_fields = fields
+
 class RunOptimizationSerializer(serializers.Serializer):
-    pass
\ No newline at end of file
+    """Parameters of an ``optimize_routes`` job; ``save()`` queues the job and returns it."""
+    plan_name = serializers.CharField(max_length=150, required=False)
+    bus_supplier = serializers.CharField(max_length=100, required=False, allow_blank=True, default='')
+    depot_latitude = serializers.FloatField(min_value=-90, max_value=90)
+    depot_longitude = serializers.FloatField(min_value=-180, max_value=180)
+    shifts = serializers.ListField(child=serializers.CharField(max_length=20), required=False, default=list)
+    vehicle_capacity = serializers.IntegerField(min_value=1, default=40)
+    max_walk_m = serializers.FloatField(min_value=0, required=False, allow_null=True, default=1000.0)
+    max_route_m = serializers.FloatField(min_value=1, required=False, allow_null=True, default=None)
+    activate = serializers.BooleanField(default=False)
+
+    def validate(self, attrs):
+        if not BusStop.objects.filter(is_active=True).exists():
+            raise serializers.ValidationError("No active bus stops to plan with")
+        attrs.setdefault('plan_name', f"Optimized {timezone.now():%Y-%m-%d %H:%M}")
+        return attrs
+
+    def create(self, validated_data):
+        from .jobs import submit_job
+        return submit_job('optimize_routes', validated_data, self.context['request'].user)
\ No newline at end of file
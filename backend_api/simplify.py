@@ -0,0 +1,94 @@
+"""
+Douglas-Peucker track simplification.
+
+Instead of storing a copy of the track per tolerance, every vertex gets a
+significance: the largest tolerance (in metres) at which Douglas-Peucker still
+keeps it. Filtering a track on ``significance_m > tolerance`` yields exactly the
+Douglas-Peucker result for that tolerance, so any zoom level can be served
+from the same rows. Endpoints are always kept and get ``None``.
+"""
+from math import ceil, cos, log2, radians
+
+import numpy as np
+
+from .geo import EARTH_RADIUS_M
+
+# Ground resolution of a 256px web-mercator tile at the equator, zoom 0.
+METERS_PER_PIXEL_Z0 = 156543.03392
+MAX_ZOOM = 22
+
+
+def _project_m(lats, lngs):
+    """Equirectangular projection to local metres around the track's mean latitude."""
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    k = radians(1.0) * EARTH_RADIUS_M
+    x = lngs * k * cos(radians(float(lats.mean())))
+    y = lats * k
+    return x, y
+
+
+def _segment_distances(x, y, idx, a, b):
+    """Distances of points ``idx`` to the segments ``(a, b)`` (arrays of equal length)."""
+    px, py = x[idx], y[idx]
+    ax, ay = x[a], y[a]
+    dx, dy = x[b] - ax, y[b] - ay
+    length2 = dx * dx + dy * dy
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = np.where(length2 > 0, ((px - ax) * dx + (py - ay) * dy) / length2, 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    return np.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def significance_m(lats, lngs):
+    """Per-vertex Douglas-Peucker significance in metres (``None`` for endpoints).
+
+    All open segments of one recursion depth are processed together, so the
+    number of NumPy passes is the depth of the split tree rather than the
+    number of vertices.
+    """
+    n = len(lats)
+    if n == 0:
+        return []
+    sig = np.zeros(n, dtype=np.float64)
+    sig[0] = sig[-1] = np.inf
+    if n > 2:
+        x, y = _project_m(lats, lngs)
+        a = np.array([0])
+        b = np.array([n - 1])
+        cap = np.array([np.inf])
+        while len(a):
+            open_ = (b - a) >= 2
+            a, b, cap = a[open_], b[open_], cap[open_]
+            if not len(a):
+                break
+            counts = b - a - 1
+            seg = np.repeat(np.arange(len(a)), counts)
+            starts = np.cumsum(counts) - counts
+            idx = a[seg] + 1 + (np.arange(len(seg)) - starts[seg])
+            dist = _segment_distances(x, y, idx, a[seg], b[seg])
+
+            # Farthest vertex of every segment (first one on ties).
+            best = np.maximum.reduceat(dist, starts)
+            hit = np.flatnonzero(dist == best[seg])
+            _, first = np.unique(seg[hit], return_index=True)
+            split = idx[hit[first]]
+
+            # A vertex is only examined if its parent split survived, so its
+            # significance can never exceed the parent's.
+            s = np.minimum(best, cap)
+            sig[split] = s
+            a, b, cap = np.concatenate((a, split)), np.concatenate((split, b)), np.concatenate((s, s))
+    return [None if np.isinf(v) else float(v) for v in sig]
+
+
+def zoom_to_tolerance_m(zoom, latitude=0.0):
+    """Tolerance of one screen pixel at a web-map zoom level."""
+    zoom = min(max(zoom, 0), MAX_ZOOM)
+    return METERS_PER_PIXEL_Z0 * cos(radians(latitude)) / (2 ** zoom)
+
+
+def snap_tolerance_m(tolerance_m):
+    """Largest zoom-ladder tolerance not above ``tolerance_m`` (clamped to the ladder's ends)."""
+    zoom = ceil(log2(METERS_PER_PIXEL_Z0 / tolerance_m) - 1e-9)
+    return zoom_to_tolerance_m(zoom)
@@ -0,0 +1,212 @@
+"""
+Process-level spatial index over active bus stops.
+
+Stops are bucketed into a regular lat/lng grid and kept as NumPy arrays of
+unit-sphere coordinates, so k-nearest and radius lookups only touch the grid
+cells around the query point instead of every row in the table.
+
+The index is built lazily on first use and rebuilt when the stop set changes.
+Writers call ``invalidate_stop_index()``, which bumps the ``stops`` cache
+version so other workers sharing that cache rebuild on their next lookup;
+``STOP_INDEX_TTL`` bounds staleness when the cache is per-process.
+"""
+import threading
+import time
+from math import radians, cos, ceil, floor
+
+import numpy as np
+from django.conf import settings
+
+from .caching import bump_version, get_version
+from .geo import EARTH_RADIUS_M, chord_to_m, to_unit_xyz
+from .models import BusStop
+
+CELL_DEG = 0.01  # ~1.1 km in latitude
+MAX_RINGS = 50
+MAX_BATCH_CELLS = 4_000_000
+
+_ROW_OFFSET = int(90 / CELL_DEG) + 1
+_COL_COUNT = 2 * (int(180 / CELL_DEG) + 1) + 1
+_COL_OFFSET = int(180 / CELL_DEG) + 1
+
+
+def _cell_key(row, col):
+    return (row + _ROW_OFFSET) * _COL_COUNT + (col + _COL_OFFSET)
+
+
+class StopIndex:
+    """Immutable grid index over (pk, latitude, longitude) triples."""
+
+    def __init__(self, ids, latitudes, longitudes, cell_deg=CELL_DEG):
+        ids = np.asarray(ids, dtype=np.int64)
+        lat = np.asarray(latitudes, dtype=np.float64)
+        lng = np.asarray(longitudes, dtype=np.float64)
+        self.cell_deg = cell_deg
+
+        rows = np.floor(lat / cell_deg).astype(np.int64)
+        cols = np.floor(lng / cell_deg).astype(np.int64)
+        keys = _cell_key(rows, cols)
+        order = np.argsort(keys, kind='stable')
+
+        self.ids = ids[order]
+        self.lat = lat[order]
+        self.lng = lng[order]
+        self.xyz = np.ascontiguousarray(to_unit_xyz(self.lat, self.lng))
+
+        uniq, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+        self._cells = {
+            int(k): (int(s), int(s + c)) for k, s, c in zip(uniq, starts, counts)
+        }
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _cell_of(self, lat, lng):
+        return floor(lat / self.cell_deg), floor(lng / self.cell_deg)
+
+    def _ring_slices(self, row, col, ring):
+        if ring == 0:
+            span = self._cells.get(_cell_key(row, col))
+            return [span] if span else []
+        spans = []
+        for dc in range(-ring, ring + 1):
+            for dr in (-ring, ring):
+                span = self._cells.get(_cell_key(row + dr, col + dc))
+                if span:
+                    spans.append(span)
+        for dr in range(-ring + 1, ring):
+            for dc in (-ring, ring):
+                span = self._cells.get(_cell_key(row + dr, col + dc))
+                if span:
+                    spans.append(span)
+        return spans
+
+    def _distances(self, positions, lat, lng):
+        q = to_unit_xyz([lat], [lng])[0]
+        return chord_to_m(np.linalg.norm(self.xyz[positions] - q, axis=1))
+
+    def _covered_radius_m(self, lat, ring):
+        # Distance from the query to the edge of the searched block of cells,
+        # measured along the narrowest (longitude) axis at the widest latitude.
+        edge_lat = min(90.0, abs(lat) + (ring + 1) * self.cell_deg)
+        return ring * radians(self.cell_deg) * EARTH_RADIUS_M * cos(radians(edge_lat))
+
+    def _select(self, positions, dist, k):
+        if k < len(positions):
+            part = np.argpartition(dist, k - 1)[:k]
+            positions, dist = positions[part], dist[part]
+        order = np.argsort(dist, kind='stable')
+        return list(zip(self.ids[positions[order]].tolist(), dist[order].tolist()))
+
+    def nearest(self, lat, lng, k=1):
+        """Return up to ``k`` ``(stop_pk, distance_m)`` pairs, closest first."""
+        n = len(self.ids)
+        if n == 0 or k <= 0:
+            return []
+        k = min(k, n)
+        row, col = self._cell_of(lat, lng)
+        chunks = []
+        found = 0
+        for ring in range(MAX_RINGS + 1):
+            for start, end in self._ring_slices(row, col, ring):
+                chunks.append(np.arange(start, end))
+                found += end - start
+            if found >= k:
+                positions = np.concatenate(chunks)
+                dist = self._distances(positions, lat, lng)
+                kth = np.partition(dist, k - 1)[k - 1]
+                if kth <= self._covered_radius_m(lat, ring):
+                    return self._select(positions, dist, k)
+        positions = np.arange(n)
+        return self._select(positions, self._distances(positions, lat, lng), k)
+
+    def within(self, lat, lng, radius_m, limit=None):
+        """Return ``(stop_pk, distance_m)`` pairs within ``radius_m``, closest first."""
+        n = len(self.ids)
+        if n == 0 or radius_m < 0:
+            return []
+        row, col = self._cell_of(lat, lng)
+        radius_deg = radius_m / (radians(1.0) * EARTH_RADIUS_M)
+        dr = ceil(radius_deg / self.cell_deg)
+        edge_lat = min(89.9, abs(lat) + radius_deg)
+        dc = ceil(radius_deg / (self.cell_deg * cos(radians(edge_lat))))
+
+        if (2 * dr + 1) * (2 * dc + 1) > len(self._cells):
+            positions = np.arange(n)
+        else:
+            chunks = [
+                np.arange(*span)
+                for r in range(row - dr, row + dr + 1)
+                for c in range(col - dc, col + dc + 1)
+                if (span := self._cells.get(_cell_key(r, c)))
+            ]
+            if not chunks:
+                return []
+            positions = np.concatenate(chunks)
+
+        dist = self._distances(positions, lat, lng)
+        mask = dist <= radius_m
+        positions, dist = positions[mask], dist[mask]
+        k = len(positions) if limit is None else min(limit, len(positions))
+        if k == 0:
+            return []
+        return self._select(positions, dist, k)
+
+    def nearest_each(self, latitudes, longitudes):
+        """Nearest stop for every query point: ``(stop_pks, distances_m)`` arrays.
+
+        Exact brute force over chord distances, chunked so the temporary
+        ``(chunk, stops)`` matrix stays bounded; suited to batch recomputes.
+        """
+        q = to_unit_xyz(latitudes, longitudes)
+        n = len(self.ids)
+        if n == 0 or len(q) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        best = np.empty(len(q), dtype=np.int64)
+        chord = np.empty(len(q), dtype=np.float64)
+        # |a - b|^2 = 2 - 2 a.b on the unit sphere, so the largest dot product wins.
+        step = max(1, MAX_BATCH_CELLS // n)
+        for start in range(0, len(q), step):
+            dots = q[start:start + step] @ self.xyz.T
+            idx = dots.argmax(axis=1)
+            best[start:start + step] = idx
+            top = dots[np.arange(len(idx)), idx]
+            chord[start:start + step] = np.sqrt(np.maximum(2.0 - 2.0 * top, 0.0))
+        return self.ids[best], chord_to_m(chord)
+
+
+_lock = threading.Lock()
+_index = None
+_index_version = None
+_built_at = 0.0
+
+
+def _build():
+    rows = list(BusStop.objects.filter(is_active=True).values_list('id', 'latitude', 'longitude'))
+    if not rows:
+        return StopIndex([], [], [])
+    ids, lats, lngs = zip(*rows)
+    return StopIndex(ids, lats, lngs)
+
+
+def get_stop_index():
+    """Return the current index, rebuilding it if the stop set has changed."""
+    global _index, _index_version, _built_at
+    ttl = getattr(settings, 'STOP_INDEX_TTL', 300)
+    version = get_version('stops')
+    if _index is not None and _index_version == version and time.monotonic() - _built_at < ttl:
+        return _index
+    with _lock:
+        if _index is None or _index_version != version or time.monotonic() - _built_at >= ttl:
+            _index = _build()
+            _index_version = version
+            _built_at = time.monotonic()
+        return _index
+
+
+def invalidate_stop_index():
+    """Drop the cached index here and signal other workers to rebuild theirs."""
+    global _index
+    bump_version('stops')
+    with _lock:
+        _index = None
@@ -1,3 +1,1267 @@
-from django.test import TestCase
+import base64
+import csv
+import io
+import json
+import zipfile
+from array import array
+from functools import partial
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db import models
+from django.db.models import Max, ProtectedError, RestrictedError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import PrivacyConsent, User
+from .assignments import _near_any, assignment_for, recompute_assignments, refresh_for_stops, refresh_for_users
+from .bulkload import _CopyStream, copy_rows
+from .caching import bump_version, cached_payload, get_version
+from .coverage import MeshGeometry, mesh_points_count
+from .deletion import bulk_delete
+from .encoding import encode_binary, encode_polyline
+from .exports import export_rows
+from .geo import distance_matrix, haversine_m
+from .gpx import ParsedRoute, parse_gpx, parse_gpx_payload
+from .importers import RowErrors, mesh_vertices, save_parsed_route
+from .ingest import batched, iter_csv_frames, iter_csv_rows, open_text, peek_char
+from .jobs import run_job
+from .models import BusStop, CoverageMesh, Job, Route, RoutePlan, RouteStopPoint, RouteTrackPoint, StopAssignment
+from .optimization import optimize, savings_routes, solve_shift, two_opt
+from .packing import pack_mesh, pack_track, unpack_mesh, unpack_track
+from .serializers import RouteSerializer
+from .simplify import _project_m, significance_m, snap_tolerance_m, zoom_to_tolerance_m
+from .spatial import StopIndex, invalidate_stop_index
+
+
+def _random_points(n, seed=0, lat=(25.5, 25.9), lng=(-100.5, -100.1)):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(lat[0], lat[1], n), rng.uniform(lng[0], lng[1], n)
+
+
+class StopIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.lats, self.lngs = _random_points(3000)
+        self.ids = np.arange(100, 100 + len(self.lats))
+        self.index = StopIndex(self.ids, self.lats, self.lngs)
+
+    def brute_force(self, lat, lng):
+        dist = haversine_m(lat, lng, self.lats, self.lngs)
+        order = np.argsort(dist, kind='stable')
+        return self.ids[order], dist[order]
+
+    def test_nearest_matches_brute_force(self):
+        for lat, lng in zip(*_random_points(200, seed=1, lat=(25.3, 26.1), lng=(-100.7, -99.9))):
+            ids, dist = self.brute_force(lat, lng)
+            hits = self.index.nearest(lat, lng, k=5)
+            self.assertEqual([pk for pk, _ in hits], ids[:5].tolist())
+            np.testing.assert_allclose([d for _, d in hits], dist[:5], rtol=1e-6)
+
+    def test_nearest_far_outside_the_grid(self):
+        ids, _ = self.brute_force(40.0, -3.7)
+        self.assertEqual(self.index.nearest(40.0, -3.7)[0][0], ids[0])
+
+    def test_within_matches_brute_force(self):
+        ids, dist = self.brute_force(25.7, -100.3)
+        hits = self.index.within(25.7, -100.3, 2500)
+        self.assertEqual([pk for pk, _ in hits], ids[dist <= 2500].tolist())
+        self.assertEqual(len(self.index.within(25.7, -100.3, 2500, limit=3)), 3)
+
+    def test_nearest_each_matches_nearest(self):
+        q_lats, q_lngs = _random_points(300, seed=2)
+        ids, dist = self.index.nearest_each(q_lats, q_lngs)
+        for lat, lng, pk, d in zip(q_lats, q_lngs, ids, dist):
+            best_pk, best_d = self.index.nearest(lat, lng)[0]
+            self.assertEqual(pk, best_pk)
+            self.assertAlmostEqual(d, best_d, delta=1e-3)
+
+    def test_empty_index(self):
+        index = StopIndex([], [], [])
+        self.assertEqual(index.nearest(25.7, -100.3), [])
+        self.assertEqual(index.within(25.7, -100.3, 1000), [])
+
+
+class DistanceMatrixTests(TestCase):
+    def setUp(self):
+        hr = User.objects.create_user(username='hr', password='x' * 10, employee_id='00001', role='HR_Admin')
+        lats, lngs = _random_points(5, seed=31)
+        User.objects.bulk_create(
+            [User(username=f'e{i}', employee_id=f'{100 + i}', latitude=la, longitude=lo, shift='A' if i % 2 else 'B')
+             for i, (la, lo) in enumerate(zip(lats, lngs))]
+            + [User(username='gone', employee_id='999', latitude=25.7, longitude=-100.3, is_active=False)]
+        )
+        stop_lats, stop_lngs = _random_points(3, seed=32)
+        BusStop.objects.bulk_create(
+            [BusStop(stop_id=f'S{i}', name='S', latitude=la, longitude=lo) for i, (la, lo) in enumerate(zip(stop_lats, stop_lngs))]
+            + [BusStop(stop_id='S9', name='Closed', latitude=25.7, longitude=-100.3, is_active=False)]
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(hr)}')
+
+    def test_matrix_matches_haversine(self):
+        data = self.client.get(reverse('distance-matrix')).json()
+        self.assertEqual(data['employees'], ['100', '101', '102', '103', '104'])
+        self.assertEqual(data['stops'], ['S0', 'S1', 'S2'])
+        users = User.objects.filter(employee_id__in=data['employees']).order_by('employee_id')
+        stops = BusStop.objects.filter(stop_id__in=data['stops']).order_by('stop_id')
+        for row, user in zip(data['distances_m'], users):
+            expected = [round(haversine_m(user.latitude, user.longitude, s.latitude, s.longitude), 1) for s in stops]
+            np.testing.assert_allclose(row, expected, atol=0.1)
+
+    def test_filters_narrow_rows_and_columns(self):
+        data = self.client.get(reverse('distance-matrix'), {'shift': 'A', 'stop_ids': 'S2, S9'}).json()
+        self.assertEqual((data['employees'], data['stops']), (['101', '103'], ['S2']))
+        self.assertEqual([len(row) for row in data['distances_m']], [1, 1])
+        empty = self.client.get(reverse('distance-matrix'), {'employee_ids': '999'}).json()
+        self.assertEqual((empty['employees'], empty['distances_m']), ([], []))
+
+    def test_cell_cap(self):
+        with mock.patch('backend_api.views.MAX_MATRIX_CELLS', 14):
+            response = self.client.get(reverse('distance-matrix'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('5 x 3', response.json()['detail'])
+        with mock.patch('backend_api.views.MAX_MATRIX_CELLS', 15):
+            self.assertEqual(self.client.get(reverse('distance-matrix')).status_code, 200)
+
+
+class NearbyStopsTests(TestCase):
+    def setUp(self):
+        lats, lngs = _random_points(30, seed=41)
+        BusStop.objects.bulk_create(
+            [BusStop(stop_id=f'{i:03d}', name='S', latitude=la, longitude=lo) for i, (la, lo) in enumerate(zip(lats, lngs))]
+            + [BusStop(stop_id='999', name='Closed', latitude=25.7, longitude=-100.3, is_active=False)]
+        )
+        invalidate_stop_index()
+        self.user = User.objects.create_user(username='e', password='x' * 10, employee_id='00042',
+                                             latitude=25.7, longitude=-100.3)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_radius_returns_every_stop_inside_closest_first(self):
+        data = self.client.get(reverse('nearby-stops'), {'radius_m': 15000}).json()
+        stops = BusStop.objects.filter(is_active=True)
+        expected = sorted((haversine_m(25.7, -100.3, s.latitude, s.longitude), s.stop_id) for s in stops)
+        expected = [stop_id for d, stop_id in expected if d <= 15000]
+        self.assertTrue(0 < len(expected) < 30)
+        self.assertEqual([row['stop_id'] for row in data], expected)
+        distances = [row['distance_m'] for row in data]
+        self.assertEqual(distances, sorted(distances))
+        self.assertLessEqual(distances[-1], 15000)
+
+    def test_limit_without_radius_returns_nearest(self):
+        data = self.client.get(reverse('nearby-stops'), {'limit': 3}).json()
+        nearest = min(BusStop.objects.filter(is_active=True),
+                      key=lambda s: haversine_m(25.7, -100.3, s.latitude, s.longitude))
+        self.assertEqual(len(data), 3)
+        self.assertEqual(data[0]['stop_id'], nearest.stop_id)
+        self.assertAlmostEqual(data[0]['distance_m'], haversine_m(25.7, -100.3, nearest.latitude, nearest.longitude), 3)
+
+    def test_bad_parameters_are_rejected(self):
+        for params in ({'radius_m': 'far'}, {'limit': 'x'}, {'limit': 0}, {'radius_m': -1}):
+            self.assertEqual(self.client.get(reverse('nearby-stops'), params).status_code, 400, params)
+
+    def test_nearest_stop_reports_distance(self):
+        data = self.client.get(reverse('nearest-stop')).json()
+        self.assertEqual(data['stop']['id'], self.client.get(reverse('nearby-stops'), {'limit': 1}).json()[0]['id'])
+        self.assertGreater(data['distance_m'], 0)
+
+
+class ActivePlanETagTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='emp', password='x' * 10, employee_id='00002')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        plan = RoutePlan.objects.create(route_plan_name='Plan', is_active=True)
+        self.route = Route.objects.create(plan=plan, route_name='R1')
+        RouteTrackPoint.objects.bulk_create([
+            RouteTrackPoint(route=self.route, latitude=25.7 + i / 1000, longitude=-100.3, order=i)
+            for i in range(5)
+        ])
+        self.url = reverse('route-plans-active')
+
+    def test_matching_etag_gets_304(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        again = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again['ETag'], first['ETag'])
+        self.assertEqual(again.content, b'')
+
+    def test_change_and_bump_invalidates_etag(self):
+        first = self.client.get(self.url)
+        Route.objects.filter(pk=self.route.pk).update(route_name='R1 renamed')
+        bump_version('active_plan')
+        second = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertIn(b'R1 renamed', second.content)
+
+    def test_encodings_have_distinct_etags(self):
+        tags = {self.client.get(self.url, {'encoding': e})['ETag'] for e in ('', 'polyline', 'binary')}
+        self.assertEqual(len(tags), 3)
+
+    def test_etag_follows_body_without_a_bump(self):
+        # A re-render after expiry (e.g. a bump this process never saw) must not reuse the old tag.
+        a = cached_payload('etag-test', lambda: b'old', 'k', timeout=0)
+        b = cached_payload('etag-test', lambda: b'new', 'k', timeout=0)
+        self.assertEqual((a.body, b.body), (b'old', b'new'))
+        self.assertNotEqual(a.etag, b.etag)
+        self.assertEqual(cached_payload('etag-test', lambda: b'old', 'k', timeout=0).etag, a.etag)
+
+    @override_settings(CACHE_VERSION_MEMO_SECONDS=60)
+    def test_304_does_not_load_the_body(self):
+        etag = self.client.get(self.url)['ETag']
+        with mock.patch('backend_api.caching.cache.get', wraps=cache.get) as get:
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual([c.args[0].endswith(':etag') for c in get.call_args_list if 'active_plan' in c.args[0]], [True])
+
+    def test_versions_are_memoized_per_process(self):
+        version = get_version('memo-test')
+        cache.set('backend_api:memo-test:version', 'from-another-process')
+        self.assertEqual(get_version('memo-test'), version)
+        with self.settings(CACHE_VERSION_MEMO_SECONDS=0):
+            self.assertEqual(get_version('memo-test'), 'from-another-process')
+        bump_version('memo-test')
+        self.assertNotIn(get_version('memo-test'), (version, 'from-another-process'))
+
+
+def _douglas_peucker(x, y, tolerance):
+    """Plain recursive Douglas-Peucker: indices kept at ``tolerance``."""
+    keep = {0, len(x) - 1}
+    stack = [(0, len(x) - 1)]
+    while stack:
+        a, b = stack.pop()
+        if b - a < 2:
+            continue
+        p = np.column_stack((x[a + 1:b], y[a + 1:b]))
+        start, end = np.array([x[a], y[a]]), np.array([x[b], y[b]])
+        d = end - start
+        t = np.clip(((p - start) @ d) / (d @ d), 0, 1) if d @ d else np.zeros(len(p))
+        dist = np.hypot(*(p - (start + t[:, None] * d)).T)
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            keep.add(a + 1 + i)
+            stack += [(a, a + 1 + i), (a + 1 + i, b)]
+    return sorted(keep)
+
+
+class SignificanceTests(SimpleTestCase):
+    def test_filter_equals_douglas_peucker_at_every_tolerance(self):
+        rng = np.random.default_rng(3)
+        lats = 25.7 + np.cumsum(rng.normal(0, 2e-4, 800))
+        lngs = -100.3 + np.cumsum(rng.normal(0, 2e-4, 800))
+        sig = significance_m(lats, lngs)
+        x, y = _project_m(lats, lngs)
+        for tolerance in (0.5, 5, 20, 80, 400):
+            kept = [i for i, s in enumerate(sig) if s is None or s > tolerance]
+            self.assertEqual(kept, _douglas_peucker(x, y, tolerance), tolerance)
+
+    def test_endpoints_and_short_tracks(self):
+        self.assertEqual(significance_m([], []), [])
+        self.assertEqual(significance_m([25.7], [-100.3]), [None])
+        self.assertEqual(significance_m([25.7, 25.8], [-100.3, -100.2]), [None, None])
+        sig = significance_m([25.7, 25.75, 25.8], [-100.3, -100.2, -100.3])
+        self.assertIsNone(sig[0])
+        self.assertGreater(sig[1], 0)
+
+    def test_batched_passes_match_the_recursive_version(self):
+        # Migration 0002 keeps the original one-segment-at-a-time implementation.
+        recursive = import_module('backend_api.migrations.0002_routetrackpoint_significance_m').significance_m
+        rng = np.random.default_rng(21)
+        for n in (3, 4, 17, 400, 3000):
+            lats, lngs = _random_points(n, seed=n)
+            self.assertEqual(significance_m(lats, lngs), recursive(lats, lngs), n)
+        # Duplicate vertices and exact ties on a straight, evenly spaced line.
+        lats = np.repeat(np.round(rng.uniform(25.5, 25.6, 50), 3), 2)
+        self.assertEqual(significance_m(lats, lats - 126), recursive(lats, lats - 126))
+        line = np.linspace(25.5, 25.6, 101)
+        self.assertEqual(significance_m(line, np.full(101, -100.3)), recursive(line, np.full(101, -100.3)))
+
+    def test_tolerance_shrinks_with_zoom(self):
+        tolerances = [zoom_to_tolerance_m(z) for z in range(0, 20)]
+        self.assertEqual(tolerances, sorted(tolerances, reverse=True))
+
+    def test_tolerances_snap_to_the_zoom_ladder(self):
+        ladder = [zoom_to_tolerance_m(z) for z in range(0, 23)]
+        self.assertEqual([snap_tolerance_m(t) for t in ladder], ladder)
+        self.assertEqual({snap_tolerance_m(t) for t in (19.2, 25, 30, 38.1)}, {zoom_to_tolerance_m(13)})
+        self.assertEqual(snap_tolerance_m(1e7), ladder[0])
+        self.assertEqual(snap_tolerance_m(1e-6), ladder[-1])
+
+
+def _gpx(*elements):
+    return ('<?xml version="1.0"?><gpx xmlns="http://www.topografix.com/GPX/1/1" version="1.1">'
+            + ''.join(elements) + '</gpx>').encode()
+
+
+def _trk(name, points):
+    pts = ''.join(f'<trkpt lat="{la}" lon="{lo}"/>' for la, lo in points)
+    return f'<trk><name>{name}</name><trkseg>{pts}</trkseg></trk>'
+
+
+def _rte(name, points):
+    pts = ''.join(f'<rtept lat="{la}" lon="{lo}"><name>{n}</name></rtept>' for n, la, lo in points)
+    return f'<rte><name>{name}</name>{pts}</rte>'
+
+
+def _zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+class GpxParseTests(SimpleTestCase):
+    north = [(25.80, -100.30), (25.81, -100.30), (25.82, -100.30)]
+    south = [(25.60, -100.30), (25.61, -100.30), (25.62, -100.30)]
+
+    def test_trk_and_rte_pair_by_position_in_either_order(self):
+        data = _gpx(_rte('', [('A', 25.8, -100.3)]), _trk('North', self.north),
+                    _trk('South', self.south), _rte('Extra', [('C', 25.5, -100.3)]),
+                    _rte('Late', [('', 25.6, -100.3)]))
+        routes = parse_gpx(io.BytesIO(data), 'a.gpx')
+        self.assertEqual([r.name for r in routes], ['North', 'South', 'Late'])
+        self.assertEqual([r.stops for r in routes], [
+            [('A', 25.8, -100.3)], [('C', 25.5, -100.3)], [('Stop 1', 25.6, -100.3)],
+        ])
+        self.assertEqual(list(routes[0].track_lats), [25.80, 25.81, 25.82])
+        self.assertEqual(routes[0].significance[0], None)
+
+    def test_waypoints_go_to_the_nearest_track(self):
+        data = _gpx('<wpt lat="25.61" lon="-100.3"><name>S</name></wpt><wpt lat="25.81" lon="-100.3"/>',
+                    _trk('North', self.north), _trk('South', self.south))
+        north, south = parse_gpx(io.BytesIO(data))
+        self.assertEqual(north.stops, [('Stop 1', 25.81, -100.3)])
+        self.assertEqual(south.stops, [('S', 25.61, -100.3)])
+
+    def test_bad_coordinates_are_reported(self):
+        _, routes, error = parse_gpx_payload('bad.gpx', _gpx('<trk><trkseg><trkpt lat="x" lon="1"/></trkseg></trk>'))
+        self.assertEqual(routes, [])
+        self.assertIn('x', error)
+
+
+class GpxUploadTests(TestCase):
+    def setUp(self):
+        hr = User.objects.create_user(username='hr', password='x' * 10, employee_id='00001', role='HR_Admin')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(hr)}')
+        self.previous = RoutePlan.objects.create(route_plan_name='Old', is_active=True)
+
+    def upload(self, filename, data, **fields):
+        return self.client.post(reverse('hr-upload-route'), {
+            'route_file': SimpleUploadedFile(filename, data), 'is_active': 'on', **fields,
+        })
+
+    def test_zip_members_become_routes_of_the_new_active_plan(self):
+        data = _zip({'a.gpx': _gpx(_trk('', GpxParseTests.north)), 'dir/b.gpx': _gpx(_trk('B', GpxParseTests.south)),
+                     'notes.txt': b'skip'})
+        response = self.upload('plan.zip', data, name='Line', plan_name='New')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual([r['route_name'] for r in response.json()['routes']], ['a', 'B'])
+        plan = RoutePlan.objects.get(is_active=True)
+        self.assertEqual(plan.route_plan_name, 'New')
+        self.assertEqual(plan.routes.count(), 2)
+
+    def test_single_route_keeps_the_form_name(self):
+        response = self.upload('a.gpx', _gpx(_trk('Own', GpxParseTests.north)), name='Line 7')
+        self.assertEqual(response.json()['routes'][0]['route_name'], 'Line 7')
+        self.assertEqual(Route.objects.get().route_name, 'Line 7')
+
+    def test_bad_file_is_a_400_and_writes_nothing(self):
+        data = _zip({'a.gpx': _gpx(_trk('A', GpxParseTests.north)),
+                     'b.gpx': _gpx('<trk><trkseg><trkpt lat="north" lon="1"/></trkseg></trk>')})
+        response = self.upload('plan.zip', data, name='Line', plan_name='New')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'][0]['source'], 'b.gpx')
+        self.assertEqual(list(RoutePlan.objects.values_list('route_plan_name', 'is_active')), [('Old', True)])
+        self.assertFalse(Route.objects.exists())
+
+
+@mock.patch('backend_api.views.pool_map', lambda fn, *iterables: list(map(fn, *iterables)))
+class RoutePlanUploadTests(TestCase):
+    def setUp(self):
+        hr = User.objects.create_user(username='hr', password='x' * 10, employee_id='00001', role='HR_Admin')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(hr)}')
+
+    def upload(self, *files):
+        return self.client.post(reverse('hr-upload-route-plan'), {
+            'route_files': [SimpleUploadedFile(name, data) for name, data in files],
+            'plan_name': 'Plan', 'is_active': 'on',
+        })
+
+    def test_files_and_zip_members_go_to_one_plan(self):
+        response = self.upload(
+            ('north.gpx', _gpx(_trk('', GpxParseTests.north))),
+            ('more.zip', _zip({'a.gpx': _gpx(_trk('A', GpxParseTests.south), _trk('B', GpxParseTests.north))})),
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        body = response.json()
+        self.assertEqual((body['files'], body['track_points']), (2, 9))
+        self.assertEqual([r['route_name'] for r in body['routes']], ['north', 'A', 'B'])
+        self.assertEqual(RoutePlan.objects.get(pk=body['plan_id']).routes.count(), 3)
+
+    def test_one_bad_file_writes_nothing(self):
+        response = self.upload(
+            ('north.gpx', _gpx(_trk('N', GpxParseTests.north))),
+            ('bad.gpx', b'<gpx><trk>'),
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([e['source'] for e in response.json()['errors']], ['bad.gpx'])
+        self.assertFalse(RoutePlan.objects.exists() or Route.objects.exists())
+
+
+class IngestTests(TestCase):
+    def test_frames_keep_line_positions_across_chunks(self):
+        upload = SimpleUploadedFile('s.csv', b' Stop_ID ,Name\n1,a\n2,b\n3,c\n4,d\n5,e\n')
+        frames = list(iter_csv_frames(upload, chunksize=2, dtype=str))
+        self.assertEqual([len(df) for df in frames], [2, 2, 1])
+        self.assertEqual(list(frames[0].columns), ['stop_id', 'name'])
+        self.assertEqual([df.index.tolist() for df in frames], [[0, 1], [2, 3], [4]])
+        self.assertEqual([v for df in frames for v in df['stop_id']], ['1', '2', '3', '4', '5'])
+
+    def test_rows_decode_incrementally(self):
+        text = 'id,name\n' + ''.join(f'{i},Jos\u00e9 {i}\n' for i in range(3000))
+        upload = SimpleUploadedFile('e.csv', text.encode('iso-8859-1'))
+        rows = list(iter_csv_rows(upload, encoding='iso-8859-1'))
+        self.assertEqual((len(rows), rows[-1]), (3001, ['2999', 'Jos\u00e9 2999']))
+        self.assertEqual([len(b) for b in batched(range(12), 5)], [5, 5, 2])
+
+    @mock.patch('backend_api.views.iter_csv_frames', partial(iter_csv_frames, chunksize=2))
+    def test_mesh_upload_reads_every_chunk(self):
+        hr = User.objects.create_user(username='hr', password='x' * 10, employee_id='00001', role='HR_Admin')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(hr)}')
+        data = 'latitude,longitude\n' + ''.join(f'25.{i},-100.{i}\n' for i in range(1, 8))
+        body = client.post(reverse('hr-upload-coverage'),
+                           {'coverage_mesh_file': SimpleUploadedFile('m.csv', data.encode())}).json()
+        self.assertEqual(body['points_count'], 7)
+        lats = [lat for _, _, lat, _ in unpack_mesh(CoverageMesh.objects.get().geometry)]
+        self.assertEqual(lats[0].tolist(), [float(f'25.{i}') for i in range(1, 8)])
+
+    def test_peek_does_not_consume(self):
+        stream = open_text(SimpleUploadedFile('m.json', b'  \n {"type": "Polygon"}'))
+        self.assertEqual(peek_char(stream), '{')
+        self.assertEqual(stream.read().strip(), '{"type": "Polygon"}')
+
+
+class ColumnarImportTests(TestCase):
+    def setUp(self):
+        hr = User.objects.create_user(username='hr', password='x' * 10, employee_id='00001', role='HR_Admin')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(hr)}')
+
+    @mock.patch('backend_api.views.iter_csv_frames', partial(iter_csv_frames, chunksize=2))
+    def test_bus_stop_errors_carry_file_line_numbers_across_chunks(self):
+        data = '\n'.join([
+            'stop_id,name,latitude,longitude',
+            '001,A,25.70,-100.30',    # line 2
+            '002,B,25.71,north',      # 3
+            '003,C,25.72,-100.32',    # 4
+            '001,Dup,25.73,-100.33',  # 5: duplicate of a stop in the previous chunk
+            ',Blank,25.74,-100.34',   # 6
+            '004,D,91,-100.35',       # 7
+            '005,' + 'x' * 101 + ',25.76,-100.36',  # 8
+            '006,E,25.77,-100.37',    # 9
+        ]).encode()
+        body = self.client.post(reverse('hr-upload-busstops'),
+                                {'bus_stop_file': SimpleUploadedFile('s.csv', data)}).json()
+        self.assertEqual((body['uploaded'], body['created'], body['errors_total']), (3, 3, 5))
+        self.assertEqual(
+            sorted((e['row'], e['error']) for e in body['errors']),
+            [(3, 'Latitude and longitude must be numeric'), (5, 'Duplicate stop_id in file'),
+             (6, 'Missing stop_id'), (7, 'Latitude/longitude out of range'),
+             (8, 'name longer than 100 characters')],
+        )
+        self.assertEqual(list(BusStop.objects.order_by('stop_id').values_list('stop_id', 'latitude')),
+                         [('001', 25.70), ('003', 25.72), ('006', 25.77)])
+
+    def test_mesh_vertices_skip_bad_rows_and_default_rings(self):
+        df = pd.DataFrame({'latitude': ['25.1', 'x', '25.3', '95'], 'longitude': ['-100.1', '-100.2', '-100.3', '-100.4'],
+                           'polygon': ['0', '0', '1', '1']})
+        errors = RowErrors()
+        self.assertEqual(mesh_vertices(df, errors), [(-100.1, 25.1, 0, 0), (-100.3, 25.3, 1, 0)])
+        self.assertEqual([e['row'] for e in errors.items], [3, 5])
+
+
+class ActiveEmployeeUploadTests(TestCase):
+    def setUp(self):
+        hr = User.objects.create_user(username='hr', password='x' * 10, employee_id='00001', role='HR_Admin')
+        User.objects.bulk_create([
+            User(username='a', employee_id='00012', is_active=False),
+            User(username='b', employee_id='00034'),
+            User(username='c', employee_id='00056', is_active=False),
+            User(username='d', employee_id='00078'),
+            User(username='no-id', employee_id=''),
+        ])
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(hr)}')
+
+    def upload(self, text):
+        return self.client.post(reverse('hr-upload-active-employees'),
+                                {'active_employees_file': SimpleUploadedFile('a.csv', text.encode('iso-8859-1'))})
+
+    def test_reconciles_zero_padded_ids(self):
+        body = self.upload('Numero de personal,Nombre\n1,HR\n12,Ana\n0034,Beto\n 56 ,José\n,Blank\n').json()
+        self.assertEqual((body['activated'], body['deactivated'], body['updated']), (['00012', '00056'], ['00078'], 3))
+        active = set(User.objects.filter(is_active=True).values_list('employee_id', flat=True))
+        self.assertEqual(active, {'00001', '00012', '00034', '00056', ''})
+        self.assertEqual(set(body['timings_ms']), {'parse', 'reconcile', 'total'})
+
+        again = self.upload('Numero de personal\n00001\n00012\n00034\n00056\n').json()
+        self.assertEqual((again['activated'], again['deactivated'], again['updated']), ([], [], 0))
+
+    def test_missing_column_changes_nothing(self):
+        response = self.upload('Employee\n12\n')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(User.objects.get(employee_id='00012').is_active)
+
+
+class MinimalEmployeeImportTests(TestCase):
+    def setUp(self):
+        hr = User.objects.create_user(username='hr', password='x' * 10, employee_id='00001', role='HR_Admin')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(hr)}')
+
+    def upload(self, lines):
+        data = '\n'.join(lines).encode()
+        return self.client.post(reverse('hr-upload-minimal-employees'), {'csv_file': SimpleUploadedFile('m.csv', data)})
+
+    def test_creates_users_with_consent_and_reports_bad_rows(self):
+        body = self.upload([
+            'employee_id,company,utilization,shift,latitude,longitude',
+            '42,ACME,1,A,25.7,-100.3',
+            '0042,ACME,1,A,25.7,-100.3',
+            '43,ACME,1,A,95,-100.3',
+            '44,ACME,1,A,north,-100.3',
+            ',ACME,1,A,25.7,-100.3',
+            '45,ACME,1',
+            '1,ACME,1,A,25.7,-100.3',
+            '46,Beta,0.5,B,25.8,-100.4',
+        ]).json()
+        self.assertEqual((body['created'], body['skipped_existing'], body['errors_total']), (2, 1, 5))
+        self.assertEqual([e['row'] for e in body['errors']], [3, 4, 5, 6, 7])
+        self.assertIn('Duplicate employee_id 00042', body['errors'][0]['error'])
+
+        created = User.objects.filter(employee_id__in=['00042', '00046']).order_by('employee_id')
+        self.assertEqual([(u.company, u.shift, u.is_active) for u in created], [('ACME', 'A', True), ('Beta', 'B', True)])
+        self.assertEqual(PrivacyConsent.objects.filter(user__in=created, accepted=False).count(), 2)
+
+    def test_rows_for_existing_ids_are_skipped(self):
+        self.upload(['42,ACME,1,A,25.7,-100.3'])
+        body = self.upload(['42,Other,1,B,25.8,-100.4']).json()
+        self.assertEqual((body['created'], body['skipped_existing'], body['errors']), (0, 1, []))
+        self.assertEqual(User.objects.get(employee_id='00042').company, 'ACME')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class OverviewQueryTests(TestCase):
+    def setUp(self):
+        hr = User.objects.create_user(username='hr', password='x' * 10, employee_id='00001', role='HR_Admin')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(hr)}')
+        self.add_rows(1)
+
+    def tearDown(self):
+        cache.clear()
+
+    def add_rows(self, n):
+        start = RoutePlan.objects.count()
+        for i in range(start, start + n):
+            plan = RoutePlan.objects.create(route_plan_name=f'Plan {i}')
+            Route.objects.bulk_create([Route(plan=plan, route_name=f'R{j}') for j in range(3)])
+            mesh = CoverageMesh.objects.create(name=f'Mesh {i}', geometry=pack_mesh([0] * 4, [0] * 4, [25.0] * 4, [-100.0] * 4))
+            BusStop.objects.create(stop_id=f'{i:03d}', name='S', latitude=25.7, longitude=-100.3, is_active=bool(i % 2))
+        User.objects.bulk_create([User(username=f'u{start}-{j}', employee_id=f'{start}{j:03d}'[-5:]) for j in range(12 * n)])
+
+    def overview(self, **params):
+        return self.client.get(reverse('hr-dm-overview'), params).json()
+
+    def test_query_count_does_not_grow_with_meshes_or_plans(self):
+        self.overview()  # the process's first request also sweeps orphaned jobs
+        cache.clear()
+        # Token user, role groups, employee count + page, stop, mesh and plan summaries.
+        with self.assertNumQueries(7):
+            self.overview()
+        self.add_rows(6)
+        cache.clear()
+        with self.assertNumQueries(7):
+            data = self.overview()
+        with self.assertNumQueries(3):  # claims and summaries served from the cache
+            self.overview()
+        with self.assertNumQueries(2):  # show_all: one list query instead of count + page
+            self.overview(show_all=1)
+
+        self.assertEqual(len(data['coverage_meshes']), 7)
+        self.assertEqual({m['points_count'] for m in data['coverage_meshes']}, {4})
+        self.assertEqual({p['routes_count'] for p in data['route_plans']}, {3})
+        self.assertEqual(data['bus_stops'], {'total': 7, 'active': 3, 'inactive': 4})
+        self.assertEqual(data['employees']['total_count'], User.objects.count())
+
+
+class BusStopUploadTests(TestCase):
+    def setUp(self):
+        hr = User.objects.create_user(username='hr', password='x' * 10, employee_id='00001', role='HR_Admin')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(hr)}')
+        BusStop.objects.create(stop_id='007', name='Same', latitude=25.70, longitude=-100.30)
+        BusStop.objects.create(stop_id='008', name='Old name', latitude=25.71, longitude=-100.31)
+        BusStop.objects.create(stop_id='009', name='Missing', latitude=25.72, longitude=-100.32)
+        self.created_at = BusStop.objects.get(stop_id='007').created_at
+
+    def upload(self, rows, **fields):
+        data = ('stop_id,name,latitude,longitude\n' + '\n'.join(rows)).encode()
+        return self.client.post(reverse('hr-upload-busstops'), {'bus_stop_file': SimpleUploadedFile('s.csv', data), **fields})
+
+    def test_upsert_counts_and_deactivates_missing_stops(self):
+        body = self.upload(['007,Same,25.70,-100.30', '008,New name,25.71,-100.31', '0100,Fresh,25.8,-100.4',
+                            '011,Bad,north,-100.4']).json()
+        self.assertEqual((body['created'], body['updated'], body['unchanged'], body['deactivated']), (1, 1, 1, 1))
+        self.assertEqual(body['errors_total'], 1)
+        stops = {s.stop_id: s for s in BusStop.objects.all()}
+        self.assertEqual(sorted(stops), ['007', '008', '009', '0100'])
+        self.assertEqual(stops['007'].created_at, self.created_at)
+        self.assertEqual(stops['008'].name, 'New name')
+        self.assertFalse(stops['009'].is_active)
+
+        job = Job.objects.get(pk=body['assignment_job_id'])
+        self.assertEqual((job.kind, job.status), ('recompute_assignments', 'queued'))
+
+    def test_unchanged_file_queues_nothing(self):
+        body = self.upload(['007,Same,25.70,-100.30', '008,Old name,25.71,-100.31', '009,Missing,25.72,-100.32']).json()
+        self.assertEqual((body['created'], body['updated'], body['unchanged']), (0, 0, 3))
+        self.assertIsNone(body['assignment_job_id'])
+        self.assertFalse(Job.objects.exists())
+
+    def test_replace_mode_reloads_everything(self):
+        body = self.upload(['001,A,25.70,-100.30'], mode='replace').json()
+        self.assertEqual(body['created'], 1)
+        self.assertEqual(list(BusStop.objects.values_list('stop_id', flat=True)), ['001'])
+        self.assertEqual(self.upload([], mode='merge').status_code, 400)
+
+    def test_recompute_job_rebuilds_assignments(self):
+        User.objects.bulk_create([User(username='emp', employee_id='00002', latitude=25.8, longitude=-100.4)])
+        job_id = self.upload(['0100,Fresh,25.8,-100.4']).json()['assignment_job_id']
+        run_job(job_id)
+        job = Job.objects.get(pk=job_id)
+        self.assertEqual((job.status, job.result), ('succeeded', {'written': 1}))
+        self.assertEqual(StopAssignment.objects.get(user__employee_id='00002').stop.stop_id, '0100')
+
+
+def _point_in_ring(lat, lng, lats, lngs):
+    inside = False
+    for i in range(len(lats)):
+        y1, x1, y2, x2 = lats[i - 1], lngs[i - 1], lats[i], lngs[i]
+        if (y1 > lat) != (y2 > lat) and lng < x1 + (lat - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+    return inside
+
+
+def _star(center_lat, center_lng, radius, n, seed):
+    rng = np.random.default_rng(seed)
+    angles = np.linspace(0, 2 * np.pi, n, endpoint=False)
+    r = radius * rng.uniform(0.4, 1.0, n)
+    return center_lat + r * np.sin(angles), center_lng + r * np.cos(angles)
+
+
+class MeshGeometryTests(SimpleTestCase):
+    def test_square_with_hole(self):
+        square = lambda a, b: ([a, a, b, b], [a, b, b, a])
+        mesh = MeshGeometry([[square(0, 10), square(4, 6)], [square(20, 22)]])
+        lats = [2, 5, 15, 21, -1]
+        lngs = [2, 5, 15, 21, 5]
+        self.assertEqual(mesh.contains(lats, lngs).tolist(), [True, False, False, True, False])
+        self.assertEqual(mesh.bbox, (0, 0, 22, 22))
+
+    def test_matches_brute_force_with_many_edges(self):
+        outer = _star(25.7, -100.3, 0.2, 800, seed=4)
+        hole = _star(25.7, -100.3, 0.05, 100, seed=5)
+        mesh = MeshGeometry([[outer, hole]])
+        lats, lngs = _random_points(500, seed=6, lat=(25.45, 25.95), lng=(-100.55, -100.05))
+        expected = [
+            _point_in_ring(la, lo, *outer) and not _point_in_ring(la, lo, *hole)
+            for la, lo in zip(lats, lngs)
+        ]
+        self.assertEqual(mesh.contains(lats, lngs).tolist(), expected)
+        self.assertTrue(any(expected))
+
+    def test_degenerate_polygons_are_skipped(self):
+        mesh = MeshGeometry([[([0, 1], [0, 1])]])
+        self.assertIsNone(mesh.bbox)
+        self.assertFalse(mesh.contains([0.5], [0.5]).any())
+
+
+class AssignmentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        lats, lngs = _random_points(12, seed=31)
+        self.stops = [BusStop.objects.create(stop_id=f'S{i}', latitude=la, longitude=lo)
+                      for i, (la, lo) in enumerate(zip(lats, lngs))]
+        lats, lngs = _random_points(40, seed=32)
+        self.users = User.objects.bulk_create([
+            User(username=f'u{i}', employee_id=f'{i:05d}', latitude=la, longitude=lo)
+            for i, (la, lo) in enumerate(zip(lats, lngs))
+        ])
+        invalidate_stop_index()
+        recompute_assignments()
+
+    def assert_matches_brute_force(self):
+        stops = list(BusStop.objects.filter(is_active=True).values_list('id', 'latitude', 'longitude'))
+        ids, s_lats, s_lngs = zip(*stops)
+        expected = {}
+        for user in User.objects.filter(is_active=True, latitude__isnull=False):
+            dist = haversine_m(user.latitude, user.longitude, np.asarray(s_lats), np.asarray(s_lngs))
+            expected[user.pk] = ids[int(np.argmin(dist))]
+        self.assertEqual(dict(StopAssignment.objects.values_list('user_id', 'stop_id')), expected)
+
+    def test_single_stop_changes_keep_assignments_exact(self):
+        self.assert_matches_brute_force()
+        user = self.users[0]
+        added = BusStop.objects.create(stop_id='NEW', latitude=user.latitude + 1e-4, longitude=user.longitude)
+        invalidate_stop_index()
+        refresh_for_stops([added.pk])
+        self.assertEqual(StopAssignment.objects.get(user=user).stop_id, added.pk)
+        self.assert_matches_brute_force()
+
+        moved = self.stops[3]
+        BusStop.objects.filter(pk=moved.pk).update(latitude=25.0, longitude=-99.0)
+        invalidate_stop_index()
+        refresh_for_stops([moved.pk])
+        self.assert_matches_brute_force()
+
+        BusStop.objects.filter(pk=added.pk).delete()
+        invalidate_stop_index()
+        refresh_for_stops([added.pk])
+        self.assert_matches_brute_force()
+
+    def test_bounding_box_only_reads_nearby_assignments(self):
+        far = User.objects.create_user(username='far', password='x' * 10, employee_id='99999', latitude=40.0, longitude=-3.0)
+        refresh_for_users([far.pk])
+        radius = StopAssignment.objects.exclude(user=far).aggregate(r=Max('distance_m'))['r']
+        near = set(StopAssignment.objects.filter(_near_any([(25.7, -100.3)], radius)).values_list('user_id', flat=True))
+        self.assertNotIn(far.pk, near)
+        self.assertTrue(near)
+
+    def test_stale_index_falls_back_to_an_active_stop(self):
+        user = self.users[0]
+        nearest = StopAssignment.objects.get(user=user).stop
+        StopAssignment.objects.all().delete()
+        BusStop.objects.filter(pk=nearest.pk).update(is_active=False)  # another worker, no bump seen here
+        assignment = assignment_for(user)
+        self.assertNotEqual(assignment.stop_id, nearest.pk)
+        self.assertTrue(assignment.stop.is_active)
+
+    def test_imports_and_activations_create_assignments(self):
+        hr = User.objects.create_user(username='hr', password='x' * 10, employee_id='88888', role='HR_Admin')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(hr)}')
+        csv = b'id,company,util,shift,lat,lng\n777,ACME,1,A,25.7,-100.3\n'
+        response = client.post(reverse('hr-upload-minimal-employees'), {'csv_file': SimpleUploadedFile('e.csv', csv)})
+        self.assertEqual(response.json()['created'], 1)
+        self.assertTrue(StopAssignment.objects.filter(user__employee_id='00777').exists())
+
+        ids = [u.employee_id for u in self.users[1:]] + ['00777', '88888']
+        User.objects.filter(pk=self.users[1].pk).update(is_active=False)
+        StopAssignment.objects.filter(user=self.users[1]).delete()
+        data = ('Numero de personal\n' + '\n'.join(ids)).encode()
+        client.post(reverse('hr-upload-active-employees'), {'active_employees_file': SimpleUploadedFile('a.csv', data)})
+        self.assertTrue(StopAssignment.objects.filter(user=self.users[1]).exists())
+        self.assertFalse(StopAssignment.objects.filter(user=self.users[0]).exists())
+
+
+def _tour_length(route, dist):
+    tour = [0, *route, 0]
+    return sum(dist[a, b] for a, b in zip(tour[:-1], tour[1:]))
+
+
+class RouteSolverTests(SimpleTestCase):
+    def setUp(self):
+        self.lats, self.lngs = _random_points(60, seed=7)
+        self.depot = (25.7, -100.3)
+
+    def test_routes_cover_every_rider_within_capacity(self):
+        riders = np.random.default_rng(8).integers(0, 25, len(self.lats))
+        riders[0] = 95  # more than two buses' worth
+        routes = solve_shift(self.lats, self.lngs, riders, self.depot, capacity=40)
+        picked = np.zeros(len(riders), dtype=int)
+        for route in routes:
+            self.assertLessEqual(sum(n for _, n in route), 40)
+            for pos, n in route:
+                picked[pos] += n
+        self.assertEqual(picked.tolist(), riders.tolist())
+
+    def test_savings_beats_one_route_per_stop(self):
+        lats = np.concatenate(([self.depot[0]], self.lats))
+        lngs = np.concatenate(([self.depot[1]], self.lngs))
+        dist = distance_matrix(lats, lngs, lats, lngs)
+        demand = np.ones(len(self.lats), dtype=int)
+        routes = savings_routes(dist, demand, capacity=10)
+        self.assertEqual(sorted(v for r in routes for v in r), list(range(1, len(self.lats) + 1)))
+        self.assertTrue(all(len(r) <= 10 for r in routes))
+        naive = sum(2 * dist[0, i] for i in range(1, len(lats)))
+        self.assertLess(sum(_tour_length(r, dist) for r in routes), naive)
+
+    def test_max_route_length_is_respected(self):
+        lats = np.concatenate(([self.depot[0]], self.lats))
+        lngs = np.concatenate(([self.depot[1]], self.lngs))
+        dist = distance_matrix(lats, lngs, lats, lngs)
+        limit = 2.5 * dist[0, 1:].max()
+        routes = savings_routes(dist, np.ones(len(self.lats), dtype=int), capacity=100, max_route_m=limit)
+        self.assertTrue(all(_tour_length(r, dist) <= limit + 1e-6 for r in routes))
+
+    def test_two_opt_removes_crossings(self):
+        # Depot plus four corners of a square, visited in a crossing order.
+        lats = np.array([0.0, 0.0, 0.01, 0.0, 0.01]) + 25.7
+        lngs = np.array([-0.01, 0.0, 0.0, 0.01, 0.01]) - 100.3
+        dist = distance_matrix(lats, lngs, lats, lngs)
+        crossing = [1, 4, 2, 3]
+        improved = two_opt(crossing, dist)
+        self.assertEqual(sorted(improved), sorted(crossing))
+        self.assertLess(_tour_length(improved, dist), _tour_length(crossing, dist))
+        self.assertEqual(two_opt(improved, dist), improved)
+
+
+class OptimizeTests(TestCase):
+    def test_each_run_creates_its_own_plan(self):
+        lats, lngs = _random_points(30, seed=9)
+        BusStop.objects.bulk_create([
+            BusStop(stop_id=f's{i}', name=f'S{i}', latitude=la, longitude=lo) for i, (la, lo) in enumerate(zip(lats, lngs))
+        ])
+        User.objects.bulk_create([
+            User(username=f'u{i}', employee_id=f'{10000 + i}', latitude=la, longitude=lo, shift='FIXED_8HRS')
+            for i, (la, lo) in enumerate(zip(*_random_points(200, seed=10)))
+        ])
+        params = {'plan_name': 'Same name', 'depot_latitude': 25.7, 'depot_longitude': -100.3,
+                  'vehicle_capacity': 40, 'max_walk_m': None, 'activate': True}
+        first, second = optimize(params), optimize(params)
+        self.assertNotEqual(first['plan_id'], second['plan_id'])
+        self.assertEqual(first['assigned'], 200)
+        self.assertEqual(Route.objects.filter(plan_id=first['plan_id']).count(), len(first['routes']))
+        self.assertEqual(list(RoutePlan.objects.filter(is_active=True).values_list('id', flat=True)), [second['plan_id']])
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.hr = User.objects.create_user(username='hr', password='x' * 10, employee_id='00001', role='HR_Admin')
+        User.objects.bulk_create([User(username=f'u{i}', employee_id=f'{10000 + i}') for i in range(23)])
+        # Ties on created_at must be broken by id without skipping or repeating rows.
+        first_ids = User.objects.order_by('id').values_list('id', flat=True)[:10]
+        User.objects.filter(id__in=list(first_ids)).update(created_at=self.hr.created_at)
+        self.client = APIClient()
+        self.client.force_authenticate(self.hr)
+
+    def walk(self, url, params):
+        ids, pages = [], 0
+        response = self.client.get(url, params).json()
+        while True:
+            pages += 1
+            ids += [row['id'] for row in response['results']]
+            if not response['next']:
+                return ids, pages
+            response = self.client.get(response['next']).json()
+
+    def test_pages_cover_every_row_once_in_order(self):
+        ids, pages = self.walk(reverse('users-list'), {'page_size': 5})
+        expected = list(User.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 5)
+
+    def test_previous_link_returns_the_same_page(self):
+        first = self.client.get(reverse('users-list'), {'page_size': 7}).json()
+        second = self.client.get(first['next']).json()
+        back = self.client.get(second['previous']).json()
+        self.assertEqual([r['id'] for r in back['results']], [r['id'] for r in first['results']])
+
+    def test_client_ordering_is_tie_broken_by_id(self):
+        User.objects.filter(username__startswith='u').update(company='ACME')
+        for ordering, expected in (('company', ('company', 'id')), ('-company', ('-company', '-id'))):
+            ids, _ = self.walk(reverse('users-list'), {'page_size': 4, 'ordering': ordering})
+            self.assertEqual(ids, list(User.objects.order_by(*expected).values_list('id', flat=True)))
+
+    def test_count_only_on_request(self):
+        url = reverse('users-list')
+        self.assertNotIn('count', self.client.get(url).json())
+        self.assertEqual(self.client.get(url, {'count': 'exact'}).json()['count'], 24)
+        self.assertEqual(self.client.get(url, {'count': 'estimated'}).json()['count'], 24)  # exact off PostgreSQL
+
+    def test_legacy_page_parameter(self):
+        data = self.client.get(reverse('users-list'), {'page': 3, 'page_size': 10}).json()
+        self.assertEqual((data['count'], len(data['results'])), (24, 4))
+
+    def test_opt_in_endpoints_stay_unpaginated_by_default(self):
+        BusStop.objects.bulk_create([BusStop(stop_id=f'{i:03d}', name='S', latitude=25.7, longitude=-100.3) for i in range(12)])
+        self.assertEqual(len(self.client.get(reverse('bus-stops-list')).json()), 12)
+        ids, pages = self.walk(reverse('bus-stops-list'), {'page_size': 5})
+        self.assertEqual((len(set(ids)), pages), (12, 3))
+
+
+class PackedGeometryTests(TestCase):
+    def test_track_round_trip_and_tolerance(self):
+        lats, lngs = _random_points(50, seed=11)
+        sig = [None, *np.linspace(1, 100, 48), None]
+        order, out_lats, out_lngs = unpack_track(memoryview(pack_track(lats, lngs, sig)))
+        self.assertEqual(order.tolist(), list(range(50)))
+        np.testing.assert_array_equal(out_lats, lats)
+        np.testing.assert_array_equal(out_lngs, lngs)
+        order, out_lats, _ = unpack_track(pack_track(lats, lngs, sig), tolerance_m=50)
+        expected = [i for i, s in enumerate(sig) if s is None or s > 50]
+        self.assertEqual(order.tolist(), expected)
+        np.testing.assert_array_equal(out_lats, lats[expected])
+
+    def test_mesh_round_trip_groups_rings_in_file_order(self):
+        polygons = [1, 0, 1, 0, 0, 0]
+        rings = [0, 0, 0, 1, 0, 1]
+        lats = [10.0, 1.0, 11.0, 5.0, 2.0, 6.0]
+        lngs = [-10.0, -1.0, -11.0, -5.0, -2.0, -6.0]
+        unpacked = [(p, r, la.tolist(), lo.tolist()) for p, r, la, lo in unpack_mesh(pack_mesh(polygons, rings, lats, lngs))]
+        self.assertEqual(unpacked, [
+            (0, 0, [1.0, 2.0], [-1.0, -2.0]),
+            (0, 1, [5.0, 6.0], [-5.0, -6.0]),
+            (1, 0, [10.0, 11.0], [-10.0, -11.0]),
+        ])
+        self.assertEqual(unpack_mesh(pack_mesh([], [], [], [])), [])
+
+    def test_serialized_track_same_from_blob_and_rows(self):
+        lats, lngs = _random_points(20, seed=12)
+        sig = [None, *range(1, 19), None]
+        plan = RoutePlan.objects.create(route_plan_name='Plan')
+        route = Route.objects.create(plan=plan, route_name='R', track=pack_track(lats, lngs, sig))
+        RouteTrackPoint.objects.bulk_create([
+            RouteTrackPoint(route=route, latitude=la, longitude=lo, order=i, significance_m=s)
+            for i, (la, lo, s) in enumerate(zip(lats, lngs, sig))
+        ])
+        for tolerance in (None, 10):
+            context = {'tolerance_m': tolerance}
+            packed = RouteSerializer(Route.objects.get(pk=route.pk), context=context).data['trackpoints']
+            Route.objects.filter(pk=route.pk).update(track=None)
+            rows = RouteSerializer(Route.objects.get(pk=route.pk), context=context).data['trackpoints']
+            Route.objects.filter(pk=route.pk).update(track=pack_track(lats, lngs, sig))
+            if tolerance:
+                rows = [p for p in rows if sig[p['order']] is None or sig[p['order']] > tolerance]
+            self.assertEqual(packed, [dict(p) for p in rows])
+
+
+    def test_uploads_write_rows_only_when_configured(self):
+        plan = RoutePlan.objects.create(route_plan_name='Plan')
+        parsed = ParsedRoute(name='R', source='a.gpx', track_lats=array('d', [25.7, 25.8]),
+                             track_lngs=array('d', [-100.3, -100.2]), significance=[None, None],
+                             stops=[('S', 25.7, -100.3)])
+        saved = save_parsed_route(plan, parsed, 'R', '')
+        self.assertEqual((saved['track_points'], RouteTrackPoint.objects.count()), (2, 0))
+        with self.settings(STORE_GEOMETRY_ROWS=True):
+            save_parsed_route(plan, parsed, 'R2', '')
+        self.assertEqual(RouteTrackPoint.objects.count(), 2)
+        self.assertEqual(RouteStopPoint.objects.count(), 2)
+
+    def test_exports_read_blobs_and_fall_back_to_rows(self):
+        lats, lngs = _random_points(30, seed=13)
+        sig = [None, *range(1, 29), None]
+        plan = RoutePlan.objects.create(route_plan_name='Plan')
+        packed = Route.objects.create(plan=plan, route_name='A', track=pack_track(lats, lngs, sig))
+        legacy = Route.objects.create(plan=plan, route_name='B')
+        RouteTrackPoint.objects.bulk_create([
+            RouteTrackPoint(route=legacy, latitude=la, longitude=lo, order=i, significance_m=s)
+            for i, (la, lo, s) in enumerate(zip(lats, lngs, sig))
+        ])
+        fields, rows = export_rows('route-track-points', {'plan_id': str(plan.pk)})
+        rows = list(rows)
+        self.assertEqual(fields, ['route_id', 'plan_id', 'order', 'latitude', 'longitude', 'significance_m'])
+        self.assertEqual([r[2:] for r in rows if r[0] == packed.pk], [r[2:] for r in rows if r[0] == legacy.pk])
+        self.assertEqual(rows[0], (packed.pk, plan.pk, 0, lats[0], lngs[0], None))
+        self.assertEqual(len(list(export_rows('route-track-points', {'route_id': str(legacy.pk)})[1])), 30)
+
+        mesh = CoverageMesh.objects.create(name='M', version='1', geometry=pack_mesh([0, 0, 0], [0, 0, 0], [1.0, 2.0, 3.0], [4.0, 5.0, 6.0]))
+        _, rows = export_rows('coverage-mesh-points', {'mesh_id': str(mesh.pk)})
+        self.assertEqual(list(rows), [(mesh.pk, 0, 0, i, 1.0 + i, 4.0 + i) for i in range(3)])
+        counted = CoverageMesh.objects.annotate(points_count=mesh_points_count()).get(pk=mesh.pk)
+        self.assertEqual(counted.points_count, 3)
+
+def _decode_polyline(text, precision=5):
+    """Reference decoder written straight from Google's algorithm description."""
+    values, value, shift = [], 0, 0
+    for char in text:
+        chunk = ord(char) - 63
+        value |= (chunk & 0x1F) << shift
+        shift += 5
+        if not chunk & 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value, shift = 0, 0
+    coords = np.cumsum(np.array(values, dtype=np.int64).reshape(-1, 2), axis=0) / 10 ** precision
+    return coords[:, 0].tolist(), coords[:, 1].tolist()
+
+
+class EncodingTests(TestCase):
+    def test_polyline_matches_googles_reference(self):
+        self.assertEqual(encode_polyline([38.5, 40.7, 43.252], [-120.2, -120.95, -126.453]),
+                         '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+        self.assertEqual(encode_polyline([], []), '')
+
+    def test_polyline_round_trip(self):
+        lats, lngs = _random_points(200, seed=21)
+        lats[3], lngs[3] = 0.0, 0.0
+        out_lats, out_lngs = _decode_polyline(encode_polyline(lats, lngs))
+        np.testing.assert_allclose(out_lats, lats, atol=0.5e-5)
+        np.testing.assert_allclose(out_lngs, lngs, atol=0.5e-5)
+
+    def test_binary_is_base64_float32_pairs(self):
+        lats, lngs = _random_points(10, seed=22)
+        pairs = np.frombuffer(base64.b64decode(encode_binary(lats, lngs)), dtype='<f4').reshape(-1, 2)
+        np.testing.assert_array_equal(pairs[:, 0], np.asarray(lats, dtype=np.float32))
+        np.testing.assert_array_equal(pairs[:, 1], np.asarray(lngs, dtype=np.float32))
+
+    def test_compact_plan_list_queries_do_not_grow_with_plans(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='u', password='x' * 10, employee_id='00001'))
+        lats, lngs = _random_points(5, seed=23)
+
+        def add_plan(i):
+            plan = RoutePlan.objects.create(route_plan_name=f'Plan {i}')
+            Route.objects.create(plan=plan, route_name='Blob', track=pack_track(lats, lngs, [None] * 5))
+            rows = Route.objects.create(plan=plan, route_name='Rows')
+            RouteTrackPoint.objects.bulk_create([
+                RouteTrackPoint(route=rows, latitude=la, longitude=lo, order=j) for j, (la, lo) in enumerate(zip(lats, lngs))
+            ])
+            RouteStopPoint.objects.create(route=rows, stop_name='S', latitude=lats[0], longitude=lngs[0], order=0)
+
+        add_plan(0)
+        client.get(reverse('route-plans-list'))  # the process's first request also sweeps orphaned jobs
+        with self.assertNumQueries(4):
+            one = client.get(reverse('route-plans-list'), {'encoding': 'polyline'}).json()
+        for i in range(1, 5):
+            add_plan(i)
+        with self.assertNumQueries(4):
+            plans = client.get(reverse('route-plans-list'), {'encoding': 'polyline'}).json()
+        self.assertEqual(len(plans), 5)
+        self.assertEqual(plans[-1], one[0])
+        blob, rows = one[0]['routes']
+        self.assertEqual(blob['trackpoints'], rows['trackpoints'])
+        self.assertEqual(rows['stop_names'], ['S'])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        hr = User.objects.create_user(username='hr', password='x' * 10, employee_id='00001', role='HR_Admin')
+        BusStop.objects.bulk_create([
+            BusStop(stop_id=f'{i:03d}', name=f'Stop, "{i}"', latitude=25.7 + i / 100, longitude=-100.3,
+                    is_active=i != 3)
+            for i in range(5)
+        ])
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(hr)}')
+
+    def export(self, dataset, fmt, **params):
+        response = self.client.get(reverse('export', args=[dataset, fmt]), params)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    @mock.patch('backend_api.exports.EXPORT_CHUNK_ROWS', 2)
+    def test_formats_agree_across_chunks(self):
+        response, text = self.export('bus-stops', 'csv', is_active='true')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('bus-stops.csv', response['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(text)))
+        self.assertEqual([r['stop_id'] for r in rows], ['000', '001', '002', '004'])
+        self.assertEqual(rows[1]['name'], 'Stop, "1"')
+
+        _, text = self.export('bus-stops', 'ndjson', is_active='true')
+        records = [json.loads(line) for line in text.splitlines()]
+        self.assertEqual([(r['stop_id'], r['name'], r['latitude']) for r in records],
+                         [(r['stop_id'], r['name'], float(r['latitude'])) for r in rows])
+
+        _, text = self.export('bus-stops', 'geojson', is_active='true')
+        features = json.loads(text)['features']
+        self.assertEqual([f['properties']['stop_id'] for f in features], ['000', '001', '002', '004'])
+        self.assertEqual(features[2]['geometry'], {'type': 'Point', 'coordinates': [-100.3, 25.72]})
+        self.assertNotIn('latitude', features[0]['properties'])
+
+    def test_filters_and_empty_results(self):
+        User.objects.bulk_create([User(username=f'u{i}', employee_id=f'{i:05d}', shift='A' if i % 2 else 'B')
+                                  for i in range(2, 7)])
+        _, text = self.export('users', 'ndjson', shift='A')
+        self.assertEqual([json.loads(line)['employee_id'] for line in text.splitlines()], ['00003', '00005'])
+        _, text = self.export('bus-stops', 'geojson', source='Nowhere')
+        self.assertEqual(json.loads(text), {'type': 'FeatureCollection', 'features': []})
+        _, text = self.export('bus-stops', 'csv', source='Nowhere')
+        self.assertEqual(text.strip(), 'id,stop_id,name,latitude,longitude,source,is_active,created_at')
+
+    def test_unknown_dataset_format_and_bad_ids(self):
+        self.assertEqual(self.client.get(reverse('export', args=['secrets', 'csv'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('export', args=['users', 'xlsx'])).status_code, 404)
+        response = self.client.get(reverse('export', args=['route-track-points', 'csv']), {'plan_id': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+
+class CoverageMeshEndpointTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='u', password='x' * 10, employee_id='00001')
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        # Square with a square hole, then a triangle.
+        self.mesh = CoverageMesh.objects.create(
+            name='Zone', version='2',
+            min_latitude=25.0, min_longitude=-100.5, max_latitude=26.0, max_longitude=-100.0,
+            geometry=pack_mesh(
+                [0] * 10 + [1] * 4,
+                [0] * 5 + [1] * 5 + [0] * 4,
+                [25, 25, 26, 26, 25, 25.4, 25.4, 25.6, 25.6, 25.4, 25, 25.2, 25, 25],
+                [-100.5, -100, -100, -100.5, -100.5, -100.3, -100.2, -100.2, -100.3, -100.3, -100, -100, -100.1, -100],
+            ),
+        )
+
+    def geometry_url(self):
+        return reverse('coverage-meshes-geometry', args=[self.mesh.pk])
+
+    def test_list_returns_summaries_without_vertices(self):
+        with self.assertNumQueries(1):
+            data = self.client.get(reverse('coverage-meshes-list')).json()
+        self.assertEqual(data, [{
+            'id': self.mesh.pk, 'name': 'Zone', 'version': '2', 'created_at': data[0]['created_at'],
+            'points_count': 14, 'bbox': [-100.5, 25.0, -100.0, 26.0],
+        }])
+        self.assertEqual(self.client.get(reverse('coverage-meshes-detail', args=[self.mesh.pk])).json(), data[0])
+
+    def test_geometry_as_geojson_and_encoded_rings(self):
+        response = self.client.get(self.geometry_url())
+        self.assertEqual(response['Content-Type'], 'application/geo+json')
+        feature = response.json()
+        self.assertEqual((feature['id'], feature['properties']), (self.mesh.pk, {'name': 'Zone', 'version': '2'}))
+        polygons = feature['geometry']['coordinates']
+        self.assertEqual([len(rings) for rings in polygons], [2, 1])
+        self.assertEqual(polygons[1][0], [[-100, 25], [-100, 25.2], [-100.1, 25], [-100, 25]])
+
+        rings = self.client.get(self.geometry_url(), {'encoding': 'polyline'}).json()['rings']
+        self.assertEqual([(r['polygon'], r['ring']) for r in rings], [(0, 0), (0, 1), (1, 0)])
+        self.assertEqual(_decode_polyline(rings[2]['coordinates']), ([25, 25.2, 25, 25], [-100, -100, -100.1, -100]))
+
+    def test_matching_etag_gets_304(self):
+        first = self.client.get(self.geometry_url())
+        etag = first['ETag']
+        self.assertIn(str(self.mesh.pk), etag)
+        again = self.client.get(self.geometry_url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((again.status_code, again.content, again['ETag']), (304, b'', etag))
+        other = self.client.get(self.geometry_url(), {'encoding': 'binary'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(other.status_code, 200)
+        self.assertNotEqual(other['ETag'], etag)
+
+
+class CopyRowsTests(TestCase):
+    def test_copy_text_encoding(self):
+        rows = [(1, np.float64(25.5), None, 'tab\there\\slash\nnewline\rcr', True, np.int64(7))]
+        stream = _CopyStream(rows)
+        self.assertEqual(
+            stream.read(),
+            b'1\t25.5\t\\N\ttab\\there\\\\slash\\nnewline\\rcr\tt\t7\n',
+        )
+        self.assertEqual(stream.count, 1)
+
+    def test_small_reads_reassemble_the_stream(self):
+        rows = [(i, i / 3, f'name {i}') for i in range(500)]
+        whole = _CopyStream(rows).read()
+        stream, chunks = _CopyStream(iter(rows)), []
+        while chunk := stream.read(7):
+            chunks.append(chunk)
+        self.assertEqual(b''.join(chunks), whole)
+        self.assertEqual(stream.count, 500)
+        self.assertEqual(whole.count(b'\n'), 500)
+
+    def test_fallback_writes_all_rows(self):
+        plan = RoutePlan.objects.create(route_plan_name='Plan')
+        route = Route.objects.create(plan=plan, route_name='R')
+        written = copy_rows(
+            RouteTrackPoint, ('route_id', 'latitude', 'longitude', 'order', 'significance_m'),
+            ((route.id, 25.0 + i, -100.0, i, None if i % 2 else float(i)) for i in range(2500)),
+        )
+        self.assertEqual(written, 2500)
+        self.assertEqual(route.trackpoints.count(), 2500)
+        self.assertEqual(route.trackpoints.filter(significance_m__isnull=True).count(), 1250)
+
+
+class ChunkedDeleteTests(TestCase):
+    def make_plan(self, routes=3, points=40):
+        plan = RoutePlan.objects.create(route_plan_name='Plan', is_active=True)
+        for r in range(routes):
+            route = Route.objects.create(plan=plan, route_name=f'R{r}')
+            RouteTrackPoint.objects.bulk_create([
+                RouteTrackPoint(route=route, latitude=25.7, longitude=-100.3, order=i) for i in range(points)
+            ])
+            RouteStopPoint.objects.bulk_create([
+                RouteStopPoint(route=route, latitude=25.7, longitude=-100.3, order=i) for i in range(3)
+            ])
+        return plan
+
+    @mock.patch('backend_api.deletion.DELETE_CHUNK_ROWS', 7)
+    def test_counts_match_django_delete(self):
+        reference = RoutePlan.objects.filter(pk=self.make_plan().pk).delete()
+        progress = mock.Mock()
+        result = bulk_delete(RoutePlan.objects.filter(pk=self.make_plan().pk), progress)
+        self.assertEqual(result, reference)
+        self.assertFalse(RouteTrackPoint.objects.exists() or Route.objects.exists())
+        progress.assert_called_with(1.0, 'Deleted 1 of 1 route plans')
+
+    @mock.patch('backend_api.deletion.DELETE_CHUNK_ROWS', 7)
+    def test_protected_children_block_the_delete(self):
+        plan = self.make_plan()
+        field = RouteTrackPoint._meta.get_field('route')
+        with mock.patch.object(field.remote_field, 'on_delete', models.PROTECT):
+            with self.assertRaises(ProtectedError):
+                RoutePlan.objects.filter(pk=plan.pk).delete()
+            with self.assertRaises(ProtectedError):
+                bulk_delete(RoutePlan.objects.filter(pk=plan.pk))
+        with mock.patch.object(field.remote_field, 'on_delete', models.RESTRICT):
+            with self.assertRaises(RestrictedError):
+                bulk_delete(Route.objects.filter(plan=plan))
+        self.assertEqual((Route.objects.count(), RouteStopPoint.objects.count()), (3, 9))
+
+    @mock.patch('backend_api.deletion.DELETE_CHUNK_ROWS', 2)
+    def test_set_handlers_update_children(self):
+        users = [User.objects.create_user(username=f'u{i}', password='x' * 10, employee_id=f'{i:05d}') for i in range(2)]
+        keep = User.objects.create_user(username='keep', password='x' * 10, employee_id='99999')
+        Job.objects.bulk_create([Job(kind='bulk_delete', created_by=users[i % 2]) for i in range(5)])
+        field = Job._meta.get_field('created_by')
+        with mock.patch.object(field.remote_field, 'on_delete', models.SET(keep)):
+            bulk_delete(User.objects.exclude(pk=keep.pk))
+        self.assertEqual(set(Job.objects.values_list('created_by', flat=True)), {keep.pk})
+
+    @mock.patch('backend_api.deletion.DELETE_CHUNK_ROWS', 2)
+    def test_employee_cascade_and_set_null(self):
+        group = Group.objects.create(name='drivers')
+        users = [User.objects.create_user(username=f'u{i}', password='x' * 10, employee_id=f'{i:05d}') for i in range(5)]
+        group.user_set.add(*users)
+        job = Job.objects.create(kind='bulk_delete', created_by=users[0])
+        keep = User.objects.create_user(username='keep', password='x' * 10, employee_id='99999')
+        total, per_model = bulk_delete(User.objects.exclude(pk=keep.pk))
+        self.assertEqual(per_model, {'accounts.User': 5, 'accounts.PrivacyConsent': 5, 'accounts.User_groups': 5})
+        self.assertEqual(total, 15)
+        self.assertEqual(list(User.objects.values_list('pk', flat=True)), [keep.pk])
+        job.refresh_from_db()
+        self.assertIsNone(job.created_by_id)
+
+    def test_view_deletes_small_cascades_and_queues_large_ones(self):
+        hr = User.objects.create_user(username='hr', password='x' * 10, employee_id='00001', role='HR_Admin')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(hr)}')
+        url = reverse('hr-delete-route')
+        self.assertEqual(client.post(url, {'plan_id': 'abc'}, format='json').status_code, 400)
+        response = client.post(reverse('hr-delete-employees'), {'selected_ids': ['1', 'x']}, format='json')
+        self.assertEqual(response.status_code, 400)
+        small = self.make_plan(routes=1, points=10)
+        response = client.post(url, {'plan_id': small.pk}, format='json')
+        self.assertEqual(response.json(), {'status': 'ok', 'deleted': 15})
+        self.assertFalse(RoutePlan.objects.filter(pk=small.pk).exists())
+
+        large = self.make_plan()
+        with mock.patch('backend_api.views.DELETE_SYNC_MAX_ROWS', 50):
+            response = client.post(url, {'plan_id': large.pk}, format='json')
+        self.assertEqual(response.status_code, 202)
+        job = Job.objects.get(pk=response.json()['job_ids'][0])
+        self.assertEqual((job.kind, job.params), ('bulk_delete', {'target': 'route_plans', 'ids': [large.pk]}))
+        self.assertTrue(RoutePlan.objects.filter(pk=large.pk).exists())
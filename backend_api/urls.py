@@ -3,12 +3,14 @@ from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from accounts.views import MeView, RegisterView, ProtectedView, PrivacyConsentView
 from rest_framework.routers import DefaultRouter
 from .views import (
-    UserViewSet, BusStopViewSet, CoverageMeshViewSet, RoutePlanViewSet,
+    UserViewSet, BusStopViewSet, CoverageMeshViewSet, RoutePlanViewSet, JobViewSet,
     EmployeeLocationView, NearestStopView, NearbyStopsView, EmployeeRoutesView,
+    DistanceMatrixView, ExportView,
     # HR/Admin Data Management endpoints:
     hr_upload_active_employees, hr_upload_minimal_employees,
     hr_delete_employees, hr_upload_bus_stops, hr_delete_bus_stops,
     hr_delete_coverage_mesh, hr_upload_coverage_mesh, hr_upload_route_gpx, hr_delete_route,
+    hr_upload_route_plan, hr_dm_overview,
     health
 )
 
@@ -17,6 +19,7 @@ router.register(r'users', UserViewSet, basename='users')
 router.register(r'bus-stops', BusStopViewSet, basename='bus-stops')
 router.register(r'coverage-meshes', CoverageMeshViewSet, basename='coverage-meshes')
 router.register(r'route-plans', RoutePlanViewSet, basename='route-plans')
+router.register(r'jobs', JobViewSet, basename='jobs')
 
 
 urlpatterns = [
@@ -34,6 +37,10 @@ urlpatterns = [
     path('map/stops/nearest/', NearestStopView.as_view(), name='nearest-stop'),
     path('map/stops/nearby/', NearbyStopsView.as_view(), name='nearby-stops'),
     path('map/routes/employee/', EmployeeRoutesView.as_view(), name='employee-routes'),
+    path('map/distance-matrix/', DistanceMatrixView.as_view(), name='distance-matrix'),
+
+    # Bulk exports (streamed)
+    path('exports/<str:dataset>.<str:fmt>', ExportView.as_view(), name='export'),
 
     # Employee Management
     path('data-management/employees/upload-active/', hr_upload_active_employees, name='hr-upload-active-employees'),
@@ -51,6 +58,10 @@ urlpatterns = [
     # Route Management
     path('data-management/routes/upload/', hr_upload_route_gpx, name='hr-upload-route'),
     path('data-management/routes/delete/', hr_delete_route, name='hr-delete-route'),
+    path('data-management/route-plans/upload/', hr_upload_route_plan, name='hr-upload-route-plan'),
+
+    # Dashboard
+    path('data-management/overview/', hr_dm_overview, name='hr-dm-overview'),
 
     path('', include(router.urls)),
 
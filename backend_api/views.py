@@ -1,19 +1,20 @@
-from rest_framework import viewsets, mixins, status, filters
+from rest_framework import viewsets, mixins, status
 from rest_framework.decorators import action, api_view, permission_classes, parser_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from rest_framework.views import APIView
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.renderers import JSONRenderer
 
 from accounts.models import User
 from .models import (
     BusStop,
     CoverageMesh,
     CoverageMeshPoint,
-    RoutePlan,
+    Job,
     Route,
-    RouteStopPoint,
+    RoutePlan,
     RouteTrackPoint,
 )
 from .serializers import (
@@ -21,27 +22,77 @@ from .serializers import (
     UserUpdateSerializer,
     BusStopSerializer,
     CoverageMeshSerializer,
+    CoverageMeshSummarySerializer,
     RoutePlanSerializer,
+    CompactRoutePlanSerializer,
+    JobSerializer,
+    RunOptimizationSerializer,
+    kept_at_tolerance,
 )
-
-from math import radians, sin, cos, asin, sqrt
-from django.db.models import Q
-from django.http import JsonResponse, HttpResponse
+from .assignments import (
+    assign_unassigned,
+    assignment_for,
+    refresh_for_stops,
+    refresh_for_users,
+)
+from .bulkload import copy_rows
+from .caching import bump_version, cached_payload, cached_value, etag_response, payload_response
+from .coverage import geojson_polygons, load_mesh_geometry, mesh_geojson, mesh_points_count, mesh_rings
+from .deletion import DELETE_SYNC_MAX_ROWS, cascade_size, delete_target
+from .encoding import COMPACT_ENCODINGS, encode_coords
+from .geo import distance_matrix
+from .exports import CONTENT_TYPES as EXPORT_CONTENT_TYPES, DATASETS, WRITERS as EXPORT_WRITERS, export_rows
+from .gpx import GPX_ERRORS, gpx_error, gpx_payloads, iter_gpx_sources, parse_gpx_payload, read_gpx
+from .importers import (
+    RouteWriter,
+    RowErrors,
+    bus_stop_objects,
+    mesh_vertices,
+    get_route_plan,
+    import_minimal_employees,
+    save_parsed_route,
+    upsert_bus_stops,
+)
+from .ingest import iter_csv_frames, iter_csv_rows, open_text, peek_char
+from .jobs import fail_orphaned_jobs, submit_job
+from .packing import pack_mesh, store_geometry_rows
+from .pagination import CreatedPagination, KeysetOrderingFilter, KeysetPagination, StopPagination, UserPagination
+from .simplify import snap_tolerance_m, zoom_to_tolerance_m
+from .spatial import get_stop_index, invalidate_stop_index
+from .workers import pool_map
+from accounts.authentication import ClaimsJWTAuthentication
+from accounts.permissions import IsHRorMaster
+from accounts.roles import authenticate_jwt, invalidate_claims, is_hr_or_master, request_claims
+
+from django.db import transaction
+from django.db.models import Count, Prefetch, Q, Value
+from django.db.models.functions import Concat, Trim
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.views.decorators.csrf import csrf_exempt
 from django.core.paginator import Paginator
+from django.utils.http import quote_etag
 
-import csv
 import json
-import uuid
-from io import StringIO
-import xml.etree.ElementTree as ET
+import os
+import time
+from array import array
+from functools import wraps
+from itertools import chain
 
 # ============================
 # Existing ViewSets/APIs
 # ============================
 
 class UserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all().order_by('-created_at')
+    queryset = User.objects.all().order_by('-created_at', '-id')
     permission_classes = [IsAuthenticated]
+    # Cursor pages by default; ``?page=N`` still gets page-number pagination
+    pagination_class = UserPagination
+    # Enable server-side ordering; optional search via 'q' implemented in get_queryset
+    filter_backends = [KeysetOrderingFilter]
+    ordering_fields = ['created_at', 'username', 'email', 'employee_id', 'company', 'shift', 'is_active']
+    ordering = ['-created_at', '-id']
 
     def get_serializer_class(self):
         if self.action in ['partial_update', 'update']:
@@ -54,6 +105,16 @@ class UserViewSet(viewsets.ModelViewSet):
         company = self.request.query_params.get('company')
         is_active = self.request.query_params.get('is_active')
         employee_status = self.request.query_params.get('employee_status')
+        # Optional lightweight search param 'q'
+        q = self.request.query_params.get('q')
+        if q:
+            needle = q.strip()
+            qs = qs.filter(
+                Q(username__icontains=needle) |
+                Q(email__icontains=needle) |
+                Q(employee_id__icontains=needle) |
+                Q(company__icontains=needle)
+            )
         if shift:
             qs = qs.filter(shift=shift)
         if company:
@@ -64,6 +125,13 @@ class UserViewSet(viewsets.ModelViewSet):
             qs = qs.filter(employee_status=employee_status)
         return qs
 
+    def perform_update(self, serializer):
+        before = (serializer.instance.latitude, serializer.instance.longitude, serializer.instance.is_active)
+        super().perform_update(serializer)
+        user = serializer.instance
+        if (user.latitude, user.longitude, user.is_active) != before:
+            refresh_for_users([user.pk])
+
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def me(self, request):
         serializer = UserListSerializer(request.user)
@@ -74,187 +142,270 @@ class BusStopViewSet(viewsets.ModelViewSet):
     queryset = BusStop.objects.all().order_by('stop_id')
     serializer_class = BusStopSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = StopPagination
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        invalidate_stop_index()
+        refresh_for_stops([serializer.instance.pk])
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        invalidate_stop_index()
+        refresh_for_stops([serializer.instance.pk])
+
+    def perform_destroy(self, instance):
+        pk = instance.pk
+        super().perform_destroy(instance)
+        invalidate_stop_index()
+        refresh_for_stops([pk])
 
 
 class CoverageMeshViewSet(mixins.CreateModelMixin,
                           mixins.ListModelMixin,
+                          mixins.RetrieveModelMixin,
                           viewsets.GenericViewSet):
-    queryset = CoverageMesh.objects.all().order_by('-created_at')
+    queryset = CoverageMesh.objects.defer('geometry').order_by('-created_at')
     serializer_class = CoverageMeshSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CreatedPagination
 
+    def get_queryset(self):
+        qs = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            qs = qs.annotate(points_count=mesh_points_count())
+        return qs
 
-class RoutePlanViewSet(mixins.ListModelMixin,
-                       mixins.RetrieveModelMixin,
-                       viewsets.GenericViewSet):
-    queryset = RoutePlan.objects.prefetch_related('routes__stops', 'routes__trackpoints').all().order_by('-created_at')
-    serializer_class = RoutePlanSerializer
-    permission_classes = [IsAuthenticated]
-
-    @action(detail=False, methods=['get'])
-    def active(self, request):
-        plan = RoutePlan.objects.prefetch_related('routes__stops', 'routes__trackpoints').filter(is_active=True).first()
-        if not plan:
-            return Response({'detail': 'No active plan'}, status=status.HTTP_204_NO_CONTENT)
-        return Response(self.get_serializer(plan).data)
-
+    def get_serializer_class(self):
+        # Geometry is only served by the ``geometry`` action.
+        if self.action in ('list', 'retrieve'):
+            return CoverageMeshSummarySerializer
+        return super().get_serializer_class()
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        bump_version('coverage_meshes')
+
+    @action(detail=True, methods=['get'])
+    def geometry(self, request, pk=None):
+        """The mesh's rings as GeoJSON, or per-ring ``?encoding=polyline|binary`` strings.
+
+        Mesh geometry never changes after upload, so the body is cached and
+        the ETag is keyed on the mesh's id, version and creation time only.
+        """
+        encoding = _coord_encoding(request)
+        mesh = self.get_object()
+        parts = (mesh.id, mesh.version, mesh.created_at.timestamp(), encoding or 'geojson')
+        body = cached_value(
+            'coverage_mesh_geometry',
+            lambda: _render_mesh_geometry(mesh, encoding),
+            *parts,
+            timeout=MESH_GEOMETRY_CACHE_TTL,
+        )
+        etag = quote_etag('-'.join(map(str, parts)))
+        return etag_response(request, etag, body,
+                             content_type='application/json' if encoding else 'application/geo+json')
+
+    def _rows_inside(self, mesh, queryset, *fields):
+        """``(lat, lng, *fields)`` rows of ``queryset`` that fall inside ``mesh``.
+
+        The stored bounding box narrows the query first; the remaining rows are
+        tested in one vectorized pass against the cached mesh geometry.
+        """
+        if mesh.min_latitude is not None:
+            queryset = queryset.filter(
+                latitude__gte=mesh.min_latitude, latitude__lte=mesh.max_latitude,
+                longitude__gte=mesh.min_longitude, longitude__lte=mesh.max_longitude,
+            )
+        rows = list(queryset.filter(latitude__isnull=False, longitude__isnull=False)
+                    .values_list('latitude', 'longitude', *fields))
+        if not rows:
+            return []
+        lats, lngs = zip(*((r[0], r[1]) for r in rows))
+        mask = load_mesh_geometry(mesh.id, mesh.created_at).contains(lats, lngs)
+        return [r for r, inside in zip(rows, mask) if inside]
+
+    @action(detail=True, methods=['get'], permission_classes=[IsHRorMaster])
+    def users(self, request, pk=None):
+        """Employees whose home location falls inside the mesh (``?is_active=true|false``)."""
+        mesh = self.get_object()
+        qs = User.objects.all()
+        is_active = request.query_params.get('is_active')
+        if is_active is not None:
+            qs = qs.filter(is_active=is_active.lower() in ('1', 'true', 'yes'))
+        inside = self._rows_inside(mesh, qs, 'id', 'employee_id')
+        return Response({
+            'mesh_id': mesh.id,
+            'count': len(inside),
+            'results': [
+                {'id': user_id, 'employee_id': employee_id, 'latitude': lat, 'longitude': lng}
+                for lat, lng, user_id, employee_id in inside
+            ],
+        })
 
-def haversine_m(lat1, lon1, lat2, lon2):
-    R = 6371000.0
-    dlat = radians(lat2 - lat1)
-    dlon = radians(l2 := lon2) - radians(lon1)  # minor refactor to avoid re-parsing
-    a = sin(dlat/2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a))
-    return R * c
+    @action(detail=True, methods=['get'], url_path='bus-stops')
+    def bus_stops(self, request, pk=None):
+        """Active bus stops inside the mesh."""
+        mesh = self.get_object()
+        inside = self._rows_inside(mesh, BusStop.objects.filter(is_active=True), 'id', 'stop_id', 'name')
+        return Response({
+            'mesh_id': mesh.id,
+            'count': len(inside),
+            'results': [
+                {'id': stop_pk, 'stop_id': stop_id, 'name': name, 'latitude': lat, 'longitude': lng}
+                for lat, lng, stop_pk, stop_id, name in inside
+            ],
+        })
 
 
-class EmployeeLocationView(APIView):
-    permission_classes = [IsAuthenticated]
-    def get(self, request):
-        u = request.user
-        if u.latitude is None or u.longitude is None:
-            return Response({'detail': 'No registered location'}, status=status.HTTP_404_NOT_FOUND)
-        return Response({'lat': u.latitude, 'lng': u.longitude})
+MESH_GEOMETRY_CACHE_TTL = 24 * 3600
 
 
-class NearestStopView(APIView):
-    permission_classes = [IsAuthenticated]
-    def get(self, request):
-        u = request.user
-        if u.latitude is None or u.longitude is None:
-            return Response({'detail': 'No registered location'}, status=status.HTTP_404_NOT_FOUND)
-        stops = list(BusStop.objects.filter(is_active=True))
-        if not stops:
-            return Response({'detail': 'No stops available'}, status=status.HTTP_404_NOT_FOUND)
-        best = min(stops, key=lambda s: haversine_m(u.latitude, u.longitude, s.latitude, s.longitude))
-        distance_m = haversine_m(u.latitude, u.longitude, best.latitude, best.longitude)
-        data = BusStopSerializer(best).data
-        return Response({'stop': {
-            'id': data['id'],
-            'name': data['name'],
-            'latitude': data['latitude'],
-            'longitude': data['longitude'],
-        }, 'distance_m': distance_m})
+def _render_mesh_geometry(mesh, encoding=None):
+    if not encoding:
+        return JSONRenderer().render({
+            "type": "Feature",
+            "id": mesh.id,
+            "properties": {"name": mesh.name, "version": mesh.version},
+            "geometry": mesh_geojson(mesh.id),
+        })
+    return JSONRenderer().render({
+        "id": mesh.id,
+        "name": mesh.name,
+        "version": mesh.version,
+        "encoding": encoding,
+        "rings": [
+            {"polygon": polygon, "ring": ring, "coordinates": encode_coords(encoding, lats, lngs)}
+            for polygon, ring, lats, lngs in mesh_rings(mesh.id)
+        ],
+    })
+
+
+def _coord_encoding(request):
+    """Return the requested compact encoding ('polyline'/'binary'), None for nested JSON.
+
+    The query parameter is ``encoding`` because ``format`` is reserved by DRF's
+    URL_FORMAT_OVERRIDE for renderer selection.
+    """
+    encoding = request.query_params.get('encoding')
+    if encoding in (None, '', 'json'):
+        return None
+    if encoding not in COMPACT_ENCODINGS:
+        raise ValidationError({'encoding': f"Must be one of: json, {', '.join(COMPACT_ENCODINGS)}"})
+    return encoding
 
 
-class NearbyStopsView(APIView):
+class RoutePlanViewSet(mixins.ListModelMixin,
+                       mixins.RetrieveModelMixin,
+                       viewsets.GenericViewSet):
+    queryset = RoutePlan.objects.prefetch_related(
+        'routes__stops',
+        # Rows are only needed for routes without a packed track
+        Prefetch('routes__trackpoints', queryset=RouteTrackPoint.objects.filter(route__track__isnull=True)),
+    ).order_by('-created_at')
+    serializer_class = RoutePlanSerializer
     permission_classes = [IsAuthenticated]
-    def get(self, request):
-        u = request.user
-        limit = int(request.query_params.get('limit', 100))
-        qs = BusStop.objects.filter(is_active=True)
-        if u.latitude is None or u.longitude is None:
-            stops = qs.order_by('stop_id')[:limit]
-            return Response(BusStopSerializer(stops, many=True).data)
-        stops = list(qs)
-        stops.sort(key=lambda s: haversine_m(u.latitude, u.longitude, s.latitude, s.longitude))
-        return Response(BusStopSerializer(stops[:limit], many=True).data)
-
+    pagination_class = CreatedPagination
 
-class EmployeeRoutesView(APIView):
-    permission_classes = [IsAuthenticated]
-    def get(self, request):
-        plan = RoutePlan.objects.prefetch_related('routes__stops', 'routes__trackpoints').filter(is_active=True).first()
-        if not plan:
-            return Response({'routes': []})
-        return Response(RoutePlanSerializer(plan).data)
+    def get_queryset(self):
+        if _coord_encoding(self.request):
+            return RoutePlan.objects.all().order_by('-created_at')
+        return super().get_queryset()
 
+    def get_serializer_class(self):
+        if _coord_encoding(self.request):
+            return CompactRoutePlanSerializer
+        return super().get_serializer_class()
 
-# ============================
-# Existing ViewSets/APIs
-# ============================
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['encoding'] = _coord_encoding(self.request)
+        return context
 
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 10
-    page_size_query_param = 'page_size'
-    max_page_size = 200
+    @action(detail=False, methods=['get'])
+    def active(self, request):
+        return payload_response(
+            request, _active_plan_payload(_coord_encoding(request)),
+            empty=Response({'detail': 'No active plan'}, status=status.HTTP_204_NO_CONTENT),
+        )
 
+    @action(detail=False, methods=['post'], permission_classes=[IsHRorMaster])
+    def optimize(self, request):
+        """Queue a route-optimization job; poll ``jobs/<id>/`` for progress and the new plan."""
+        serializer = RunOptimizationSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        job = serializer.save()
+        return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
 
-class UserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all().order_by('-created_at')
-    permission_classes = [IsAuthenticated]
-    pagination_class = StandardResultsSetPagination
-    # Enable server-side ordering; optional search via 'q' implemented in get_queryset
-    filter_backends = [filters.OrderingFilter]
-    ordering_fields = ['created_at', 'username', 'email', 'employee_id', 'company', 'shift', 'is_active']
-    ordering = ['-created_at']
 
-    def get_serializer_class(self):
-        if self.action in ['partial_update', 'update']:
-            return UserUpdateSerializer
-        return UserListSerializer
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+    permission_classes = [IsHRorMaster]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
+        fail_orphaned_jobs()
         qs = super().get_queryset()
-        shift = self.request.query_params.get('shift')
-        company = self.request.query_params.get('company')
-        is_active = self.request.query_params.get('is_active')
-        employee_status = self.request.query_params.get('employee_status')
-        # Optional lightweight search param 'q'
-        q = self.request.query_params.get('q')
-        if q:
-            needle = q.strip()
-            qs = qs.filter(
-                Q(username__icontains=needle) |
-                Q(email__icontains=needle) |
-                Q(employee_id__icontains=needle) |
-                Q(company__icontains=needle)
-            )
-        if shift:
-            qs = qs.filter(shift=shift)
-        if company:
-            qs = qs.filter(company=company)
-        if is_active in ['true', 'false']:
-            qs = qs.filter(is_active=(is_active == 'true'))
-        if employee_status:
-            qs = qs.filter(employee_status=employee_status)
+        kind = self.request.query_params.get('kind')
+        job_status = self.request.query_params.get('status')
+        if kind:
+            qs = qs.filter(kind=kind)
+        if job_status:
+            qs = qs.filter(status=job_status)
         return qs
 
-    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
-    def me(self, request):
-        serializer = UserListSerializer(request.user)
-        return Response(serializer.data)
-
 
-class BusStopViewSet(viewsets.ModelViewSet):
-    queryset = BusStop.objects.all().order_by('stop_id')
-    serializer_class = BusStopSerializer
-    permission_classes = [IsAuthenticated]
-
-
-class CoverageMeshViewSet(mixins.CreateModelMixin,
-                          mixins.ListModelMixin,
-                          viewsets.GenericViewSet):
-    queryset = CoverageMesh.objects.all().order_by('-created_at')
-    serializer_class = CoverageMeshSerializer
-    permission_classes = [IsAuthenticated]
-
-
-class RoutePlanViewSet(mixins.ListModelMixin,
-                       mixins.RetrieveModelMixin,
-                       viewsets.GenericViewSet):
-    queryset = RoutePlan.objects.prefetch_related('routes__stops', 'routes__trackpoints').all().order_by('-created_at')
-    serializer_class = RoutePlanSerializer
-    permission_classes = [IsAuthenticated]
-
-    @action(detail=False, methods=['get'])
-    def active(self, request):
-        plan = RoutePlan.objects.prefetch_related('routes__stops', 'routes__trackpoints').filter(is_active=True).first()
-        if not plan:
-            return Response({'detail': 'No active plan'}, status=status.HTTP_204_NO_CONTENT)
-        return Response(self.get_serializer(plan).data)
+def _track_tolerance(request):
+    """Simplification tolerance in metres from ``tolerance`` or ``zoom``; None for the raw track."""
+    tolerance = request.query_params.get('tolerance')
+    zoom = request.query_params.get('zoom')
+    try:
+        if tolerance not in (None, ''):
+            tolerance_m = float(tolerance)
+        elif zoom not in (None, ''):
+            tolerance_m = zoom_to_tolerance_m(int(zoom))
+        else:
+            return None
+    except ValueError:
+        raise ValidationError({'detail': 'tolerance and zoom must be numeric'})
+    if not tolerance_m > 0:
+        return None
+    # Snap to the zoom ladder so arbitrary client values share cache entries.
+    return snap_tolerance_m(tolerance_m)
+
+
+def _render_active_plan(encoding=None, tolerance_m=None):
+    if encoding:
+        plan = RoutePlan.objects.filter(is_active=True).first()
+    else:
+        trackpoints = RouteTrackPoint.objects.filter(route__track__isnull=True)
+        if tolerance_m:
+            trackpoints = trackpoints.filter(kept_at_tolerance(tolerance_m))
+        plan = (RoutePlan.objects
+                .prefetch_related('routes__stops', Prefetch('routes__trackpoints', queryset=trackpoints))
+                .filter(is_active=True).first())
+    if not plan:
+        return b''
+    if encoding:
+        data = CompactRoutePlanSerializer(plan, context={'encoding': encoding, 'tolerance_m': tolerance_m}).data
+    else:
+        data = RoutePlanSerializer(plan, context={'tolerance_m': tolerance_m}).data
+    return JSONRenderer().render(data)
 
 
-def haversine_m(lat1, lon1, lat2, lon2):
-    R = 6371000.0
-    dlat = radians(lat2 - lat1)
-    dlon = radians(l2 := lon2) - radians(lon1)  # minor refactor to avoid re-parsing
-    a = sin(dlat/2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a))
-    return R * c
+def _active_plan_payload(encoding=None, tolerance_m=None):
+    """Rendered JSON of the active plan, cached until a route upload/delete bumps 'active_plan'."""
+    return cached_payload(
+        'active_plan',
+        lambda: _render_active_plan(encoding, tolerance_m),
+        encoding or 'json',
+        tolerance_m or 'raw',
+    )
 
 
 class EmployeeLocationView(APIView):
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
     def get(self, request):
         u = request.user
@@ -264,153 +415,252 @@ class EmployeeLocationView(APIView):
 
 
 class NearestStopView(APIView):
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
     def get(self, request):
         u = request.user
         if u.latitude is None or u.longitude is None:
             return Response({'detail': 'No registered location'}, status=status.HTTP_404_NOT_FOUND)
-        stops = list(BusStop.objects.filter(is_active=True))
-        if not stops:
+        # Token-backed users only read; their location may be up to one token lifetime old.
+        assignment = assignment_for(u, persist=isinstance(u, User))
+        if assignment is None:
             return Response({'detail': 'No stops available'}, status=status.HTTP_404_NOT_FOUND)
-        best = min(stops, key=lambda s: haversine_m(u.latitude, u.longitude, s.latitude, s.longitude))
-        distance_m = haversine_m(u.latitude, u.longitude, best.latitude, best.longitude)
-        data = BusStopSerializer(best).data
+        best = assignment.stop
         return Response({'stop': {
-            'id': data['id'],
-            'name': data['name'],
-            'latitude': data['latitude'],
-            'longitude': data['longitude'],
-        }, 'distance_m': distance_m})
+            'id': best.id,
+            'name': best.name,
+            'latitude': best.latitude,
+            'longitude': best.longitude,
+        }, 'distance_m': assignment.distance_m})
 
 
 class NearbyStopsView(APIView):
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
     def get(self, request):
         u = request.user
-        limit = int(request.query_params.get('limit', 100))
+        try:
+            limit = int(request.query_params.get('limit', 100))
+            radius_m = request.query_params.get('radius_m')
+            radius_m = float(radius_m) if radius_m not in (None, '') else None
+        except ValueError:
+            return Response({'detail': 'limit and radius_m must be numeric'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit <= 0 or (radius_m is not None and radius_m < 0):
+            return Response({'detail': 'limit and radius_m must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+
         qs = BusStop.objects.filter(is_active=True)
         if u.latitude is None or u.longitude is None:
             stops = qs.order_by('stop_id')[:limit]
             return Response(BusStopSerializer(stops, many=True).data)
-        stops = list(qs)
-        stops.sort(key=lambda s: haversine_m(u.latitude, u.longitude, s.latitude, s.longitude))
-        return Response(BusStopSerializer(stops[:limit], many=True).data)
+
+        index = get_stop_index()
+        if radius_m is None:
+            hits = index.nearest(u.latitude, u.longitude, k=limit)
+        else:
+            hits = index.within(u.latitude, u.longitude, radius_m, limit=limit)
+        by_id = qs.in_bulk([pk for pk, _ in hits])
+        data = []
+        for pk, distance_m in hits:
+            stop = by_id.get(pk)
+            if stop is None:
+                continue
+            item = BusStopSerializer(stop).data
+            item['distance_m'] = distance_m
+            data.append(item)
+        return Response(data)
 
 
 class EmployeeRoutesView(APIView):
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
     def get(self, request):
-        plan = RoutePlan.objects.prefetch_related('routes__stops', 'routes__trackpoints').filter(is_active=True).first()
-        if not plan:
-            return Response({'routes': []})
-        return Response(RoutePlanSerializer(plan).data)
+        return payload_response(
+            request, _active_plan_payload(_coord_encoding(request), _track_tolerance(request)),
+            empty=Response({'routes': []}),
+        )
+
+
+MAX_MATRIX_CELLS = 2_000_000
+
+
+def _csv_param(request, name):
+    raw = request.query_params.get(name, '')
+    return [v.strip() for v in raw.split(',') if v.strip()]
+
+
+class DistanceMatrixView(APIView):
+    """Great-circle distances (metres) between active employees and active stops."""
+    permission_classes = [IsHRorMaster]
+
+    def get(self, request):
+        users = User.objects.filter(is_active=True, latitude__isnull=False, longitude__isnull=False)
+        employee_ids = _csv_param(request, 'employee_ids')
+        if employee_ids:
+            users = users.filter(employee_id__in=employee_ids)
+        shift = request.query_params.get('shift')
+        if shift:
+            users = users.filter(shift=shift)
+        company = request.query_params.get('company')
+        if company:
+            users = users.filter(company=company)
+
+        stops = BusStop.objects.filter(is_active=True)
+        stop_ids = _csv_param(request, 'stop_ids')
+        if stop_ids:
+            stops = stops.filter(stop_id__in=stop_ids)
+
+        user_rows = list(users.order_by('employee_id').values_list('employee_id', 'latitude', 'longitude'))
+        stop_rows = list(stops.order_by('stop_id').values_list('stop_id', 'latitude', 'longitude'))
+        if len(user_rows) * len(stop_rows) > MAX_MATRIX_CELLS:
+            return Response(
+                {'detail': f'Matrix too large ({len(user_rows)} x {len(stop_rows)}); narrow the employee or stop set.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not user_rows or not stop_rows:
+            return Response({'employees': [r[0] for r in user_rows],
+                             'stops': [r[0] for r in stop_rows],
+                             'distances_m': []})
+
+        emp_ids, emp_lat, emp_lng = zip(*user_rows)
+        st_ids, st_lat, st_lng = zip(*stop_rows)
+        matrix = distance_matrix(emp_lat, emp_lng, st_lat, st_lng)
+        return Response({
+            'employees': list(emp_ids),
+            'stops': list(st_ids),
+            'distances_m': matrix.round(1).tolist(),
+        })
+
+
+class ExportView(APIView):
+    """Stream a full dataset as ``exports/<dataset>.<ndjson|csv|geojson>``.
+
+    The format is part of the path because ``?format=`` is reserved by DRF's
+    renderer selection.
+    """
+    permission_classes = [IsHRorMaster]
+    def get(self, request, dataset, fmt):
+        if dataset not in DATASETS:
+            return Response({'detail': f"Unknown dataset. Choose one of: {', '.join(DATASETS)}"},
+                            status=status.HTTP_404_NOT_FOUND)
+        if fmt not in EXPORT_WRITERS:
+            return Response({'detail': f"Unknown format. Choose one of: {', '.join(EXPORT_WRITERS)}"},
+                            status=status.HTTP_404_NOT_FOUND)
+        try:
+            fields, rows = export_rows(dataset, request.query_params)
+        except ValueError:
+            return Response({'detail': 'Id filters must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(EXPORT_WRITERS[fmt](fields, rows), content_type=EXPORT_CONTENT_TYPES[fmt])
+        response['Content-Disposition'] = f'attachment; filename="{dataset}.{fmt}"'
+        return response
 
 
 # ============================
 # HR/Admin Data Management APIs (unchanged from your version)
 # ============================
 
-def _user_role(user):
-    try:
-        if hasattr(user, 'role') and user.role:
-            return str(user.role).upper()
-    except Exception:
-        pass
-    return "GUEST"
-
-
 def _hr_or_master_required(fn):
+    """Same check as ``IsHRorMaster``; also accepts a bearer token on these plain Django views.
+
+    Like DRF, CSRF is only enforced for session-authenticated requests.
+    """
+    @csrf_exempt
+    @wraps(fn)
     def wrapper(request, *args, **kwargs):
+        authenticate_jwt(request)
         if not request.user or not request.user.is_authenticated:
             return JsonResponse({"detail": "Authentication required"}, status=401)
-        role = _user_role(request.user)
-        if role not in ["HR_ADMIN", "MASTER_ADMIN"]:
+        if getattr(request, 'auth', None) is None:
+            csrf = CsrfViewMiddleware(lambda req: None)
+            csrf.process_request(request)
+            rejected = csrf.process_view(request, None, (), {})
+            if rejected is not None:
+                return rejected
+        if not is_hr_or_master(request_claims(request)):
             return JsonResponse({"detail": "Forbidden"}, status=403)
         return fn(request, *args, **kwargs)
     return wrapper
 
 
+def _bus_stop_summary():
+    counts = BusStop.objects.aggregate(total=Count('id'), active=Count('id', filter=Q(is_active=True)))
+    return {**counts, "inactive": counts["total"] - counts["active"]}
+
+
+def _coverage_summary():
+    return [
+        {**mesh, "created_at": str(mesh["created_at"])}
+        for mesh in CoverageMesh.objects.annotate(points_count=mesh_points_count())
+        .order_by('-created_at')
+        .values('id', 'name', 'version', 'points_count', 'created_at')
+    ]
+
+
+def _route_plan_summary():
+    return [
+        {**plan, "created_at": str(plan["created_at"])}
+        for plan in RoutePlan.objects.annotate(routes_count=Count('routes'))
+        .order_by('-created_at')
+        .values('id', 'route_plan_name', 'bus_supplier', 'is_active', 'routes_count', 'created_at')
+    ]
+
+
+_EMPLOYEE_FIELDS = ('id', 'employee_id', 'name', 'email', 'company', 'shift',
+                    'latitude', 'longitude', 'is_active', 'created_at')
+
+
 @_hr_or_master_required
 def hr_dm_overview(request):
-    """Main data management dashboard API - uses User model as employees"""
-    role = _user_role(request.user)
+    """Main data management dashboard API - uses User model as employees
+
+    The stop, mesh and plan summaries are aggregate queries cached under the
+    ``stops``, ``coverage_meshes`` and ``route_plans`` versions, which the
+    upload/delete endpoints bump.
+    """
+    role = request_claims(request)['role']
 
     q = request.GET.get("q", "")
     sort_field = request.GET.get("sort", "employee_id")
     dir_ = request.GET.get("dir", "asc").lower()
     show_all = str(request.GET.get("show_all", "0")).lower() in ["1", "true", "yes"]
 
+    # User has no ``name`` field; it is built from first/last name.
     sort_map = {
-        "employee_id": "employee_id",
-        "name": "name",
-        "company": "company",
+        "employee_id": ["employee_id"],
+        "name": ["first_name", "last_name"],
+        "company": ["company"],
     }
-    actual_sort = sort_map.get(sort_field, "employee_id")
-    sort = actual_sort if dir_ == "asc" else f"-{actual_sort}"
+    actual_sort = sort_map.get(sort_field, ["employee_id"])
+    sort = actual_sort if dir_ == "asc" else [f"-{f}" for f in actual_sort]
 
     qs = User.objects.all()
     if q:
-        qs = qs.filter(Q(name__icontains=q) | Q(employee_id__icontains=q))
-    qs = qs.order_by(sort)
+        qs = qs.filter(
+            Q(first_name__icontains=q) | Q(last_name__icontains=q) | Q(employee_id__icontains=q)
+        )
+    qs = qs.annotate(name=Trim(Concat('first_name', Value(' '), 'last_name'))).order_by(*sort)
 
     if show_all:
-        employees_payload = list(qs.values(
-            'id', 'employee_id', 'name', 'email', 'company', 'shift',
-            'latitude', 'longitude', 'is_active', 'created_at'
-        ))
+        employees_payload = list(qs.values(*_EMPLOYEE_FIELDS))
         total_pages = 1
+        total_count = len(employees_payload)
     else:
-        page = int(request.GET.get("page", 1))
+        page = request.GET.get("page", 1)
         paginator = Paginator(qs, 10)
         page_obj = paginator.get_page(page)
-        employees_payload = list(page_obj.object_list.values(
-            'id', 'employee_id', 'name', 'email', 'company', 'shift',
-            'latitude', 'longitude', 'is_active', 'created_at'
-        ))
+        employees_payload = list(page_obj.object_list.values(*_EMPLOYEE_FIELDS))
         total_pages = paginator.num_pages
-
-    bus_stops_count = BusStop.objects.count()
-    bus_stops_active = BusStop.objects.filter(is_active=True).count()
-
-    coverage_meshes = CoverageMesh.objects.all()
-    coverage_summary = [
-        {
-            "id": mesh.id,
-            "name": mesh.name,
-            "version": mesh.version,
-            "points_count": mesh.points.count(),
-            "created_at": str(mesh.created_at)
-        }
-        for mesh in coverage_meshes
-    ]
-
-    route_plans = RoutePlan.objects.all()
-    route_summary = [
-        {
-            "id": plan.id,
-            "route_plan_name": plan.route_plan_name,
-            "bus_supplier": plan.bus_supplier,
-            "is_active": plan.is_active,
-            "routes_count": plan.routes.count(),
-            "created_at": str(plan.created_at)
-        }
-        for plan in route_plans
-    ]
+        total_count = paginator.count
 
     data = {
         "role": role,
         "employees": {
             "results": employees_payload,
             "total_pages": total_pages,
-            "total_count": qs.count()
+            "total_count": total_count
         },
-        "bus_stops": {
-            "total": bus_stops_count,
-            "active": bus_stops_active,
-            "inactive": bus_stops_count - bus_stops_active
-        },
-        "coverage_meshes": coverage_summary,
-        "route_plans": route_summary,
+        "bus_stops": cached_value('stops', _bus_stop_summary, 'dm_summary'),
+        "coverage_meshes": cached_value('coverage_meshes', _coverage_summary, 'dm_summary'),
+        "route_plans": cached_value('route_plans', _route_plan_summary, 'dm_summary'),
     }
     return JsonResponse(data)
 
@@ -426,26 +676,40 @@ def hr_upload_active_employees(request):
         return JsonResponse({"detail": "No file"}, status=400)
 
     try:
-        import pandas as pd
-        decoded = f.read().decode("iso-8859-1")
-        df = pd.read_csv(StringIO(decoded))
-        df.columns = [c.strip().lower() for c in df.columns]
-
-        if 'numero de personal' not in df.columns:
-            return JsonResponse({"detail": "Column 'Numero de personal' not found."}, status=400)
-
-        active_ids = set(df['numero de personal'].astype(str))
-        updated = 0
-
-        for user in User.objects.all():
-            if hasattr(user, 'employee_id') and user.employee_id:
-                new_active = user.employee_id in active_ids
-                if user.is_active != new_active:
-                    user.is_active = new_active
-                    user.save()
-                    updated += 1
-
-        return JsonResponse({"updated": updated})
+        started = time.perf_counter()
+        active_ids = set()
+        for df in iter_csv_frames(f, encoding="iso-8859-1", dtype=str):
+            if 'numero de personal' not in df.columns:
+                return JsonResponse({"detail": "Column 'Numero de personal' not found."}, status=400)
+            # Same normalisation as User.save(): exactly 5 digits, zero padded.
+            raw_ids = df['numero de personal'].dropna().str.strip()
+            active_ids.update(raw_ids[raw_ids != ''].str.zfill(5).str[:5])
+        parsed = time.perf_counter()
+
+        with_id = User.objects.exclude(employee_id='')
+        with transaction.atomic():
+            to_activate = with_id.filter(is_active=False, employee_id__in=active_ids)
+            to_deactivate = with_id.filter(is_active=True).exclude(employee_id__in=active_ids)
+            activated = list(to_activate.select_for_update().values_list('employee_id', flat=True))
+            deactivated = list(to_deactivate.select_for_update().values_list('employee_id', flat=True))
+            User.objects.filter(employee_id__in=activated).update(is_active=True)
+            User.objects.filter(employee_id__in=deactivated).update(is_active=False)
+            # Drop the deactivated users' assignments and give the activated ones theirs.
+            refresh_for_users(User.objects.filter(employee_id__in=deactivated).values_list('id', flat=True))
+            if activated:
+                assign_unassigned()
+        finished = time.perf_counter()
+
+        return JsonResponse({
+            "updated": len(activated) + len(deactivated),
+            "activated": sorted(activated),
+            "deactivated": sorted(deactivated),
+            "timings_ms": {
+                "parse": round((parsed - started) * 1000, 1),
+                "reconcile": round((finished - parsed) * 1000, 1),
+                "total": round((finished - started) * 1000, 1),
+            },
+        })
     except Exception as e:
         return JsonResponse({"detail": str(e)}, status=500)
 
@@ -461,41 +725,45 @@ def hr_upload_minimal_employees(request):
         return JsonResponse({"detail": "No file"}, status=400)
 
     try:
-        decoded = csv_file.read().decode("utf-8").splitlines()
-        reader = csv.reader(decoded)
-        created = 0
+        result = import_minimal_employees(iter_csv_rows(csv_file))
+        if result["created"]:
+            assign_unassigned()
+        return JsonResponse(result)
+    except Exception as e:
+        return JsonResponse({"detail": str(e)}, status=500)
 
-        for row in reader:
-            if len(row) < 6:
-                continue
-            employee_id, company, utilization, shift, lat_str, lon_str = row[:6]
 
-            try:
-                lat = float(lat_str)
-                lon = float(lon_str)
-            except Exception:
-                continue
+def _int_ids(values):
+    """Request ids as ints; raises ``ValueError`` if any of them is not an integer."""
+    if not isinstance(values, (list, tuple)):
+        values = [values]
+    return [int(str(value).strip()) for value in values]
 
-            if User.objects.filter(employee_id=employee_id).exists():
-                continue
 
-            User.objects.create(
-                username=f"emp_{uuid.uuid4().hex[:8]}",
-                email=f"emp_{employee_id}@temp.com",
-                employee_id=employee_id,
-                name=f"Employee {employee_id}",
-                company=str(company),
-                shift=str(shift),
-                latitude=lat,
-                longitude=lon,
-                is_active=True,
-            )
-            created += 1
+def _delete_or_queue(request, target, ids=None):
+    """Delete ``target`` rows now, or queue a ``bulk_delete`` job for large cascades.
+
+    ``ids`` must already be ints (see ``_int_ids``). Returns ``(deleted, job)``;
+    ``job`` is None when the delete ran in the request.
+    """
+    if cascade_size(target, ids) > DELETE_SYNC_MAX_ROWS:
+        params = {'target': target, 'ids': ids}
+        if target == 'employees':
+            # Lock the accounts out now rather than when the job gets to them.
+            User.objects.filter(pk__in=params['ids']).update(is_active=False)
+            invalidate_claims(*params['ids'])
+        return 0, submit_job('bulk_delete', params, request.user)
+    deleted, _ = delete_target(target, ids)
+    return deleted, None
 
-        return JsonResponse({"created": created})
-    except Exception as e:
-        return JsonResponse({"detail": str(e)}, status=500)
 
+def _delete_response(deleted, jobs, **extra):
+    if not jobs:
+        return JsonResponse({**extra, "deleted": deleted})
+    return JsonResponse({
+        **extra, "status": "queued", "deleted": deleted,
+        "job_ids": [job.id for job in jobs],
+    }, status=202)
 
 @_hr_or_master_required
 def hr_delete_employees(request):
@@ -510,9 +778,13 @@ def hr_delete_employees(request):
     ids = body.get("selected_ids") or request.POST.getlist("selected_ids")
     if not ids:
         return JsonResponse({"deleted": 0})
+    try:
+        ids = _int_ids(ids)
+    except ValueError:
+        return JsonResponse({"detail": "selected_ids must be integers"}, status=400)
 
-    deleted, _ = User.objects.filter(id__in=ids).delete()
-    return JsonResponse({"deleted": deleted})
+    deleted, job = _delete_or_queue(request, 'employees', ids)
+    return _delete_response(deleted, [job] if job else [])
 
 
 @_hr_or_master_required
@@ -526,31 +798,52 @@ def hr_upload_bus_stops(request):
         return JsonResponse({"detail": "No file"}, status=400)
 
     try:
-        import pandas as pd
-        df = pd.read_csv(StringIO(file.read().decode("utf-8")))
-        df.columns = [c.strip().lower() for c in df.columns]
-
         required = ['stop_id', 'name', 'latitude', 'longitude']
-        if not all(col in df.columns for col in required):
-            return JsonResponse({"detail": "CSV missing required columns: stop_id, name, latitude, longitude"}, status=400)
-
-        BusStop.objects.all().delete()
-
-        objs = []
-        for _, row in df.iterrows():
-            objs.append(BusStop(
-                stop_id=str(row['stop_id']),
-                name=str(row['name']),
-                latitude=float(row['latitude']),
-                longitude=float(row['longitude']),
-                source=row.get('source', 'Generated')
-            ))
-
-        BusStop.objects.bulk_create(objs)
+        mode = request.POST.get("mode", "upsert")
+        if mode not in ("upsert", "replace"):
+            return JsonResponse({"detail": "mode must be 'upsert' or 'replace'"}, status=400)
+
+        uploaded = created = updated = unchanged = deactivated = 0
+        errors = RowErrors()
+        seen_ids = set()
+        with transaction.atomic():
+            for i, df in enumerate(iter_csv_frames(file, dtype=str)):
+                if i == 0:
+                    if not all(col in df.columns for col in required):
+                        return JsonResponse({"detail": "CSV missing required columns: stop_id, name, latitude, longitude"}, status=400)
+                    if mode == "replace":
+                        BusStop.objects.all().delete()
+
+                objs = bus_stop_objects(df, errors, seen_ids)
+                if mode == "replace":
+                    BusStop.objects.bulk_create(objs)
+                    created += len(objs)
+                else:
+                    c, u, n = upsert_bus_stops(objs)
+                    created, updated, unchanged = created + c, updated + u, unchanged + n
+                uploaded += len(objs)
+
+            if mode == "upsert" and uploaded:
+                deactivated = (BusStop.objects.filter(is_active=True)
+                               .exclude(stop_id__in=seen_ids)
+                               .update(is_active=False))
+
+        job = None
+        if mode == "replace" or created or updated or deactivated:
+            invalidate_stop_index()
+            # Every employee may have a new nearest stop; rebuild the table off the request.
+            job = submit_job('recompute_assignments', {}, request.user)
 
         return JsonResponse({
-            "uploaded": len(objs),
-            "message": f"Successfully uploaded {len(objs)} bus stops"
+            "uploaded": uploaded,
+            "mode": mode,
+            "created": created,
+            "updated": updated,
+            "unchanged": unchanged,
+            "deactivated": deactivated,
+            "message": f"Successfully uploaded {uploaded} bus stops",
+            "assignment_job_id": job.id if job else None,
+            **errors.as_dict(),
         })
     except Exception as e:
         return JsonResponse({"detail": str(e)}, status=500)
@@ -563,6 +856,7 @@ def hr_delete_bus_stops(request):
 
     count = BusStop.objects.count()
     BusStop.objects.all().delete()
+    invalidate_stop_index()
     return JsonResponse({"status": "ok", "deleted": count})
 
 
@@ -580,53 +874,64 @@ def hr_upload_coverage_mesh(request):
         return JsonResponse({"detail": "No file"}, status=400)
 
     try:
-        content = file.read().decode("utf-8")
-
-        try:
-            data = json.loads(content)
-            coordinates = []
-
-            if data.get("type") == "FeatureCollection":
-                for feature in data.get("features", []):
-                    geom = feature.get("geometry", {})
-                    if geom.get("type") == "Polygon":
-                        coordinates.extend(geom.get("coordinates", [[]])[0])
-            elif data.get("type") == "Polygon":
-                coordinates = data.get("coordinates", [[]])[0]
-
-            points = [(lon, lat) for lon, lat in coordinates]
-
-        except json.JSONDecodeError:
-            import pandas as pd
-            df = pd.read_csv(StringIO(content))
-            df.columns = [c.strip().lower() for c in df.columns]
+        stream = open_text(file)
+        errors = RowErrors()
+
+        if peek_char(stream) in ('{', '['):
+            polygons = geojson_polygons(json.load(stream))
+            points = (
+                (vertex[0], vertex[1], p, r)
+                for p, rings in enumerate(polygons)
+                for r, ring in enumerate(rings)
+                for vertex in ring
+            )
 
-            if 'latitude' not in df.columns or 'longitude' not in df.columns:
+        else:
+            frames = iter_csv_frames(file, stream=stream)
+            first = next(frames, None)
+            if first is None or 'latitude' not in first.columns or 'longitude' not in first.columns:
                 return JsonResponse({"detail": "CSV must have latitude and longitude columns"}, status=400)
 
-            points = [(row['longitude'], row['latitude']) for _, row in df.iterrows()]
-
-        mesh = CoverageMesh.objects.create(
-            name=mesh_name,
-            version=mesh_version
-        )
+            points = (
+                vertex
+                for df in chain([first], frames)
+                for vertex in mesh_vertices(df, errors)
+            )
 
-        mesh_points = [
-            CoverageMeshPoint(
-                mesh=mesh,
-                longitude=lon,
-                latitude=lat,
-                order=i
+        columns = [array('d') for _ in range(4)]  # polygon, ring, lat, lng
+        with transaction.atomic():
+            mesh = CoverageMesh.objects.create(
+                name=mesh_name,
+                version=mesh_version
             )
-            for i, (lon, lat) in enumerate(points)
-        ]
-        CoverageMeshPoint.objects.bulk_create(mesh_points)
+
+            def rows():
+                for i, (lon, lat, polygon, ring) in enumerate(points):
+                    for column, value in zip(columns, (polygon, ring, lat, lon)):
+                        column.append(value)
+                    yield mesh.id, lat, lon, i, polygon, ring
+
+            if store_geometry_rows():
+                points_count = copy_rows(
+                    CoverageMeshPoint, ('mesh_id', 'latitude', 'longitude', 'order', 'polygon', 'ring'), rows()
+                )
+            else:
+                points_count = sum(1 for _ in rows())
+
+            if points_count:
+                CoverageMesh.objects.filter(pk=mesh.pk).update(
+                    min_latitude=min(columns[2]), min_longitude=min(columns[3]),
+                    max_latitude=max(columns[2]), max_longitude=max(columns[3]),
+                    geometry=pack_mesh(*columns),
+                )
+        bump_version('coverage_meshes')
 
         return JsonResponse({
             "status": "ok",
             "mesh_id": mesh.id,
-            "points_count": len(mesh_points),
-            "message": f"Successfully uploaded coverage mesh with {len(mesh_points)} points"
+            "points_count": points_count,
+            "message": f"Successfully uploaded coverage mesh with {points_count} points",
+            **errors.as_dict(),
         })
 
     except Exception as e:
@@ -644,13 +949,13 @@ def hr_delete_coverage_mesh(request):
         body = {}
 
     mesh_id = body.get("mesh_id") or request.POST.get("mesh_id")
+    try:
+        ids = _int_ids(mesh_id) if mesh_id else None
+    except ValueError:
+        return JsonResponse({"detail": "mesh_id must be an integer"}, status=400)
 
-    if mesh_id:
-        deleted, _ = CoverageMesh.objects.filter(id=mesh_id).delete()
-    else:
-        deleted, _ = CoverageMesh.objects.all().delete()
-
-    return JsonResponse({"status": "ok", "deleted": deleted})
+    deleted, job = _delete_or_queue(request, 'coverage_meshes', ids)
+    return _delete_response(deleted, [job] if job else [], status="ok")
 
 
 @_hr_or_master_required
@@ -660,7 +965,7 @@ def hr_upload_route_gpx(request):
         return JsonResponse({"detail": "Method not allowed"}, status=405)
 
     file = request.FILES.get('route_file')
-    route_name = request.POST.get('name')
+    route_name = request.POST.get('name') or os.path.splitext(getattr(file, 'name', '') or '')[0]
     shift_type = request.POST.get('route_type', 'FIXED_8HRS')
     is_active = request.POST.get('is_active') == 'on'
     plan_name = request.POST.get('plan_name', f"{route_name} Plan")
@@ -670,72 +975,105 @@ def hr_upload_route_gpx(request):
         return JsonResponse({"detail": "Missing file or route name"}, status=400)
 
     try:
-        content = file.read().decode('utf-8')
-        root = ET.fromstring(content)
-        ns = {'gpx': 'http://www.topografix.com/GPX/1/1'}
-
-        trkpts = root.findall('.//gpx:trkpt', ns)
-        if not trkpts:
-            trkpts = root.findall('.//trkpt')
-
-        rte_points = root.findall('.//gpx:rte/gpx:rtept', ns)
-        if not rte_points:
-            rte_points = root.findall('.//gpx:wpt', ns)
-        if not rte_points:
-            rte_points = root.findall('.//rtept')
-        if not rte_points:
-            rte_points = root.findall('.//wpt')
-
-        plan, created = RoutePlan.objects.get_or_create(
-            route_plan_name=plan_name,
-            defaults={
-                'bus_supplier': bus_supplier,
-                'is_active': is_active
-            }
-        )
+        # Routes are written as each </trk> closes; any bad file rolls the whole upload back.
+        with transaction.atomic():
+            plan = get_route_plan(plan_name, bus_supplier, is_active)
+            writer = RouteWriter(plan, shift_type, lambda route, i: _parsed_route_name(route, f"{route_name} {i + 1}"))
+            for source, stream in iter_gpx_sources(file):
+                try:
+                    read_gpx(stream, writer, source)
+                except GPX_ERRORS as e:
+                    transaction.set_rollback(True)
+                    return JsonResponse({"detail": "Some files could not be parsed",
+                                         "errors": [{"source": source, "error": gpx_error(e)}]}, status=400)
+            saved = writer.saved
+            if not saved:
+                transaction.set_rollback(True)
+                return JsonResponse({"detail": "No tracks, routes or waypoints found in upload"}, status=400)
+            if len(saved) == 1:
+                Route.objects.filter(pk=saved[0]["route_id"]).update(route_name=route_name[:150])
+                saved[0]["route_name"] = route_name[:150]
+        bump_version('active_plan', 'route_plans')
+
+        track_points = sum(r["track_points"] for r in saved)
+        stop_points = sum(r["stop_points"] for r in saved)
+        return JsonResponse({
+            "status": "ok",
+            "route_id": saved[0]["route_id"],
+            "plan_id": plan.id,
+            "track_points": track_points,
+            "stop_points": stop_points,
+            "routes": saved,
+            "message": f"Successfully uploaded {len(saved)} route(s) with {track_points} track points and {stop_points} stops"
+        })
+
+    except Exception as e:
+        return JsonResponse({"detail": str(e)}, status=500)
 
-        if not created and is_active:
-            RoutePlan.objects.filter(is_active=True).update(is_active=False)
-            plan.is_active = True
-            plan.save()
 
-        route = Route.objects.create(
-            plan=plan,
-            route_name=route_name,
-            shift=shift_type
-        )
+def _parsed_route_name(parsed, fallback):
+    """A parsed track's own name, else its source file name, else ``fallback``."""
+    name = parsed.name or os.path.splitext(parsed.source)[0]
+    return (name or fallback)[:150]
+
+
+@_hr_or_master_required
+@parser_classes([MultiPartParser, FormParser])
+def hr_upload_route_plan(request):
+    """Import a whole route plan from many GPX/ZIP files.
+
+    Files are parsed in the shared process pool; all routes are then written
+    in one transaction, so a bad file leaves the plan untouched.
+    """
+    if request.method != "POST":
+        return JsonResponse({"detail": "Method not allowed"}, status=405)
+
+    files = request.FILES.getlist('route_files')
+    plan_name = request.POST.get('plan_name')
+    shift_type = request.POST.get('route_type', 'FIXED_8HRS')
+    is_active = request.POST.get('is_active') == 'on'
+    bus_supplier = request.POST.get('bus_supplier', '')
+
+    if not files or not plan_name:
+        return JsonResponse({"detail": "Missing route_files or plan_name"}, status=400)
 
-        track_points = []
-        for i, pt in enumerate(trkpts):
-            track_points.append(RouteTrackPoint(
-                route=route,
-                latitude=float(pt.attrib['lat']),
-                longitude=float(pt.attrib['lon']),
-                order=i
-            ))
-        RouteTrackPoint.objects.bulk_create(track_points)
-
-        stop_points = []
-        for i, pt in enumerate(rte_points):
-            name_elem = pt.find('gpx:name', ns) or pt.find('name')
-            stop_name = name_elem.text if name_elem is not None else f"Stop {i+1}"
-
-            stop_points.append(RouteStopPoint(
-                route=route,
-                stop_name=stop_name,
-                latitude=float(pt.attrib['lat']),
-                longitude=float(pt.attrib['lon']),
-                order=i
-            ))
-        RouteStopPoint.objects.bulk_create(stop_points)
+    try:
+        started = time.perf_counter()
+        payloads = [p for f in files for p in gpx_payloads(f)]
+        if len(payloads) == 1:
+            results = [parse_gpx_payload(*payloads[0])]
+        else:
+            results = pool_map(parse_gpx_payload, *zip(*payloads))
+        parsed_at = time.perf_counter()
+
+        failed = [{"source": source, "error": error} for source, _, error in results if error]
+        if failed:
+            return JsonResponse({"detail": "Some files could not be parsed", "errors": failed}, status=400)
+        parsed = [route for _, routes, _ in results for route in routes]
+        if not parsed:
+            return JsonResponse({"detail": "No tracks, routes or waypoints found in upload"}, status=400)
+
+        with transaction.atomic():
+            plan = get_route_plan(plan_name, bus_supplier, is_active)
+            saved = [
+                save_parsed_route(plan, route, _parsed_route_name(route, f"{plan_name} {i + 1}"), shift_type)
+                for i, route in enumerate(parsed)
+            ]
+        bump_version('active_plan', 'route_plans')
+        finished = time.perf_counter()
 
         return JsonResponse({
             "status": "ok",
-            "route_id": route.id,
             "plan_id": plan.id,
-            "track_points": len(track_points),
-            "stop_points": len(stop_points),
-            "message": f"Successfully uploaded route '{route_name}' with {len(track_points)} track points and {len(stop_points)} stops"
+            "files": len(payloads),
+            "track_points": sum(r["track_points"] for r in saved),
+            "stop_points": sum(r["stop_points"] for r in saved),
+            "routes": saved,
+            "timings_ms": {
+                "parse": round((parsed_at - started) * 1000, 1),
+                "write": round((finished - parsed_at) * 1000, 1),
+                "total": round((finished - started) * 1000, 1),
+            },
         })
 
     except Exception as e:
@@ -755,20 +1093,21 @@ def hr_delete_route(request):
     route_id = body.get("route_id") or request.POST.get("route_id")
     plan_id = body.get("plan_id") or request.POST.get("plan_id")
 
-    deleted_count = 0
-
-    if route_id:
-        deleted, _ = Route.objects.filter(id=route_id).delete()
-        deleted_count += deleted
-
-    if plan_id:
-        deleted, _ = RoutePlan.objects.filter(id=plan_id).delete()
-        deleted_count += deleted
-
     if not route_id and not plan_id:
         return JsonResponse({"detail": "route_id or plan_id required"}, status=400)
+    try:
+        targets = [(target, _int_ids(pk)) for target, pk in (('routes', route_id), ('route_plans', plan_id)) if pk]
+    except ValueError:
+        return JsonResponse({"detail": "route_id and plan_id must be integers"}, status=400)
+
+    deleted_count = 0
+    jobs = []
+    for target, ids in targets:
+        deleted, job = _delete_or_queue(request, target, ids)
+        deleted_count += deleted
+        jobs += [job] if job else []
 
-    return JsonResponse({"status": "ok", "deleted": deleted_count})
+    return _delete_response(deleted_count, jobs, status="ok")
 
 def health(request):
     return HttpResponse("ok", status=200)
\ No newline at end of file
@@ -0,0 +1,74 @@
+"""
+Process pools for CPU-bound work.
+
+Two pools per web process, both created lazily and rebuilt if a worker dies:
+
+* ``default`` (``WORKER_PROCESSES``, at most 4 by default) serves work done
+  inside a request, such as GPX parsing through ``pool_map``.
+* ``jobs`` (``JOB_WORKER_PROCESSES``, 1 by default) runs background jobs
+  (see ``backend_api.jobs``), so long jobs never queue ahead of requests.
+
+Workers are started with ``spawn`` so they never inherit the parent's threads
+or open database connections. Each one runs ``django.setup()`` once and is
+reused across requests.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+DEFAULT_MAX_WORKERS = 4
+
+_lock = threading.Lock()
+_pools = {}
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def worker_count(name='default'):
+    if name == 'jobs':
+        return getattr(settings, 'JOB_WORKER_PROCESSES', None) or 1
+    return getattr(settings, 'WORKER_PROCESSES', None) or min(os.cpu_count() or 1, DEFAULT_MAX_WORKERS)
+
+
+def get_process_pool(name='default'):
+    with _lock:
+        if name not in _pools:
+            _pools[name] = ProcessPoolExecutor(
+                max_workers=worker_count(name),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+            )
+        return _pools[name]
+
+
+def _reset_pool(name='default'):
+    with _lock:
+        pool = _pools.pop(name, None)
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def pool_map(fn, *iterables):
+    """``Executor.map`` on the default pool, retried once on a fresh pool if it broke."""
+    args = [list(it) for it in iterables]
+    try:
+        return list(get_process_pool().map(fn, *args))
+    except BrokenProcessPool:
+        _reset_pool()
+        return list(get_process_pool().map(fn, *args))
+
+
+def pool_submit(fn, *args, pool='default'):
+    """Submit one call to a pool, rebuilding it first if it broke."""
+    try:
+        return get_process_pool(pool).submit(fn, *args)
+    except BrokenProcessPool:
+        _reset_pool(pool)
+        return get_process_pool(pool).submit(fn, *args)